@@ -54,6 +54,11 @@ cdef extern from "_efficient_feature_impl.h":
 @cython.wraparound(False)
 def eff_feature_importance(model, dataset):
 
+    # the kernel needs contiguous float32 arrays (e.g., compressed matrices
+    # are decoded)
+    X = np.ascontiguousarray(dataset.X, dtype=np.float32)
+    y = np.ascontiguousarray(dataset.y, dtype=np.float32)
+
     # initialize features importance
     feature_imp = np.zeros(dataset.n_features, dtype=np.float32)
 
@@ -61,8 +66,8 @@ def eff_feature_importance(model, dataset):
     feature_count = np.zeros(dataset.n_features, dtype=np.uint16)
 
     c_feature_importance(
-        <float*> np.PyArray_DATA(dataset.X),
-        <float*> np.PyArray_DATA(dataset.y),
+        <float*> np.PyArray_DATA(X),
+        <float*> np.PyArray_DATA(y),
         <int*> np.PyArray_DATA(model.trees_root),
         <float*> np.PyArray_DATA(model.trees_weight),
         <short*> np.PyArray_DATA(model.trees_nodes_feature),
@@ -71,8 +76,8 @@ def eff_feature_importance(model, dataset):
         <int*> np.PyArray_DATA(model.trees_right_child),
         <float*> np.PyArray_DATA(feature_imp),
         <short*> np.PyArray_DATA(feature_count),
-        dataset.X.shape[0],
-        dataset.X.shape[1],
+        X.shape[0],
+        X.shape[1],
         model.n_trees);
 
     return np.asarray(feature_imp, dtype=np.float32), \
@@ -83,11 +88,14 @@ def eff_feature_importance(model, dataset):
 def eff_feature_importance_tree(model, dataset, tree_id, y_pred,
                              feature_imp, feature_count):
 
+    X = np.ascontiguousarray(dataset.X, dtype=np.float32)
+    y = np.ascontiguousarray(dataset.y, dtype=np.float32)
+
     y_pred_tree = np.zeros(dataset.n_instances, dtype=np.float32);
 
     c_feature_importance_tree(
-        <float*> np.PyArray_DATA(dataset.X),
-        <float*> np.PyArray_DATA(dataset.y),
+        <float*> np.PyArray_DATA(X),
+        <float*> np.PyArray_DATA(y),
         <int*> np.PyArray_DATA(model.trees_root),
         <float*> np.PyArray_DATA(model.trees_weight),
         <short*> np.PyArray_DATA(model.trees_nodes_feature),
@@ -97,8 +105,8 @@ def eff_feature_importance_tree(model, dataset, tree_id, y_pred,
         tree_id,
         <float*> np.PyArray_DATA(feature_imp),
         <short*> np.PyArray_DATA(feature_count),
-        dataset.X.shape[0],
-        dataset.X.shape[1],
+        X.shape[0],
+        X.shape[1],
         <float*> np.PyArray_DATA(y_pred),
         <float*> np.PyArray_DATA(y_pred_tree));
 
@@ -23,9 +23,9 @@ def efficient_topological_analysis(model, include_leaves=True):
     cdef np.intp_t n_trees = model.n_trees
     cdef np.intp_t n_nodes = model.n_nodes
 
-    cdef int[:] trees_root = model.trees_root
-    cdef int[:] trees_left_child = model.trees_left_child
-    cdef int[:] trees_right_child  = model.trees_right_child
+    cdef const int[:] trees_root = model.trees_root
+    cdef const int[:] trees_left_child = model.trees_left_child
+    cdef const int[:] trees_right_child  = model.trees_right_child
 
     node_indices = np.zeros(model.n_nodes, dtype=np.uint64)
     cdef unsigned long long[:] node_indices_view = node_indices
@@ -74,9 +74,9 @@ def efficient_topological_analysis(model, include_leaves=True):
 @cython.boundscheck(False)
 @cython.wraparound(False)
 cdef int _compute_node_indices(np.intp_t idx_tree,
-                               int[:] trees_root,
-                               int[:] trees_left_child,
-                               int[:] trees_right_child,
+                               const int[:] trees_root,
+                               const int[:] trees_left_child,
+                               const int[:] trees_right_child,
                                unsigned long long[:] node_indices,
                                int idx_last_node,
                                bint include_leaves) nogil:
@@ -102,8 +102,8 @@ cdef int _compute_node_indices(np.intp_t idx_tree,
 @cython.boundscheck(False)
 @cython.wraparound(False)
 cdef inline bint _is_leaf_node(int idx_node,
-                               int[:] trees_left_child,
-                               int[:] trees_right_child) nogil:
+                               const int[:] trees_left_child,
+                               const int[:] trees_right_child) nogil:
     return trees_left_child[idx_node] == -1 and trees_right_child[idx_node] == -1
 
 @cython.boundscheck(False)
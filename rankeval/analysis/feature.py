@@ -14,6 +14,7 @@ import numpy as np
 from collections import deque
 import xarray as xr
 
+from ..dataset import Dataset
 from ..model import RTEnsemble
 from ..metrics import MSE, RMSE
 
@@ -53,10 +54,17 @@ def feature_importance(model, dataset, metric=None):
                 the given model. The count values reported highlights the number
                 of times each feature is used in a split node, i.e., to improve
                 the MSE.
+        The feature coordinates are the ids of the features of the dataset
+        (see Dataset.features): a dataset storing only a subset of the
+        features (e.g., the ones used by the model) reports only them.
     """
     if metric is None:
         metric = MSE()
 
+    # the kernels index the feature matrix by the split features: refer the
+    # model to the columns of the matrix (as for scoring)
+    model, dataset, columns, features = _remap_features(model, dataset)
+
     if isinstance(metric, RMSE) or isinstance(metric, MSE):
         feature_imp, feature_count = eff_feature_importance(model, dataset)
         if isinstance(metric, RMSE):
@@ -76,15 +84,37 @@ def feature_importance(model, dataset, metric=None):
             _feature_importance_tree(model, dataset, tree_id, y_pred, metric,
                                      feature_imp, feature_count)
 
-    performance = xr.DataArray([feature_imp, feature_count],
+    performance = xr.DataArray([feature_imp[columns], feature_count[columns]],
                                name='Feature Importance Analysis',
                                coords=[['importance', 'count'],
-                                       np.arange(dataset.n_features, dtype=np.uint16)],
+                                       features.astype(np.uint16)],
                                dims=['type', 'feature'])
 
     return performance
 
 
+def _remap_features(model, dataset):
+    """
+    Returns the model and the dataset to give to the feature importance
+    kernels, where the split nodes of the model refer to the columns of the
+    feature matrix of the dataset (see RTEnsemble._remap_features), along with
+    the column of the matrix storing each feature of the given dataset and the
+    ids of these features.
+    """
+    features = dataset.features
+    if features is None:
+        features = np.arange(dataset.n_features)
+    _, columns = dataset.scoring_matrix()
+    if columns is None:
+        columns = np.arange(dataset.n_features)
+
+    scoring_model, X = model._remap_features(dataset)
+    if scoring_model is not model or X is not dataset.X:
+        dataset = Dataset(np.asarray(X), dataset.y, dataset.query_ids,
+                          name=dataset.name, qids=dataset.qids)
+    return scoring_model, dataset, columns, features
+
+
 def _feature_importance_tree(model, dataset, tree_id, y_pred, metric,
                              feature_imp, feature_count):
     """
@@ -155,6 +155,106 @@ def _randomization(metric_scores_a, metric_scores_b, n_perm=100000):
     return p1, p2
 
 
+def sampling_deviation(dataset, sample, models, metrics, stratify_by=None):
+    """
+    This method reports how far the metric scores computed on a sample of the
+    queries of a dataset (see Dataset.sample_queries) deviate from the ones
+    computed on the whole dataset. Besides the actual deviation, it reports
+    the standard error of the (stratified) sample mean, estimated from the
+    sample only, i.e., the deviation expected without scoring the whole
+    dataset.
+
+    Parameters
+    ----------
+    dataset : rankeval.dataset.Dataset
+        The whole dataset
+    sample : rankeval.dataset.Dataset
+        The sample of the queries of the dataset
+    models : list of RTEnsemble
+        The models to evaluate
+    metrics : list of Metric
+        The metrics to use for the analysis
+    stratify_by : None, str or numpy 1d array
+        The criterion the sample has been stratified by (see
+        Dataset.query_strata), used for estimating the standard error
+
+    Returns
+    -------
+    deviation : xarray.DataArray
+        A DataArray containing, for each model and metric, the score on the
+        whole dataset ("full"), the score on the sample ("sample"), their
+        difference ("deviation") and the estimated standard error of the
+        sample score ("std_error").
+    """
+    strata = np.zeros(dataset.n_queries, dtype=np.intp)
+    if stratify_by is not None:
+        strata = dataset.query_strata(stratify_by)
+    positions = dataset.query_positions(sample.qids)
+    if (positions < 0).any():
+        raise ValueError("The sample has queries not in the dataset")
+
+    data = np.zeros(shape=(len(models), len(metrics), 4), dtype=np.float32)
+    for idx_model, model in enumerate(models):
+        y_pred = model.score(dataset, detailed=False)
+        y_pred_sample = model.score(sample, detailed=False)
+        for idx_metric, metric in enumerate(metrics):
+            full_score = metric.eval(dataset, y_pred)[0]
+            sample_score, sample_scores = metric.eval(sample, y_pred_sample)
+            data[idx_model][idx_metric] = [
+                full_score, sample_score, sample_score - full_score,
+                _stratified_std_error(sample_scores, strata[positions],
+                                      np.bincount(strata))]
+
+    deviation = xr.DataArray(data,
+                             name='Sampling Deviation',
+                             coords=[models, metrics,
+                                     ['full', 'sample', 'deviation',
+                                      'std_error']],
+                             dims=['model', 'metric', 'stat'])
+
+    return deviation
+
+
+def _stratified_std_error(scores, strata, population_sizes):
+    """
+    This method estimates the standard error of the stratified mean of the
+    given per-query scores, sampled without replacement, with the finite
+    population correction.
+
+    Parameters
+    ----------
+    scores : numpy array
+        Vector of per-query metric scores of the sampled queries.
+    strata : numpy array
+        Vector with the stratum of each sampled query.
+    population_sizes : numpy array
+        Vector with the number of queries of each stratum in the population.
+
+    Returns
+    -------
+    std_error : float
+        The estimated standard error.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    n_strata = population_sizes.size
+    sizes = np.bincount(strata, minlength=n_strata).astype(np.float64)
+    sums = np.bincount(strata, weights=scores, minlength=n_strata)
+    squares = np.bincount(strata, weights=scores ** 2, minlength=n_strata)
+
+    # strata with less than two sampled queries do not contribute
+    sampled = sizes > 1
+    if not sampled.any():
+        return 0.
+    means = sums[sampled] / sizes[sampled]
+    variances = (squares[sampled] - sizes[sampled] * means ** 2) / \
+        (sizes[sampled] - 1)
+    weights = population_sizes[sampled] / \
+        float(population_sizes[sampled].sum())
+    corrections = 1 - sizes[sampled] / population_sizes[sampled]
+    return np.sqrt(np.sum(weights ** 2 * corrections *
+                          np.maximum(variances, 0) / sizes[sampled]))
+
+
 def _kfold_scoring(dataset, k, algo):
     """
     Scored the given datset with the given algo unsing k-fold train/test.
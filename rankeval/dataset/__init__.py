@@ -10,8 +10,13 @@ The :mod:`rankeval.dataset` module includes utilities to load datasets
 and dump datasets according to several supported formats.
 """
 
-from .dataset import Dataset
+from .chunked_matrix import ChunkedMatrix
+from .compressed_matrix import CompressedMatrix
+from .dataset import Dataset, DatasetView
 from .dataset_container import DatasetContainer
 
-__all__ = ['Dataset',
+__all__ = ['ChunkedMatrix',
+           'CompressedMatrix',
+           'Dataset',
+           'DatasetView',
            'DatasetContainer']
\ No newline at end of file
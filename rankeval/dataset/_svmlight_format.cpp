@@ -9,13 +9,12 @@
  * function to load the file format originally created for svmlight and now used
  * by many other libraries, including libsvm.
  *
- * The function loads the file directly in a dense matrix without memory
- * copying.  The approach taken is to use 2 C++ vectors (data, and labels)
- * and to incrementally feed them with elements. If the dataset is sparse,
- * the function will fix the previously loaded instances in order to reflect
- * the new observed column (given 0-value to missing features). Ndarrays are
- * then instantiated by PyArray_SimpleNewFromData, i.e., no memory is
- * copied.
+ * The file is memory mapped and split in chunks at line boundaries, which are
+ * processed in parallel (OpenMP). A first pass counts the instances and the
+ * features, so that the dense C++ vector (data) is allocated only once, with
+ * its final size. A second pass parses the chunks, by means of hand-written
+ * number scanners, directly into their rows of the data vector. Ndarrays are
+ * then instantiated by PyArray_SimpleNewFromData, i.e., no memory is copied.
  *
  * Since the memory is not allocated by the ndarray, the ndarray doesn't own the
  * memory and thus cannot deallocate it. To automatically deallocate memory, the
@@ -28,12 +27,35 @@
 #include <Python.h>
 #include <numpy/arrayobject.h>
 
+#include <algorithm>
+#include <cstdlib>
+#include <cstring>
 #include <fstream>
-#include <sstream>
+#include <iterator>
+#include <limits>
 #include <stdexcept>
 #include <string>
 #include <vector>
 
+#include <omp.h>
+
+#if defined(__has_include)
+#if __has_include(<charconv>) && __cplusplus >= 201703L
+#include <charconv>
+#if defined(__cpp_lib_to_chars) || (defined(__GNUC__) && __GNUC__ >= 11)
+#define RANKEVAL_HAVE_TO_CHARS
+#endif
+#endif
+#endif
+
+#if defined(__unix__) || defined(__APPLE__)
+#define RANKEVAL_HAVE_MMAP
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#endif
+
 /*
  * A Python object responsible for memory management of our vectors.
  */
@@ -62,8 +84,8 @@ static void destroy_vector_owner(PyObject *self)
 
 /*
  * Since a template function can't have C linkage,
- * we instantiate the template for the types "int" and "float"
- * in the following two functions. These are used for the tp_dealloc
+ * we instantiate the template for the types "int", "long" and "float"
+ * in the following functions. These are used for the tp_dealloc
  * attribute of the vector owner types further below.
  */
 extern "C" {
@@ -72,6 +94,11 @@ static void destroy_int_vector(PyObject *self)
   destroy_vector_owner<int>(self);
 }
 
+static void destroy_long_vector(PyObject *self)
+{
+  destroy_vector_owner<long>(self);
+}
+
 static void destroy_float_vector(PyObject *self)
 {
   destroy_vector_owner<float>(self);
@@ -83,6 +110,7 @@ static void destroy_float_vector(PyObject *self)
  * Type objects for above.
  */
 static PyTypeObject IntVOwnerType    = { PyObject_HEAD_INIT(NULL) },
+                    LongVOwnerType   = { PyObject_HEAD_INIT(NULL) },
                     FloatVOwnerType = { PyObject_HEAD_INIT(NULL) };
 
 /*
@@ -90,14 +118,20 @@ static PyTypeObject IntVOwnerType    = { PyObject_HEAD_INIT(NULL) },
  */
 static void init_type_objs()
 {
-  IntVOwnerType.tp_flags = FloatVOwnerType.tp_flags = Py_TPFLAGS_DEFAULT;
-  IntVOwnerType.tp_name  = FloatVOwnerType.tp_name  = "deallocator";
-  IntVOwnerType.tp_doc   = FloatVOwnerType.tp_doc   = "deallocator object";
-  IntVOwnerType.tp_new   = FloatVOwnerType.tp_new   = PyType_GenericNew;
+  IntVOwnerType.tp_flags = LongVOwnerType.tp_flags =
+      FloatVOwnerType.tp_flags = Py_TPFLAGS_DEFAULT;
+  IntVOwnerType.tp_name  = LongVOwnerType.tp_name  =
+      FloatVOwnerType.tp_name  = "deallocator";
+  IntVOwnerType.tp_doc   = LongVOwnerType.tp_doc   =
+      FloatVOwnerType.tp_doc   = "deallocator object";
+  IntVOwnerType.tp_new   = LongVOwnerType.tp_new   =
+      FloatVOwnerType.tp_new   = PyType_GenericNew;
 
   IntVOwnerType.tp_basicsize     = sizeof(VectorOwner<int>);
+  LongVOwnerType.tp_basicsize    = sizeof(VectorOwner<long>);
   FloatVOwnerType.tp_basicsize  = sizeof(VectorOwner<float>);
   IntVOwnerType.tp_dealloc       = destroy_int_vector;
+  LongVOwnerType.tp_dealloc      = destroy_long_vector;
   FloatVOwnerType.tp_dealloc    = destroy_float_vector;
 }
 
@@ -105,6 +139,7 @@ PyTypeObject &vector_owner_type(int typenum)
 {
   switch (typenum) {
     case NPY_INT: return IntVOwnerType;
+    case NPY_LONG: return LongVOwnerType;
     case NPY_FLOAT: return FloatVOwnerType;
   }
   throw std::logic_error("invalid argument to vector_owner_type");
@@ -165,22 +200,25 @@ static PyObject *to_1d_array(std::vector<T> &v, int typenum)
 
 static PyObject *to_dense(std::vector<float> &data,
                         std::vector<float> &labels,
-                        std::vector<int> &qids)
+                        std::vector<int> &qids,
+                        std::vector<long> &query_values)
 {
   // We could do with a smart pointer to Python objects here.
   std::exception const *exc = 0;
   PyObject *data_arr = 0,
            *qids_arr = 0,
            *labels_arr = 0,
+           *values_arr = 0,
            *ret_tuple = 0;
 
   try {
     data_arr     = to_1d_array(data, NPY_FLOAT);
     qids_arr     = to_1d_array(qids, NPY_INT);
     labels_arr   = to_1d_array(labels, NPY_FLOAT);
+    values_arr   = to_1d_array(query_values, NPY_LONG);
 
-    ret_tuple = Py_BuildValue("OOO",
-                              data_arr, labels_arr, qids_arr);
+    ret_tuple = Py_BuildValue("OOOO",
+                              data_arr, labels_arr, qids_arr, values_arr);
 
   } catch (std::exception const &e) {
     exc = &e;
@@ -192,6 +230,7 @@ static PyObject *to_dense(std::vector<float> &data,
   Py_XDECREF(data_arr);
   Py_XDECREF(qids_arr);
   Py_XDECREF(labels_arr);
+  Py_XDECREF(values_arr);
 
   if (exc)
     throw *exc;
@@ -200,160 +239,659 @@ static PyObject *to_dense(std::vector<float> &data,
 }
 
 /*
- * Reshape the data array to adjust number of columns (caused by loading of a sparse matrix)
+ * Memory mapping of the whole file (read-only). Falls back to reading the file
+ * in memory when mmap is not available.
  */
-void reshape_data(std::vector<float> &data,
-                  int &old_num_feature,
-                  int new_num_feature)
+class MappedFile {
+public:
+  MappedFile(char const *file_path, size_t buffer_size)
+   : data_(0), size_(0)
+  {
+#ifdef RANKEVAL_HAVE_MMAP
+    int fd = open(file_path, O_RDONLY);
+    if (fd < 0)
+      throw std::ios_base::failure("File doesn't exist!");
+
+    struct stat st;
+    if (fstat(fd, &st) < 0) {
+      close(fd);
+      throw std::ios_base::failure("Unable to stat the file!");
+    }
+    size_ = st.st_size;
+
+    if (size_ > 0) {
+      void *addr = mmap(0, size_, PROT_READ, MAP_PRIVATE, fd, 0);
+      if (addr == MAP_FAILED) {
+        close(fd);
+        throw std::ios_base::failure("Unable to map the file in memory!");
+      }
+      madvise(addr, size_, MADV_WILLNEED);
+      data_ = static_cast<char const *>(addr);
+    }
+    close(fd);
+#else
+    std::vector<char> buffer(buffer_size);
+    std::ifstream file_stream;
+    file_stream.rdbuf()->pubsetbuf(&buffer[0], buffer_size);
+    file_stream.open(file_path, std::ios::in | std::ios::binary);
+    if (!file_stream)
+      throw std::ios_base::failure("File doesn't exist!");
+
+    content_.assign(std::istreambuf_iterator<char>(file_stream),
+                    std::istreambuf_iterator<char>());
+    size_ = content_.size();
+    if (size_ > 0)
+      data_ = &content_[0];
+#endif
+  }
+
+  ~MappedFile()
+  {
+#ifdef RANKEVAL_HAVE_MMAP
+    if (data_)
+      munmap(const_cast<char *>(data_), size_);
+#endif
+  }
+
+  char const *data() const { return data_; }
+  size_t size() const { return size_; }
+
+private:
+  char const *data_;
+  size_t size_;
+#ifndef RANKEVAL_HAVE_MMAP
+  std::vector<char> content_;
+#endif
+};
+
+
+/*
+ * Hand-written scanners. Numbers are parsed directly from the mapped file,
+ * without building any intermediate string.
+ */
+static inline bool is_space(char c)
 {
-  int rows_to_fix = (data.size() - new_num_feature) / old_num_feature;
-  int cells_to_add = rows_to_fix * (new_num_feature - old_num_feature);
-  int cells_to_add_per_row = cells_to_add / rows_to_fix;
+  return c == ' ' || c == '\t' || c == '\r';
+}
 
-  for (int i=0; i<cells_to_add; ++i)
-    data.push_back(0);
+static inline char const *skip_spaces(char const *p, char const *end)
+{
+  while (p < end && is_space(*p))
+    ++p;
+  return p;
+}
+
+static const double pow10_table[] = {
+  1e0,  1e1,  1e2,  1e3,  1e4,  1e5,  1e6,  1e7,  1e8,  1e9,  1e10, 1e11,
+  1e12, 1e13, 1e14, 1e15, 1e16, 1e17, 1e18, 1e19, 1e20, 1e21, 1e22
+};
 
-  std::vector<float>::iterator it = data.end() - new_num_feature - cells_to_add;
-  int move_counter = cells_to_add;
-  for (int i=0; i<=rows_to_fix; ++i) {
-    int window = (i == 0) ? new_num_feature : old_num_feature;
-    if (move_counter > 0)
-      std::copy(it, it + window, it + move_counter);
+/*
+ * Parse a floating point number starting at p. Numbers having at most 15
+ * significant digits and a small exponent are converted exactly (i.e., the
+ * result is the correctly rounded double); all the others (including inf and
+ * nan) are delegated to strtod. Returns the pointer to the first character
+ * following the number, or 0 if no number has been found.
+ */
+static char const *parse_double(char const *p, char const *end, double &value)
+{
+  char const *begin = p;
+  bool negative = false;
+  if (p < end && (*p == '-' || *p == '+')) {
+    negative = *p == '-';
+    ++p;
+  }
 
-    if (i > 0) {
-      for (int j=0; j<cells_to_add_per_row; ++j)
-        *(it + move_counter + old_num_feature + j) = 0;
+  unsigned long long mantissa = 0;
+  int n_digits = 0, exponent = 0;
+  bool any_digit = false, exact = true;
+
+  for (; p < end && *p >= '0' && *p <= '9'; ++p) {
+    any_digit = true;
+    if (mantissa == 0 && *p == '0')
+      continue;
+    if (n_digits < 15) {
+      mantissa = mantissa * 10 + (*p - '0');
+      ++n_digits;
+    } else {
+      exact = false;
     }
+  }
+  if (p < end && *p == '.') {
+    for (++p; p < end && *p >= '0' && *p <= '9'; ++p) {
+      any_digit = true;
+      if (mantissa == 0 && *p == '0') {
+        --exponent;
+        continue;
+      }
+      if (n_digits < 15) {
+        mantissa = mantissa * 10 + (*p - '0');
+        ++n_digits;
+        --exponent;
+      } else {
+        exact = false;
+      }
+    }
+  }
+  if (any_digit && p < end && (*p == 'e' || *p == 'E')) {
+    char const *q = p + 1;
+    bool exp_negative = false;
+    if (q < end && (*q == '-' || *q == '+')) {
+      exp_negative = *q == '-';
+      ++q;
+    }
+    if (q < end && *q >= '0' && *q <= '9') {
+      int exp_value = 0;
+      for (; q < end && *q >= '0' && *q <= '9'; ++q)
+        if (exp_value < 10000)
+          exp_value = exp_value * 10 + (*q - '0');
+      exponent += exp_negative ? -exp_value : exp_value;
+      p = q;
+    }
+  }
 
-    move_counter -= cells_to_add_per_row;
-    it -= old_num_feature;
+  if (any_digit && exact && exponent >= -22 && exponent <= 22) {
+    value = (double) mantissa;
+    if (exponent < 0)
+      value /= pow10_table[-exponent];
+    else
+      value *= pow10_table[exponent];
+    if (negative)
+      value = -value;
+    return p;
   }
+
+  // slow path: strtod needs a NUL-terminated string
+  char buffer[128];
+  size_t len = 0;
+  for (p = begin; p < end && len < sizeof(buffer) - 1 && !is_space(*p)
+                  && *p != ':' && *p != '\n' && *p != '#'; ++p)
+    buffer[len++] = *p;
+  buffer[len] = '\0';
+  char *num_end;
+  value = strtod(buffer, &num_end);
+  if (num_end == buffer)
+    return 0;
+  return begin + (num_end - buffer);
+}
+
+/*
+ * Parse a non negative integer starting at p. Returns the pointer to the first
+ * character following the number, or 0 if no number has been found.
+ */
+static char const *parse_int(char const *p, char const *end, long &value)
+{
+  char const *begin = p;
+  value = 0;
+  for (; p < end && *p >= '0' && *p <= '9'; ++p)
+    value = value * 10 + (*p - '0');
+  return p == begin ? 0 : p;
 }
 
 
 /*
- * Parse single line. Throws exception on failure.
+ * Skip the token starting at p, i.e., move p to the first space following it.
  */
-int parse_line(const std::string &line,
-                std::vector<float> &data,
-                std::vector<float> &labels,
-                std::vector<int> &qids,
-                int &last_qid,
-                int &max_feature)
+static inline char const *skip_token(char const *p, char const *end)
 {
-  if (line.length() == 0)
-  	throw std::invalid_argument( "empty line" );
+  while (p < end && !is_space(*p))
+    ++p;
+  return p;
+}
 
-  if (line[0] == '#')
-    return last_qid;
+/*
+ * Returns the beginning of the first line of the range [begin, end) storing an
+ * instance, i.e., skipping comment lines. Returns end if there is none.
+ * Throws exception on empty lines.
+ */
+static char const *next_instance(char const *begin, char const *end,
+                                 char const *&eol)
+{
+  while (begin < end) {
+    eol = static_cast<char const *>(memchr(begin, '\n', end - begin));
+    if (!eol)
+      eol = end;
+    char const *p = skip_spaces(begin, eol);
+    if (p == eol)
+      throw std::invalid_argument("empty line");
+    if (*p != '#')
+      return p;
+    begin = eol + 1;
+  }
+  return end;
+}
 
-  // FIXME: we shouldn't be parsing line-by-line.
-  // Also, we might catch more syntax errors with failbit.
-  size_t hashIdx = line.find('#');
-  std::istringstream in(line.substr(0, hashIdx));
-  in.exceptions(std::ios::badbit);
+/*
+ * Each feature is stored in the column following the one of the previous
+ * feature, or in the column given by its (1-based) index, if it is greater.
+ */
+static inline int next_column(long idx, int last_column)
+{
+  return std::max(int(idx) - 1, last_column + 1);
+}
+
+/*
+ * The outcome of the first pass over a portion (chunk) of the file.
+ */
+struct Chunk {
+  size_t n_rows;
+  size_t n_qids;
+  int n_features;
+  std::string error;
+
+  Chunk() : n_rows(0), n_qids(0), n_features(0) {}
+};
+
+/*
+ * Returns the end of the instance starting at begin, i.e., the beginning of the
+ * inline comment or the end of the line.
+ */
+static inline char const *instance_end(char const *begin, char const *eol)
+{
+  char const *comment = static_cast<char const *>(
+      memchr(begin, '#', eol - begin));
+  return comment ? comment : eol;
+}
 
-    //printf("%s\n",line.substr(0,hashIdx).c_str());
-  float y;
-  if (!(in >> y)) {
-  	throw std::invalid_argument( "non-numeric or missing label" );
+/*
+ * Returns the number of features of the instance in the range [begin, end),
+ * without parsing the feature values.
+ */
+static int instance_n_features(char const *begin, char const *end)
+{
+  int last_column = -1;
+  char const *p = skip_spaces(skip_token(begin, end), end);
+  while (p < end) {
+    long idx;
+    if (parse_int(p, end, idx))
+      last_column = next_column(idx, last_column);
+    p = skip_spaces(skip_token(p, end), end);
   }
-  labels.push_back(y);
+  return last_column + 1;
+}
 
-  std::string qidNonsense;
-  if (!(in >> qidNonsense)) {
-  	throw std::invalid_argument( "Missing qid label" );
+/*
+ * First pass over the lines in the range [begin, end), which has to be aligned
+ * to line boundaries: count the instances and (if requested) find the number
+ * of features, without parsing the feature values.
+ */
+void scan_chunk(char const *begin, char const *end, bool count_features,
+                Chunk &chunk)
+{
+  char const *eol;
+  while ((begin = next_instance(begin, end, eol)) < end) {
+    ++chunk.n_rows;
+
+    if (count_features)
+      chunk.n_features = std::max(
+          chunk.n_features, instance_n_features(begin, instance_end(begin, eol)));
+    begin = eol + 1;
   }
+}
+
+/*
+ * Convert the value to float, mapping infinite values to max_float
+ * (SVM reader problem). This is needed because some dataset have infinite
+ * values and because the split condition is <=, while sole software uses <.
+ * In order to reconduct the former condition to the latter, we slightly
+ * decrease the split. However, slightly decreasing inf does not have any
+ * effect.
+ */
+static inline float to_float(double x)
+{
+  float value = (float) x;
+  if (value == std::numeric_limits<float>::infinity())
+    return std::numeric_limits<float>::max();
+  return value;
+}
+
+/*
+ * Parse single line, writing the instance directly in its (zeroed) row of the
+ * dense data matrix. If the columns map is not empty, only the features it
+ * maps (to the column of the data matrix) are parsed, all the others are
+ * skipped. Returns true if the line has a qid. Throws exception on failure.
+ */
+bool parse_line(char const *p, char const *end, int n_features,
+                std::vector<int> const &columns_map,
+                float *data_row, float &label, long &qid)
+{
+  // strip the (inline) comment
+  char const *comment = static_cast<char const *>(memchr(p, '#', end - p));
+  if (comment)
+    end = comment;
 
-  char c;
   double x;
-  int idx;
-  int idx_row=0;
-  int next_feature = 1;
-
-  if (sscanf(qidNonsense.c_str(), "qid:%u", &idx) != 1) {
-    if(sscanf(qidNonsense.c_str(), "%u%c%lf", &idx, &c, &x) == 3) {
-        // Add zeros in empty spaces between next_feature and idx indices  (iff idx > next_feature)
-        for (; next_feature < idx; ++next_feature)
-          data.push_back(0);
-        data.push_back(x);
-        ++next_feature;
-    } else {
-    	throw std::invalid_argument( std::string("expected ':', got '") + c + "'");
+  p = parse_double(p, end, x);
+  if (!p || (p < end && !is_space(*p)))
+    throw std::invalid_argument("non-numeric or missing label");
+  label = x;
+  p = skip_spaces(p, end);
+
+  bool has_qid = false;
+  if (end - p > 4 && strncmp(p, "qid:", 4) == 0) {
+    p = parse_int(p + 4, end, qid);
+    if (!p || (p < end && !is_space(*p)))
+      throw std::invalid_argument("invalid qid");
+    has_qid = true;
+    p = skip_spaces(p, end);
+  }
+
+  int last_column = -1;
+  while (p < end) {
+    long idx;
+    p = parse_int(p, end, idx);
+    if (!p)
+      throw std::invalid_argument("invalid feature index");
+    if (p == end || *p != ':')
+      throw std::invalid_argument(std::string("expected ':', got '") +
+                                  (p == end ? ' ' : *p) + "'");
+    last_column = next_column(idx, last_column);
+
+    int column = last_column;
+    if (!columns_map.empty()) {
+      column = last_column < (int) columns_map.size() ?
+               columns_map[last_column] : -1;
+      if (column < 0) {
+        p = skip_spaces(skip_token(p + 1, end), end);
+        continue;
+      }
     }
 
-  } else {
+    p = parse_double(p + 1, end, x);
+    if (!p || (p < end && !is_space(*p)))
+      throw std::invalid_argument("non-numeric feature value");
 
-    if (last_qid == 0){
-        last_qid = idx;
-        qids.push_back(idx_row);
-    }
+    if (column >= n_features)
+      throw std::invalid_argument("feature index greater than n_features");
+    data_row[column] = to_float(x);
+    p = skip_spaces(p, end);
+  }
 
-    if (int(idx) != last_qid){
-        idx_row = labels.size()-1;
-        qids.push_back(idx_row);
-        last_qid = int(idx);
-    }
+  return has_qid;
+}
+
+/*
+ * Second pass over the lines in the range [begin, end): parse the instances
+ * storing them starting from the given row of the dense data matrix.
+ */
+void parse_chunk(char const *begin, char const *end, int n_features,
+                 std::vector<int> const &columns_map, float *data, float *labels, long *row_qids, Chunk &chunk)
+{
+  char const *eol;
+  size_t row = 0;
+  while ((begin = next_instance(begin, end, eol)) < end) {
+    if (parse_line(begin, eol, n_features, columns_map,
+                   data + row * n_features,
+                   labels[row], row_qids[row]))
+      ++chunk.n_qids;
+    ++row;
+    begin = eol + 1;
   }
+}
 
-  while (in >> idx >> c >> x) {
-    if (c != ':')
-    	throw std::invalid_argument( std::string("expected ':', got '") + c + "'");
-    // Add zeros in empty spaces between next_feature and idx indices (iff idx > next_feature)
-    for (; next_feature < idx; ++next_feature)
-      data.push_back(0);
-    data.push_back(x);
-    ++next_feature;
+/*
+ * Split the buffer in chunks at line boundaries, a few chunks per thread for
+ * balancing the load, at least 64KB each. Returns the bounds of the chunks.
+ */
+static std::vector<size_t> split_chunks(char const *content, size_t size,
+                                        int n_threads)
+{
+  size_t n_chunks = std::min<size_t>(n_threads * 4, size / (1 << 16) + 1);
+  std::vector<size_t> bounds(n_chunks + 1, size);
+  bounds[0] = 0;
+  for (size_t i = 1; i < n_chunks; ++i) {
+    size_t pos = std::max(bounds[i - 1], i * (size / n_chunks));
+    char const *eol = pos < size ? static_cast<char const *>(
+        memchr(content + pos, '\n', size - pos)) : 0;
+    bounds[i] = eol ? eol - content + 1 : size;
   }
+  return bounds;
+}
 
-  // Add zeros at the end of the row (iff next_feature < max_feature)
-  for (; next_feature <= max_feature; ++next_feature)
-    data.push_back(0);
+/*
+ * Parse an entire buffer (file content). Throws exception on failure.
+ *
+ * The buffer is split in chunks at line boundaries. A first
+ * (fast) pass over the chunks counts the instances and finds the number of
+ * features (unless given by the caller), without parsing any value. The dense
+ * data matrix is then allocated once, with its final size, and filled by a
+ * second pass, parsing each chunk directly into its rows. Both the passes
+ * process the chunks in parallel. Query ids are converted in the offsets of
+ * the queries (and the qid of each query), taking care of the queries spanning
+ * over several chunks.
+ */
+void parse_buffer(char const *content,
+                  size_t size,
+                  int n_threads,
+                  int n_features,
+                  std::vector<int> const &columns_map,
+                  std::vector<float> &data,
+                  std::vector<float> &labels,
+                  std::vector<int> &qids,
+                  std::vector<long> &query_values)
+{
+  if (n_threads <= 0)
+    n_threads = omp_get_max_threads();
+
+  std::vector<size_t> bounds = split_chunks(content, size, n_threads);
+  size_t n_chunks = bounds.size() - 1;
+
+  std::vector<Chunk> chunks(n_chunks);
+  bool count_features = n_features <= 0;
+  #pragma omp parallel for schedule(dynamic, 1) num_threads(n_threads)
+  for (long i = 0; i < (long) n_chunks; ++i) {
+    try {
+      scan_chunk(content + bounds[i], content + bounds[i + 1],
+                 count_features, chunks[i]);
+    } catch (std::exception const &e) {
+      chunks[i].error = e.what();
+    }
+  }
 
-  // if the maximum feature read is greater than the maximum feature read since here,
-  // it means we have to reshape the dataset to include new columns...
-  if (max_feature > 0 && (next_feature - 1) > max_feature) {
-    reshape_data(data, max_feature, next_feature - 1);
+  size_t n_rows = 0;
+  std::vector<size_t> rows_offset(n_chunks + 1, 0);
+  for (size_t i = 0; i < n_chunks; ++i) {
+    if (!chunks[i].error.empty())
+      throw std::invalid_argument(chunks[i].error);
+    if (count_features)
+      n_features = std::max(n_features, chunks[i].n_features);
+    n_rows += chunks[i].n_rows;
+    rows_offset[i + 1] = n_rows;
+  }
+  n_features = std::max(n_features, 0);
+
+  data.assign(n_rows * n_features, 0);
+  labels.resize(n_rows);
+  std::vector<long> row_qids(n_rows);
+
+  #pragma omp parallel for schedule(dynamic, 1) num_threads(n_threads)
+  for (long i = 0; i < (long) n_chunks; ++i) {
+    size_t offset = rows_offset[i];
+    try {
+      parse_chunk(content + bounds[i], content + bounds[i + 1], n_features,
+                  columns_map,
+                  n_rows ? &data[0] + offset * n_features : 0,
+                  n_rows ? &labels[0] + offset : 0,
+                  n_rows ? &row_qids[0] + offset : 0,
+                  chunks[i]);
+    } catch (std::exception const &e) {
+      chunks[i].error = e.what();
+    }
   }
 
-  max_feature = std::max(next_feature - 1, max_feature);
+  size_t n_qids = 0;
+  for (size_t i = 0; i < n_chunks; ++i) {
+    if (!chunks[i].error.empty())
+      throw std::invalid_argument(chunks[i].error);
+    n_qids += chunks[i].n_qids;
+  }
+  if (n_qids != 0 && n_qids != n_rows)
+    throw std::invalid_argument("Missing qid label");
 
-  return last_qid;
+  /*
+  * a new query starts whenever the qid changes. If the dataset has qids,
+  * add the SENTINEL
+  */
+  if (n_qids != 0) {
+    for (size_t row = 0; row < n_rows; ++row)
+      if (row == 0 || row_qids[row] != row_qids[row - 1]) {
+        qids.push_back(row);
+        query_values.push_back(row_qids[row]);
+      }
+    qids.push_back(n_rows);
+  }
 }
 
 /*
- * Parse entire file. Throws exception on failure.
+ * Parse entire file, memory mapping it. Throws exception on failure.
  */
 void parse_file(char const *file_path,
                 size_t buffer_size,
+                int n_threads,
+                int n_features,
+                std::vector<int> const &columns_map,
                 std::vector<float> &data,
                 std::vector<float> &labels,
-                std::vector<int> &qids)
+                std::vector<int> &qids,
+                std::vector<long> &query_values)
 {
-  std::vector<char> buffer(buffer_size);
+  MappedFile file(file_path, buffer_size);
+  parse_buffer(file.data(), file.size(), n_threads, n_features, columns_map,
+               data, labels, qids, query_values);
+}
 
-  std::ifstream file_stream;
-  file_stream.exceptions(std::ios::badbit);
-  file_stream.rdbuf()->pubsetbuf(&buffer[0], buffer_size);
-  file_stream.open(file_path);
+/*
+ * Indexing. A run is a maximal sequence of consecutive instances having the
+ * same qid: its byte range can be read and parsed on its own.
+ */
+struct QueryRuns {
+  std::vector<long> qids, offsets, lengths, n_rows;
+  int n_features;
+  std::string error;
 
-  if (!file_stream)
-    throw std::ios_base::failure("File doesn't exist!");
+  QueryRuns() : n_features(0) {}
+};
 
-  int last_qid = 0;
-  int max_feature = 0;
-  int new_qid;
-  std::string line;
-  while (std::getline(file_stream, line)) {
-    new_qid = parse_line(line, data, labels, qids, last_qid, max_feature);
-    last_qid = new_qid;
+/*
+ * Find the runs of the lines in the range [begin, end), which has to be
+ * aligned to line boundaries. Offsets are relative to content.
+ */
+void index_chunk(char const *content, char const *begin, char const *end,
+                 QueryRuns &runs)
+{
+  char const *eol;
+  while ((begin = next_instance(begin, end, eol)) < end) {
+    char const *line_end = instance_end(begin, eol);
+    char const *p = skip_spaces(skip_token(begin, line_end), line_end);
+    long qid;
+    if (line_end - p <= 4 || strncmp(p, "qid:", 4) != 0
+        || !parse_int(p + 4, line_end, qid))
+      throw std::invalid_argument("Missing qid label");
+    runs.n_features = std::max(runs.n_features,
+                               instance_n_features(begin, line_end));
+
+    if (runs.qids.empty() || runs.qids.back() != qid) {
+      runs.qids.push_back(qid);
+      runs.offsets.push_back(begin - content);
+      runs.lengths.push_back(0);
+      runs.n_rows.push_back(0);
+    }
+    ++runs.n_rows.back();
+    runs.lengths.back() = (eol < end ? eol + 1 : eol) - content
+                          - runs.offsets.back();
+    begin = eol + 1;
   }
-  /*
-  * test is the dataset has not qids. if yes -> add SENTINEL
-  */
-  if (qids.size() != 0) {
-    qids.push_back(labels.size());
+}
+
+/*
+ * Index the runs of an entire file, memory mapping it and processing its chunks
+ * in parallel. Throws exception on failure.
+ */
+void index_file(char const *file_path, int n_threads, QueryRuns &runs)
+{
+  if (n_threads <= 0)
+    n_threads = omp_get_max_threads();
+
+  MappedFile file(file_path, 1 << 20);
+  std::vector<size_t> bounds = split_chunks(file.data(), file.size(),
+                                            n_threads);
+  size_t n_chunks = bounds.size() - 1;
+
+  std::vector<QueryRuns> chunks(n_chunks);
+  #pragma omp parallel for schedule(dynamic, 1) num_threads(n_threads)
+  for (long i = 0; i < (long) n_chunks; ++i) {
+    try {
+      index_chunk(file.data(), file.data() + bounds[i],
+                  file.data() + bounds[i + 1], chunks[i]);
+    } catch (std::exception const &e) {
+      chunks[i].error = e.what();
+    }
+  }
+
+  // merge the runs spanning over consecutive chunks
+  for (size_t i = 0; i < n_chunks; ++i) {
+    QueryRuns &chunk = chunks[i];
+    if (!chunk.error.empty())
+      throw std::invalid_argument(chunk.error);
+    runs.n_features = std::max(runs.n_features, chunk.n_features);
+    size_t first = 0;
+    if (!chunk.qids.empty() && !runs.qids.empty()
+        && runs.qids.back() == chunk.qids[0]) {
+      runs.lengths.back() = chunk.offsets[0] + chunk.lengths[0]
+                            - runs.offsets.back();
+      runs.n_rows.back() += chunk.n_rows[0];
+      first = 1;
+    }
+    runs.qids.insert(runs.qids.end(), chunk.qids.begin() + first,
+                     chunk.qids.end());
+    runs.offsets.insert(runs.offsets.end(), chunk.offsets.begin() + first,
+                        chunk.offsets.end());
+    runs.lengths.insert(runs.lengths.end(), chunk.lengths.begin() + first,
+                        chunk.lengths.end());
+    runs.n_rows.insert(runs.n_rows.end(), chunk.n_rows.begin() + first,
+                       chunk.n_rows.end());
+  }
+}
+
+/*
+ * Read the map from the features of the file to the columns of the data
+ * matrix: columns_map[j] is the column where to store the j-th feature of the
+ * file, or -1 if the feature has to be skipped. Returns false on failure.
+ */
+static bool read_columns_map(PyObject *columns_obj,
+                             std::vector<int> &columns_map)
+{
+  if (columns_obj == Py_None)
+    return true;
+  PyArrayObject *columns_arr = (PyArrayObject *)
+      PyArray_ContiguousFromAny(columns_obj, NPY_INT, 1, 1);
+  if (!columns_arr)
+    return false;
+  int *columns = (int *) PyArray_DATA(columns_arr);
+  columns_map.assign(columns, columns + PyArray_DIM(columns_arr, 0));
+  Py_DECREF(columns_arr);
+  return true;
+}
+
+/*
+ * Convert the exception being handled in the corresponding python exception.
+ */
+static PyObject *set_reader_error()
+{
+  try {
+    throw;
+  } catch (SyntaxError const &e) {
+    PyErr_SetString(PyExc_ValueError, e.what());
+  } catch (std::bad_alloc const &e) {
+    PyErr_SetString(PyExc_MemoryError, e.what());
+  } catch (std::ios_base::failure const &e) {
+    PyErr_SetString(PyExc_IOError, e.what());
+  } catch (std::exception const &e) {
+    std::string msg("error in SVMlight/libSVM reader: ");
+    msg += e.what();
+    PyErr_SetString(PyExc_RuntimeError, msg.c_str());
   }
+  return 0;
 }
 
 
@@ -368,8 +906,16 @@ static PyObject *load_svmlight_file(PyObject *self, PyObject *args)
     // Read function arguments.
     char const *file_path;
     int buffer_mb;
+    int n_threads = 0;
+    int n_features = 0;
+    PyObject *columns_obj = Py_None;
 
-    if (!PyArg_ParseTuple(args, "si", &file_path, &buffer_mb))
+    if (!PyArg_ParseTuple(args, "si|iiO", &file_path, &buffer_mb, &n_threads,
+                          &n_features, &columns_obj))
+      return 0;
+
+    std::vector<int> columns_map;
+    if (!read_columns_map(columns_obj, columns_map))
       return 0;
 
     buffer_mb = std::max(buffer_mb, 1);
@@ -377,91 +923,287 @@ static PyObject *load_svmlight_file(PyObject *self, PyObject *args)
 
     std::vector<float> data, labels;
     std::vector<int> qids;
-    parse_file(file_path, buffer_size, data, labels, qids);
-    return to_dense(data, labels, qids);
+    std::vector<long> query_values;
+
+    // the parsing does not touch any python object: release the GIL
+    PyThreadState *thread_state = PyEval_SaveThread();
+    try {
+      parse_file(file_path, buffer_size, n_threads, n_features, columns_map,
+                 data, labels, qids, query_values);
+    } catch (...) {
+      PyEval_RestoreThread(thread_state);
+      throw;
+    }
+    PyEval_RestoreThread(thread_state);
 
-  } catch (SyntaxError const &e) {
-    PyErr_SetString(PyExc_ValueError, e.what());
-    return 0;
-  } catch (std::bad_alloc const &e) {
-    PyErr_SetString(PyExc_MemoryError, e.what());
-    return 0;
-  } catch (std::ios_base::failure const &e) {
-    PyErr_SetString(PyExc_IOError, e.what());
-    return 0;
-  } catch (std::exception const &e) {
-    std::string msg("error in SVMlight/libSVM reader: ");
-    msg += e.what();
-    PyErr_SetString(PyExc_RuntimeError, msg.c_str());
+    return to_dense(data, labels, qids, query_values);
+
+  } catch (...) {
+    return set_reader_error();
+  }
+}
+}
+
+
+static const char load_svmlight_buffer_doc[] =
+  "Load a buffer in svmlight format (a block of lines) and return a dense "
+  "matrix.";
+
+extern "C" {
+static PyObject *load_svmlight_buffer(PyObject *self, PyObject *args)
+{
+  Py_buffer buffer;
+  int n_threads = 0;
+  int n_features = 0;
+  PyObject *columns_obj = Py_None;
+
+  if (!PyArg_ParseTuple(args, "s*|iiO", &buffer, &n_threads, &n_features,
+                        &columns_obj))
     return 0;
+
+  PyObject *ret = 0;
+  try {
+    std::vector<int> columns_map;
+    if (read_columns_map(columns_obj, columns_map)) {
+      std::vector<float> data, labels;
+      std::vector<int> qids;
+      std::vector<long> query_values;
+
+      // the parsing does not touch any python object: release the GIL
+      PyThreadState *thread_state = PyEval_SaveThread();
+      try {
+        parse_buffer((char const *) buffer.buf, buffer.len, n_threads,
+                     n_features, columns_map, data, labels, qids,
+                     query_values);
+      } catch (...) {
+        PyEval_RestoreThread(thread_state);
+        throw;
+      }
+      PyEval_RestoreThread(thread_state);
+
+      ret = to_dense(data, labels, qids, query_values);
+    }
+  } catch (...) {
+    set_reader_error();
   }
+
+  PyBuffer_Release(&buffer);
+  return ret;
 }
 }
 
 
-static const char dump_svmlight_file_doc[] =
-  "Dump dense matrix to a file in svmlight format.";
+static const char index_svmlight_file_doc[] =
+  "Index the runs of instances with the same qid of a file in svmlight format: "
+  "return their qid, byte offset, byte length and number of rows, together "
+  "with the number of features of the file.";
 
 extern "C" {
-static PyObject *dump_svmlight_file(PyObject *self, PyObject *args)
+static PyObject *index_svmlight_file(PyObject *self, PyObject *args)
 {
+  PyObject *qids_arr = 0, *offsets_arr = 0, *lengths_arr = 0, *rows_arr = 0,
+           *ret = 0;
   try {
-    // Read function arguments.
     char const *file_path;
-    PyArrayObject *data_array, *label_array;
-    PyObject *query_ids_array;
-    int zero_based;
-
-    if (!PyArg_ParseTuple(args,
-                          "sO!O!O!i",
-                          &file_path,
-                          &PyArray_Type, &data_array,
-                          &PyArray_Type, &label_array,
-                          &PyList_Type,  &query_ids_array,
-                          &zero_based))
+    int n_threads = 0;
+    if (!PyArg_ParseTuple(args, "s|i", &file_path, &n_threads))
       return 0;
 
-    int n_samples = PyArray_DIM(data_array, 0);
-    int n_features = PyArray_DIM(data_array, 1);
-
-//    int n_samples  = label_array->dimensions[0];
-    float *data   = (float*) data_array->data;
-    float *y      = (float*) label_array->data;
-//    int n_features = data_array->dimensions[0] / n_samples;
+    QueryRuns runs;
+    // the indexing does not touch any python object: release the GIL
+    PyThreadState *thread_state = PyEval_SaveThread();
+    try {
+      index_file(file_path, n_threads, runs);
+    } catch (...) {
+      PyEval_RestoreThread(thread_state);
+      throw;
+    }
+    PyEval_RestoreThread(thread_state);
+
+    qids_arr = to_1d_array(runs.qids, NPY_LONG);
+    offsets_arr = to_1d_array(runs.offsets, NPY_LONG);
+    lengths_arr = to_1d_array(runs.lengths, NPY_LONG);
+    rows_arr = to_1d_array(runs.n_rows, NPY_LONG);
+    ret = Py_BuildValue("OOOOi", qids_arr, offsets_arr, lengths_arr, rows_arr,
+                        runs.n_features);
+  } catch (...) {
+    set_reader_error();
+  }
+  Py_XDECREF(qids_arr);
+  Py_XDECREF(offsets_arr);
+  Py_XDECREF(lengths_arr);
+  Py_XDECREF(rows_arr);
+  return ret;
+}
+}
 
-    std::ofstream fout;
-    fout.open(file_path, std::ofstream::out);
 
-    float* data_pointer = data;
-    for (int i=0; i < n_samples; i++) {
-      if (PyList_Size(query_ids_array) != 0) {
-        PyObject* pIntObj = PyList_GetItem(query_ids_array, i);
-        long qid = PyLong_AsLong(pIntObj);
-        fout << y[i] << " qid:" << qid << " ";
-      }
-      else {
-        fout << y[i] << " ";
-      }
+/*
+ * Formatting. Floats are written with the shortest representation that reads
+ * back to the same float (std::to_chars when available, otherwise the first
+ * %g precision that round-trips).
+ */
+static inline char *format_float(char *out, float value)
+{
+#ifdef RANKEVAL_HAVE_TO_CHARS
+  return std::to_chars(out, out + 32, value).ptr;
+#else
+  for (int precision = 6; precision < 9; ++precision) {
+    int len = snprintf(out, 32, "%.*g", precision, value);
+    if (strtof(out, 0) == value)
+      return out + len;
+  }
+  return out + snprintf(out, 32, "%.9g", value);
+#endif
+}
 
-      for (int jj=0; jj < n_features; ++jj) {
-        fout << (zero_based ? jj : jj+1) << ":" << data_pointer[jj] << " ";
-      }
+static inline char *format_int(char *out, long value)
+{
+  char digits[24];
+  int len = 0;
+  bool negative = value < 0;
+  unsigned long v = negative ? -(unsigned long) value : value;
+  do {
+    digits[len++] = '0' + v % 10;
+    v /= 10;
+  } while (v);
+  if (negative)
+    *out++ = '-';
+  while (len)
+    *out++ = digits[--len];
+  return out;
+}
 
-      data_pointer += n_features;
-      fout << std::endl;
+/*
+ * Format the rows [start, end) of the dense matrix in svmlight format,
+ * appending them to out.
+ */
+static void format_rows(float const *X, float const *y, long const *qids,
+                        int n_features, int zero_based, long start, long end,
+                        std::string &out)
+{
+  char buffer[64];
+  for (long i = start; i < end; ++i) {
+    char *p = format_float(buffer, y[i]);
+    if (qids) {
+      memcpy(p, " qid:", 5);
+      p = format_int(p + 5, qids[i]);
     }
+    out.append(buffer, p - buffer);
+
+    float const *row = X + i * n_features;
+    for (int j = 0; j < n_features; ++j) {
+      p = buffer;
+      *p++ = ' ';
+      p = format_int(p, zero_based ? j : j + 1);
+      *p++ = ':';
+      p = format_float(p, row[j]);
+      out.append(buffer, p - buffer);
+    }
+    out.push_back('\n');
+  }
+}
 
-    fout.close();
+static const char format_svmlight_doc[] =
+  "Format a dense matrix in svmlight format, in parallel, returning the bytes "
+  "to write on file.";
 
-    Py_INCREF(Py_None);
-    return Py_None;
+extern "C" {
+static PyObject *format_svmlight(PyObject *self, PyObject *args)
+{
+  PyArrayObject *data_array, *label_array;
+  PyObject *qids_obj;
+  int zero_based;
+  int n_threads = 0;
+
+  if (!PyArg_ParseTuple(args, "O!O!Oi|i",
+                        &PyArray_Type, &data_array,
+                        &PyArray_Type, &label_array,
+                        &qids_obj,
+                        &zero_based,
+                        &n_threads))
+    return 0;
 
-  } catch (std::exception const &e) {
-    std::string msg("error in SVMlight/libSVM writer: ");
-    msg += e.what();
-    PyErr_SetString(PyExc_RuntimeError, msg.c_str());
+  if (PyArray_TYPE(data_array) != NPY_FLOAT || PyArray_NDIM(data_array) != 2
+      || !PyArray_ISCARRAY_RO(data_array)
+      || PyArray_TYPE(label_array) != NPY_FLOAT
+      || !PyArray_ISCARRAY_RO(label_array)) {
+    PyErr_SetString(PyExc_TypeError,
+                    "X and y should be C-contiguous float32 arrays");
+    return 0;
+  }
+
+  long n_samples = PyArray_DIM(data_array, 0);
+  int n_features = PyArray_DIM(data_array, 1);
+  if (PyArray_DIM(label_array, 0) != n_samples) {
+    PyErr_SetString(PyExc_ValueError, "X and y have different lengths");
     return 0;
   }
+
+  PyArrayObject *qids_array = 0;
+  if (qids_obj != Py_None) {
+    qids_array = (PyArrayObject *)
+        PyArray_ContiguousFromAny(qids_obj, NPY_LONG, 1, 1);
+    if (!qids_array)
+      return 0;
+    if (PyArray_DIM(qids_array, 0) != n_samples) {
+      Py_DECREF(qids_array);
+      PyErr_SetString(PyExc_ValueError,
+                      "X and query_id have different lengths");
+      return 0;
+    }
+  }
+
+  float const *X = (float const *) PyArray_DATA(data_array);
+  float const *y = (float const *) PyArray_DATA(label_array);
+  long const *qids = qids_array ? (long const *) PyArray_DATA(qids_array) : 0;
+
+  if (n_threads <= 0)
+    n_threads = omp_get_max_threads();
+  long n_parts = std::max(1L, std::min<long>(n_threads * 4, n_samples));
+
+  PyObject *ret = 0;
+  try {
+    std::vector<std::string> parts(n_parts);
+    bool out_of_memory = false;
+
+    // the formatting does not touch any python object: release the GIL
+    Py_BEGIN_ALLOW_THREADS
+    #pragma omp parallel for schedule(dynamic, 1) num_threads(n_threads)
+    for (long k = 0; k < n_parts; ++k) {
+      long start = n_samples * k / n_parts;
+      long end = n_samples * (k + 1) / n_parts;
+      try {
+        parts[k].reserve((end - start) * (n_features * 12 + 24));
+        format_rows(X, y, qids, n_features, zero_based, start, end, parts[k]);
+      } catch (std::bad_alloc const &e) {
+        out_of_memory = true;
+      }
+    }
+    Py_END_ALLOW_THREADS
+
+    if (out_of_memory)
+      throw std::bad_alloc();
+
+    size_t size = 0;
+    for (long k = 0; k < n_parts; ++k)
+      size += parts[k].size();
+
+    ret = PyBytes_FromStringAndSize(0, size);
+    if (ret) {
+      char *out = PyBytes_AS_STRING(ret);
+      for (long k = 0; k < n_parts; ++k) {
+        memcpy(out, parts[k].data(), parts[k].size());
+        out += parts[k].size();
+        std::string().swap(parts[k]);
+      }
+    }
+  } catch (std::bad_alloc const &e) {
+    PyErr_SetString(PyExc_MemoryError, e.what());
+  }
+
+  Py_XDECREF(qids_array);
+  return ret;
 }
 }
 
@@ -473,8 +1215,14 @@ static PyMethodDef svmlight_format_methods[] = {
   {"_load_svmlight_file", load_svmlight_file,
     METH_VARARGS, load_svmlight_file_doc},
 
-  {"_dump_svmlight_file", dump_svmlight_file,
-    METH_VARARGS, dump_svmlight_file_doc},
+  {"_load_svmlight_buffer", load_svmlight_buffer,
+    METH_VARARGS, load_svmlight_buffer_doc},
+
+  {"_format_svmlight", format_svmlight,
+    METH_VARARGS, format_svmlight_doc},
+
+  {"_index_svmlight_file", index_svmlight_file,
+    METH_VARARGS, index_svmlight_file_doc},
 
   {NULL, NULL, 0, NULL}
 };
@@ -489,7 +1237,8 @@ PyMODINIT_FUNC PyInit__svmlight_loader(void)
 
   init_type_objs();
   if (PyType_Ready(&FloatVOwnerType) < 0
-   || PyType_Ready(&IntVOwnerType)    < 0)
+   || PyType_Ready(&IntVOwnerType)    < 0
+   || PyType_Ready(&LongVOwnerType)   < 0)
 #if PY_MAJOR_VERSION >= 3
     return NULL;
 #else
@@ -517,7 +1266,8 @@ PyMODINIT_FUNC init_svmlight_format(void)
 
   init_type_objs();
   if (PyType_Ready(&FloatVOwnerType) < 0
-   || PyType_Ready(&IntVOwnerType)    < 0)
+   || PyType_Ready(&IntVOwnerType)    < 0
+   || PyType_Ready(&LongVOwnerType)   < 0)
     return;
 
   Py_InitModule3("_svmlight_format",
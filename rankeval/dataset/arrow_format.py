@@ -0,0 +1,235 @@
+# Copyright (c) 2017, All Contributors (see CONTRIBUTORS file)
+# Authors: Salvatore Trani <salvatore.trani@isti.cnr.it>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+This module implements the reading and writing of datasets stored as Apache
+Parquet files or Arrow IPC files, with a column for the query ids (qid), a
+column for the labels (label) and a column for each feature (f1..fN, i.e., the
+feature ids of the svmlight format).
+
+The files are read by row groups (Parquet) or record batches (Arrow, memory
+mapped), and only the requested columns are read. The values of each column
+are accessed without copy from the Arrow buffers and written directly in the
+preallocated C-contiguous float32 feature matrix, thus no intermediate table
+of the whole file is built.
+
+The formats require the optional pyarrow package.
+"""
+
+import numpy as np
+
+QID_COLUMN = "qid"
+LABEL_COLUMN = "label"
+FEATURE_PREFIX = "f"
+
+FORMATS = ["parquet", "arrow"]
+
+# default number of rows of the row groups (record batches) written
+ROW_GROUP_ROWS = 1 << 16
+
+
+def load_arrow_file(f, format="parquet", features=None):
+    """
+    Load a dataset stored in a Parquet or Arrow IPC file.
+
+    Parameters
+    ----------
+    f : str
+        Path to the file to load
+    format : str
+        The format of the file ("parquet" or "arrow")
+    features : None or list of int
+        The (0-based) ids of the features to load. If given, the i-th column
+        of X stores the feature features[i] (column "f<features[i]+1>") and
+        the other feature columns are not read.
+
+    Returns
+    -------
+    (X, y, row_qids, features)
+
+    where X is a dense C-contiguous numpy matrix of float32 of shape
+          (n_samples, n_features),
+          y is a ndarray of shape (n_samples,),
+          row_qids is a ndarray of shape (n_samples,) with the qid of each row,
+          features is a ndarray of shape (n_features,) with the feature id of
+          each column of X.
+    """
+    pa = _import_pyarrow()
+    if format == "parquet":
+        import pyarrow.parquet as pq
+        source = pq.ParquetFile(f)
+        names = source.schema.names
+        n_rows = source.metadata.num_rows
+    elif format == "arrow":
+        source = _open_ipc_file(pa, f)
+        names = source.schema.names
+        n_rows = sum(source.get_batch(i).num_rows
+                     for i in range(source.num_record_batches))
+    else:
+        raise TypeError("Dataset format %s is not yet supported!" % format)
+
+    for name in [QID_COLUMN, LABEL_COLUMN]:
+        if name not in names:
+            raise ValueError("Column %s not found in %s" % (name, f))
+    columns = _feature_columns(names)
+    if features is None:
+        features = np.array(sorted(columns), dtype=np.int32)
+    else:
+        features = np.asarray(features, dtype=np.int32)
+        missing = [feature for feature in features if feature not in columns]
+        if missing:
+            raise ValueError("Features not found in %s: %s" % (
+                f, ", ".join(str(feature) for feature in missing)))
+    read_columns = [QID_COLUMN, LABEL_COLUMN] + \
+        [columns[feature] for feature in features]
+
+    X = np.empty((n_rows, features.size), dtype=np.float32)
+    y = np.empty(n_rows, dtype=np.float32)
+    row_qids = np.empty(n_rows, dtype=np.int64)
+    start = 0
+    for batch_rows, batch_columns in _read_batches(source, format,
+                                                   read_columns):
+        end = start + batch_rows
+        row_qids[start:end] = _column_values(batch_columns[0])
+        y[start:end] = _column_values(batch_columns[1])
+        for j, column in enumerate(batch_columns[2:]):
+            X[start:end, j] = _column_values(column)
+        start = end
+    return X, y, row_qids, features
+
+
+def dump_arrow_file(X, y, row_qids, f, format="parquet", features=None,
+                    row_group_rows=ROW_GROUP_ROWS):
+    """
+    Save a dataset in a Parquet or Arrow IPC file, by row groups (record
+    batches) of row_group_rows rows.
+
+    Parameters
+    ----------
+    X : numpy 2d array of float
+        The feature matrix (n_samples, n_features)
+    y : numpy 1d array of float
+        The labels (n_samples,)
+    row_qids : numpy 1d array of int
+        The qid of each row (n_samples,)
+    f : str
+        Path to the file to write
+    format : str
+        The format of the file ("parquet" or "arrow")
+    features : None or list of int
+        The (0-based) feature id of each column of X (None for
+        0..n_features-1)
+    row_group_rows : int
+        The number of rows of each row group (record batch)
+    """
+    pa = _import_pyarrow()
+    if format not in FORMATS:
+        raise TypeError("Dataset format %s is not yet supported!" % format)
+    if features is None:
+        features = np.arange(X.shape[1])
+    names = [QID_COLUMN, LABEL_COLUMN] + \
+        ["%s%d" % (FEATURE_PREFIX, feature + 1) for feature in features]
+    schema = pa.schema([pa.field(QID_COLUMN, pa.int64()),
+                        pa.field(LABEL_COLUMN, pa.float32())] +
+                       [pa.field(name, pa.float32()) for name in names[2:]])
+
+    if format == "parquet":
+        import pyarrow.parquet as pq
+        sink = None
+        writer = pq.ParquetWriter(f, schema)
+    else:
+        sink = pa.OSFile(f, 'wb')
+        writer = pa.RecordBatchFileWriter(sink, schema)
+    try:
+        for start in range(0, len(y), max(row_group_rows, 1)):
+            end = min(start + row_group_rows, len(y))
+            block = np.asarray(X[start:end], dtype=np.float32)
+            arrays = [pa.array(np.asarray(row_qids[start:end],
+                                          dtype=np.int64)),
+                      pa.array(np.asarray(y[start:end], dtype=np.float32))] + \
+                [pa.array(np.ascontiguousarray(block[:, j]))
+                 for j in range(block.shape[1])]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+    finally:
+        writer.close()
+        if sink is not None:
+            sink.close()
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("pyarrow is required for reading and writing "
+                          "Parquet and Arrow files")
+    return pyarrow
+
+
+def _open_ipc_file(pa, f):
+    # the record batches are read without copy from the memory mapped file
+    source = pa.memory_map(f, 'r')
+    if hasattr(pa, "ipc") and hasattr(pa.ipc, "open_file"):
+        return pa.ipc.open_file(source)
+    return pa.RecordBatchFileReader(source)
+
+
+def _feature_columns(names):
+    """
+    Returns the map from the (0-based) feature ids to the names of the feature
+    columns (f1..fN) of the file.
+    """
+    columns = {}
+    for name in names:
+        if name.startswith(FEATURE_PREFIX) and \
+                name[len(FEATURE_PREFIX):].isdigit():
+            columns[int(name[len(FEATURE_PREFIX):]) - 1] = name
+    return columns
+
+
+def _read_batches(source, format, columns):
+    """
+    Generator of the row groups (Parquet) or record batches (Arrow) of the
+    file, as the number of rows and the list of the given columns, in the
+    given order.
+    """
+    if format == "parquet":
+        for i in range(source.num_row_groups):
+            table = source.read_row_group(i, columns=columns)
+            yield table.num_rows, [
+                table.column(table.schema.get_field_index(name))
+                for name in columns]
+    else:
+        positions = [source.schema.get_field_index(name) for name in columns]
+        for i in range(source.num_record_batches):
+            batch = source.get_batch(i)
+            yield batch.num_rows, [batch.column(position)
+                                   for position in positions]
+
+
+def _column_values(column):
+    """
+    Returns the values of a column as a numpy array, without copy if the
+    column is a single chunk without nulls. Null values are returned as zeros
+    (as missing svmlight features).
+    """
+    # columns of tables are chunked arrays (wrapped by a Column object in old
+    # versions of pyarrow), while columns of record batches are arrays
+    column = getattr(column, "data", column)
+    chunks = getattr(column, "chunks", [column])
+    values = [_array_values(chunk) for chunk in chunks]
+    if len(values) == 1:
+        return values[0]
+    if not values:
+        return np.empty(0, dtype=np.float32)
+    return np.concatenate(values)
+
+
+def _array_values(array):
+    if array.null_count:
+        values = np.asarray(array.to_pandas(), dtype=np.float64)
+        return np.where(np.isnan(values), 0, values)
+    return array.to_numpy()
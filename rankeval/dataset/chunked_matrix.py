@@ -0,0 +1,197 @@
+# Copyright (c) 2017, All Contributors (see CONTRIBUTORS file)
+# Authors: Salvatore Trani <salvatore.trani@isti.cnr.it>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+This module implements a feature matrix made of a list of blocks of rows,
+allowing to concatenate datasets (e.g., daily slices of a collection) without
+copying their feature matrices.
+
+The blocks are kept as they are (numpy arrays, memory mapped arrays or
+compressed matrices) and the matrix is scored block by block. The matrix is
+copied in a single contiguous array only when explicitly requested (see
+ChunkedMatrix.compact) or converted to a numpy array.
+"""
+
+import numpy as np
+
+from .compressed_matrix import CompressedMatrix
+
+
+class ChunkedMatrix(object):
+    """
+    Float32 matrix made of the concatenation (by rows) of a list of blocks,
+    which are not copied. It exposes the shape and dtype of the concatenated
+    matrix and supports numpy indexing (the selected rows are gathered in a
+    float32 ndarray) and the conversion to a numpy array (np.asarray copies
+    the whole matrix).
+
+    Attributes
+    ----------
+    shape : tuple of int
+        The shape of the (concatenated) matrix
+    dtype : numpy.dtype
+        The dtype of the matrix (float32)
+    blocks : list of numpy 2d array or CompressedMatrix
+        The blocks of rows of the matrix
+    offsets : numpy 1d array of int
+        The first row of each block, followed by the number of rows
+        (n_blocks+1)
+    """
+
+    __array_priority__ = 10.0
+
+    def __init__(self, blocks):
+        """
+        Create the matrix concatenating the given blocks of rows.
+
+        Parameters
+        ----------
+        blocks : list of numpy 2d array or CompressedMatrix
+            The blocks of rows, all with the same number of columns. Blocks
+            that are ChunkedMatrix are replaced by their blocks.
+        """
+        flat_blocks = []
+        for block in blocks:
+            if isinstance(block, ChunkedMatrix):
+                flat_blocks.extend(block.blocks)
+            elif isinstance(block, CompressedMatrix):
+                flat_blocks.append(block)
+            else:
+                flat_blocks.append(np.asarray(block, dtype=np.float32))
+        if not flat_blocks:
+            raise ValueError("At least a block is required")
+        n_columns = set(block.shape[1] for block in flat_blocks)
+        if len(n_columns) > 1:
+            raise ValueError("The blocks have a different number of columns")
+
+        self.blocks = flat_blocks
+        self.offsets = np.append(0, np.cumsum(
+            [block.shape[0] for block in flat_blocks])).astype(np.int64)
+        self.shape = (int(self.offsets[-1]), n_columns.pop())
+        self.dtype = np.dtype(np.float32)
+
+    @property
+    def nbytes(self):
+        return sum(block.nbytes for block in self.blocks)
+
+    def rows(self, start, end):
+        """
+        Returns the matrix of the given (contiguous) range of rows, sharing
+        the memory with this matrix.
+
+        Parameters
+        ----------
+        start : int
+            The first row of the range
+        end : int
+            The row following the last one of the range
+
+        Returns
+        -------
+        matrix : numpy 2d array, CompressedMatrix or ChunkedMatrix
+            The selected rows: the slice of a block if the rows are all in a
+            block, the matrix of the slices of the blocks otherwise
+        """
+        start, end, _ = slice(start, end).indices(self.shape[0])
+        end = max(start, end)
+        first = min(np.searchsorted(self.offsets, start, side='right') - 1,
+                    len(self.blocks) - 1)
+        last = max(np.searchsorted(self.offsets, end, side='left'), first + 1)
+        slices = [_rows(self.blocks[i],
+                        max(start - self.offsets[i], 0),
+                        min(end, self.offsets[i + 1]) - self.offsets[i])
+                  for i in range(first, min(last, len(self.blocks)))]
+        if len(slices) == 1:
+            return slices[0]
+        return ChunkedMatrix(slices)
+
+    def iter_blocks(self, block_rows=4096):
+        """
+        Iterate over the rows of the matrix, block by block (as C-contiguous
+        float32 arrays). The blocks of the matrix are returned without copy,
+        while compressed blocks are decoded by blocks of block_rows rows.
+
+        Parameters
+        ----------
+        block_rows : int
+            The number of rows of the decoded blocks of compressed blocks
+
+        Returns
+        -------
+        (start, end, X)
+
+        where start and end are the range of rows of the block and X is the
+        numpy 2d array of float32 storing the rows.
+        """
+        for offset, block in zip(self.offsets, self.blocks):
+            if isinstance(block, CompressedMatrix):
+                for start, end, X in block.iter_blocks(block_rows):
+                    yield offset + start, offset + end, X
+            elif block.shape[0]:
+                yield offset, offset + block.shape[0], \
+                    np.ascontiguousarray(block, dtype=np.float32)
+
+    def compact(self):
+        """
+        Copy the matrix in a single contiguous numpy array.
+
+        Returns
+        -------
+        X : numpy 2d array of float32
+            The concatenated matrix
+        """
+        X = np.empty(self.shape, dtype=np.float32)
+        for offset, block in zip(self.offsets, self.blocks):
+            X[offset:offset + block.shape[0]] = np.asarray(block)
+        return X
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) > 2:
+            raise IndexError("too many indices for a 2d matrix")
+        rows = key[0]
+        columns = key[1] if len(key) == 2 else slice(None)
+
+        if isinstance(rows, (int, np.integer)):
+            row = np.arange(self.shape[0])[rows]
+            block = np.searchsorted(self.offsets, row, side='right') - 1
+            return np.asarray(
+                self.blocks[block][row - self.offsets[block]])[columns]
+        if isinstance(rows, slice) and rows.step in (None, 1):
+            X = np.asarray(self.rows(rows.start, rows.stop))
+        else:
+            X = self._take_rows(np.arange(self.shape[0])[rows])
+        return X[:, columns]
+
+    def __array__(self, dtype=None):
+        X = self.compact()
+        return X if dtype is None else X.astype(dtype, copy=False)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __eq__(self, other):
+        return np.asarray(self) == np.asarray(other)
+
+    def __ne__(self, other):
+        return np.asarray(self) != np.asarray(other)
+
+    def _take_rows(self, rows):
+        X = np.empty((rows.size, self.shape[1]), dtype=np.float32)
+        blocks = np.searchsorted(self.offsets, rows, side='right') - 1
+        for block in np.unique(blocks):
+            selected = blocks == block
+            X[selected] = np.asarray(
+                self.blocks[block][rows[selected] - self.offsets[block]])
+        return X
+
+
+def _rows(block, start, end):
+    if isinstance(block, CompressedMatrix):
+        return block.rows(start, end)
+    return block[start:end]
@@ -0,0 +1,285 @@
+# Copyright (c) 2017, All Contributors (see CONTRIBUTORS file)
+# Authors: Salvatore Trani <salvatore.trani@isti.cnr.it>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+This module implements a compressed (lossless) in-memory storage for the
+feature matrix of a dataset.
+
+Each column is analyzed and stored with the lossless representation requiring
+the least memory: columns with at most 256 (65536) distinct values can be
+stored as uint8 (uint16) codes referring to a per-column codebook of the
+distinct values, columns whose values are exactly representable in half
+precision can be stored as float16, and the remaining ones are stored as
+float32. Columns stored with the same representation are
+grouped in a contiguous 2d array, so that blocks of rows are decoded
+efficiently (e.g., by the scorer, which decodes the rows on the fly, block by
+block, instead of materializing the whole float32 matrix).
+"""
+
+import numpy as np
+
+# the representations that can be used for each column
+ENCODINGS = ["uint8", "float16", "uint16", "float32"]
+
+_CODES_DTYPE = {"uint8": np.uint8, "uint16": np.uint16}
+
+
+class CompressedMatrix(object):
+    """
+    Dense float32 matrix stored column by column with the lossless
+    representation requiring the least memory (see the module documentation). It exposes the shape and
+    dtype of the original matrix and supports numpy indexing (the selected
+    elements are decoded in a float32 ndarray) and the conversion to a numpy
+    array (np.asarray decodes the whole matrix).
+
+    Attributes
+    ----------
+    shape : tuple of int
+        The shape of the (decoded) matrix
+    dtype : numpy.dtype
+        The dtype of the decoded matrix (float32)
+    encodings : numpy 1d array of str
+        The representation used for each column (one of ENCODINGS)
+    nbytes : int
+        The memory used for storing the matrix (codebooks included)
+    """
+
+    __array_priority__ = 10.0
+
+    def __init__(self, X, encodings=ENCODINGS):
+        """
+        Compress the given matrix.
+
+        Parameters
+        ----------
+        X : numpy 2d array of float
+            The matrix to compress
+        encodings : list of str
+            The representations that can be used for the columns (a subset of
+            ENCODINGS). A column is stored as float32 if none of the given
+            representations is lossless for its values.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2:
+            raise ValueError("Only 2d matrices can be compressed")
+        unknown = set(encodings) - set(ENCODINGS)
+        if unknown:
+            raise TypeError("Encodings %s are not supported!"
+                            % ", ".join(sorted(unknown)))
+
+        self.shape = X.shape
+        self.dtype = np.dtype(np.float32)
+        self.encodings = np.empty(X.shape[1], dtype=object)
+
+        columns = dict((encoding, []) for encoding in ENCODINGS)
+        codebooks = dict((encoding, []) for encoding in _CODES_DTYPE)
+        for j in range(X.shape[1]):
+            encoding, codebook = _analyze_column(X[:, j], encodings)
+            self.encodings[j] = encoding
+            columns[encoding].append(j)
+            if codebook is not None:
+                codebooks[encoding].append(codebook)
+
+        # groups of columns with the same encoding: (encoding, columns of the
+        # matrix, 2d array of the values/codes, flattened codebooks, offset of
+        # the codebook of each column)
+        self._groups = []
+        for encoding in ENCODINGS:
+            if not columns[encoding]:
+                continue
+            group_columns = np.array(columns[encoding], dtype=np.intp)
+            if encoding in _CODES_DTYPE:
+                group_codebooks = codebooks[encoding]
+                data = np.empty((X.shape[0], group_columns.size),
+                                dtype=_CODES_DTYPE[encoding])
+                for i, (j, codebook) in enumerate(zip(group_columns,
+                                                      group_codebooks)):
+                    data[:, i] = np.searchsorted(codebook, X[:, j])
+                offsets = np.cumsum([0] + [codebook.size for codebook
+                                           in group_codebooks[:-1]])
+                table = np.concatenate(group_codebooks)
+            else:
+                data = np.ascontiguousarray(X[:, group_columns],
+                                            dtype=encoding)
+                offsets = table = None
+            self._groups.append((encoding, group_columns, data, table,
+                                 None if offsets is None
+                                 else offsets.astype(np.intp)))
+
+    @property
+    def nbytes(self):
+        return sum(data.nbytes + (table.nbytes + offsets.nbytes
+                                  if table is not None else 0)
+                   for _, _, data, table, offsets in self._groups)
+
+    def rows(self, start, end):
+        """
+        Returns the compressed matrix of the given (contiguous) range of rows,
+        sharing the memory with this matrix.
+
+        Parameters
+        ----------
+        start : int
+            The first row of the range
+        end : int
+            The row following the last one of the range
+
+        Returns
+        -------
+        matrix : CompressedMatrix
+            The compressed matrix with the selected rows
+        """
+        start, end, _ = slice(start, end).indices(self.shape[0])
+        end = max(start, end)
+        matrix = CompressedMatrix.__new__(CompressedMatrix)
+        matrix.shape = (end - start, self.shape[1])
+        matrix.dtype = self.dtype
+        matrix.encodings = self.encodings
+        matrix._groups = [(encoding, columns, data[start:end], table, offsets)
+                          for encoding, columns, data, table, offsets
+                          in self._groups]
+        return matrix
+
+    def decode(self, start=0, end=None, out=None):
+        """
+        Decode the given (contiguous) range of rows.
+
+        Parameters
+        ----------
+        start : int
+            The first row of the range
+        end : None or int
+            The row following the last one of the range (None for the last row
+            of the matrix)
+        out : None or numpy 2d array of float32
+            A C-contiguous array where to store the decoded rows (at least as
+            many rows as the ones of the range; only the first ones are used)
+
+        Returns
+        -------
+        X : numpy 2d array of float32
+            The decoded rows
+        """
+        return self._decode(slice(start, end), out)
+
+    def iter_blocks(self, block_rows=4096):
+        """
+        Iterate over the decoded rows of the matrix, by blocks. The same buffer
+        is reused for all the blocks, thus a block is valid only until the next
+        one is decoded.
+
+        Parameters
+        ----------
+        block_rows : int
+            The number of rows of each block
+
+        Returns
+        -------
+        (start, end, X)
+
+        where start and end are the range of rows of the block and X is the
+        numpy 2d array of float32 storing the decoded rows.
+        """
+        buffer = np.empty((min(block_rows, self.shape[0]), self.shape[1]),
+                          dtype=np.float32)
+        for start in range(0, self.shape[0], block_rows):
+            end = min(start + block_rows, self.shape[0])
+            yield start, end, self.decode(start, end, out=buffer)
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) > 2:
+            raise IndexError("too many indices for a 2d matrix")
+        rows = key[0]
+        columns = key[1] if len(key) == 2 else slice(None)
+
+        if isinstance(columns, (int, np.integer)):
+            # decode only the selected column
+            return self._decode_column(columns, rows)
+
+        X = self._decode(rows)
+        if isinstance(rows, (int, np.integer)):
+            return X[0][columns]
+        return X[:, columns]
+
+    def __array__(self, dtype=None):
+        X = self._decode(slice(None))
+        return X if dtype is None else X.astype(dtype, copy=False)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __eq__(self, other):
+        return np.asarray(self) == np.asarray(other)
+
+    def __ne__(self, other):
+        return np.asarray(self) != np.asarray(other)
+
+    def _decode(self, rows, out=None):
+        scalar = isinstance(rows, (int, np.integer))
+        if scalar:
+            rows = slice(rows, rows + 1 if rows != -1 else None)
+        n_rows = np.empty(self.shape[0], dtype=np.bool_)[rows].shape[0]
+        if out is None:
+            out = np.empty((n_rows, self.shape[1]), dtype=np.float32)
+        else:
+            out = out[:n_rows]
+        for encoding, columns, data, table, offsets in self._groups:
+            out[:, columns] = _decode_group(data[rows], table, offsets)
+        return out
+
+    def _decode_column(self, column, rows):
+        column = np.arange(self.shape[1])[column]
+        for encoding, columns, data, table, offsets in self._groups:
+            position = np.searchsorted(columns, column)
+            if position < columns.size and columns[position] == column:
+                values = data[rows, position]
+                if table is None:
+                    return np.asarray(values, dtype=np.float32)
+                return table[offsets[position] + values.astype(np.intp)]
+
+
+def _analyze_column(values, encodings):
+    """
+    Returns the lossless representation of the given column, among the given
+    encodings, requiring the least memory (codebook included), along with the
+    codebook (sorted distinct values) to use.
+    """
+    codebook = None
+    if "uint8" in encodings or "uint16" in encodings:
+        codebook = np.unique(values)
+
+    best, best_nbytes = "float32", values.size * 4
+    for encoding in ENCODINGS:
+        if encoding not in encodings:
+            continue
+        if encoding in _CODES_DTYPE:
+            # NaN values are never equal, thus they can not be encoded
+            if codebook.size > np.iinfo(_CODES_DTYPE[encoding]).max + 1 or \
+                    np.isnan(codebook[-1:]).any():
+                continue
+            nbytes = values.size * np.dtype(_CODES_DTYPE[encoding]).itemsize \
+                + codebook.nbytes
+        elif encoding == "float16":
+            with np.errstate(over='ignore'):
+                encoded = values.astype(np.float16).astype(np.float32)
+            if not np.array_equal(encoded, values):
+                continue
+            nbytes = values.size * 2
+        else:
+            continue
+        if nbytes < best_nbytes:
+            best, best_nbytes = encoding, nbytes
+
+    return best, codebook if best in _CODES_DTYPE else None
+
+
+def _decode_group(data, table, offsets):
+    if table is None:
+        return data
+    return table[data.astype(np.intp) + offsets]
@@ -8,10 +8,27 @@
 """
 This module implements the generic class for loading/dumping a dataset from/to file.
 """
+import os
+import tempfile
+
 import numpy as np
-import copy
+import six
 
-from .svmlight_format import load_svmlight_file, dump_svmlight_file
+from .arrow_format import FORMATS as ARROW_FORMATS, load_arrow_file, \
+    dump_arrow_file
+from .chunked_matrix import ChunkedMatrix
+from .compressed_matrix import CompressedMatrix, ENCODINGS
+from .feature_stats import FeatureSketch, QUANTILES
+from .normalization import METHODS as NORMALIZATIONS, normalize_features
+from .query_batches import BATCH_BYTES, iter_svmlight_batches, \
+    query_batch_bounds
+from .rankeval_format import load_rankeval_file, dump_rankeval_file, \
+    read_header, sidecar_path, is_sidecar_valid
+from .shards import shard_bounds, shard_path, write_shards
+from .svmlight_format import load_svmlight_file, dump_svmlight_file, \
+    parallel_map, pad_features, split_threads
+from .svmlight_index import get_svmlight_index, group_svmlight_file, \
+    load_svmlight_queries
 
 
 class Dataset(object):
@@ -25,7 +42,12 @@ class Dataset(object):
     y : numpy 1d array of float
         It is a ndarray of shape (n_samples,) with the gold label
     query_ids : numpy 1d array of int
-        It is a ndarray of shape(nsamples,)
+        It is a ndarray of shape (n_queries+1,) with the offsets of the queries:
+        the instances of the i-th query are the rows in the range
+        [query_ids[i], query_ids[i+1])
+    qids : numpy 1d array of int
+        It is a ndarray of shape (n_queries,) with the original id of each
+        query (e.g., the qid in the svmlight file)
     name : str
         The name to give to the dataset
     n_instances : int
@@ -34,9 +56,13 @@ class Dataset(object):
         The number of features in the dataset
     n_queries : int
         The number of queries in the dataset
+    features : None or numpy 1d array of int
+        The ids of the features stored in the columns of X, when the dataset
+        has been loaded with only a subset of the features (see load). None
+        means the i-th column of X stores the feature i.
     """
 
-    def __init__(self, X, y, query_ids, name=None):
+    def __init__(self, X, y, query_ids, name=None, features=None, qids=None):
         """
         This module implements the generic class for loading/dumping a dataset from/to file.
 
@@ -47,29 +73,61 @@ class Dataset(object):
         y : numpy.array
             The vector with label values
         query_ids : numpy.array
-            The vector with the query_id for each sample.
+            The vector with the query_id for each sample, or the offsets of the
+            queries (n_queries+1). If the instances of a query are not
+            contiguous, the rows of X and y are grouped by query (with a stable
+            sort, keeping the queries in order of first appearance).
+        name : str
+            The name to be given to the dataset
+        features : None or list of int
+            The ids of the features stored in the columns of X. None means the
+            i-th column of X stores the feature i.
+        qids : None or numpy.array
+            The original id of each query. If given, query_ids are the offsets
+            of the queries. If None and query_ids are the offsets, the queries
+            are numbered from 1.
         """
 
-        if len(query_ids) == X.shape[0]:
+        if qids is None and len(query_ids) == X.shape[0]:
             # convert from query_ids per sample to query offset
-            self.query_ids = np.append(np.unique(query_ids, return_index=True)[1],
-                                       query_ids.size)
+            self.query_ids, self.qids, order = _group_queries(query_ids)
+            if order is not None:
+                X, y = X[order], y[order]
         else:
             self.query_ids = query_ids
+            if qids is None:
+                qids = np.arange(1, max(len(query_ids), 1), dtype=np.int64)
+            self.qids = np.asarray(qids)
+            if self.qids.size != max(len(query_ids) - 1, 0):
+                raise ValueError("The number of qids does not match the "
+                                 "number of queries")
+        self._qid_lookup = None
 
         self.X, self.y = X, y
         self.name = "Dataset %s" % (self.X.shape,)
         if name is not None:
             self.name = name
 
+        self.features = None
+        if features is not None:
+            self.features = np.asarray(features, dtype=np.int32)
+            if self.features.size != self.X.shape[1]:
+                raise ValueError("The number of features does not match the "
+                                 "number of columns of X")
+
         self.n_instances = len(self.y)
         self.n_features = self.X.shape[1]
         self.n_queries = len(self.query_ids) - 1
 
     @staticmethod
-    def load(f, name=None, format="svmlight"):
+    def load(f, name=None, format="svmlight", cache=False, features=None,
+             queries=None, n_threads=None):
         """
         This static method implements the loading of a dataset from file.
+        The lines of a query of a svmlight file may be scattered across the
+        file (interleaved queries): they are grouped by query in memory,
+        keeping the queries in order of first appearance (see
+        group_svmlight_file for grouping files that do not fit in memory).
 
         Parameters
         ----------
@@ -78,24 +136,292 @@ class Dataset(object):
         name : str
             The name to be given to the current dataset
         format : str
-            The format of the dataset file to load (actually supported is only "svmlight" format)
+            The format of the dataset file to load. Supported formats are
+            "svmlight", "rankeval" (binary format, see the save method),
+            "parquet" and "arrow" (Arrow IPC file). Parquet and Arrow files
+            store a column for the query ids ("qid"), one for the labels
+            ("label") and one for each feature ("f1".."fN"), and they require
+            the optional pyarrow package.
+        cache : bool
+            Only for the "svmlight" format. If True, the first time the file is
+            parsed a binary sidecar cache is written next to it (same file name
+            with the ".rankeval" suffix). The subsequent loads memory map the
+            cache instead of parsing the file, until the file changes.
+        features : None or list of int
+            The ids of the features to load (e.g., the ones used by a model,
+            see RTEnsemble.used_features). If given, X stores only these
+            features, in the given order, and the other features are skipped
+            while parsing (svmlight) or not read at all (rankeval, columnar
+            layout). Models are transparently scored on the compact X.
+        queries : None or list of int
+            The (original) ids of the queries to load, in the given order. For
+            the "svmlight" format, the byte ranges of the queries are found by
+            means of a sidecar index of the file (same file name with the
+            ".qidx" suffix, built in a single pass the first time), and only
+            these ranges are read and parsed (in parallel). If cache is True,
+            a valid sidecar cache is used instead, but it is not created.
+        n_threads : None or int
+            Only for the "svmlight" format. The number of threads to use for
+            parsing the file. If None, all the available cores are used.
 
         Returns
         -------
         dataset : Dataset
             The dataset read from file
         """
+        if format == "svmlight" and queries is not None and \
+                not (cache and is_sidecar_valid(sidecar_path(f), f)):
+            X, y, query_ids, qids = load_svmlight_queries(
+                f, queries, features=features, n_threads=n_threads)
+            return Dataset(X, y, query_ids, name, features=features,
+                           qids=qids)
+
+        if format == "svmlight":
+            sidecar = sidecar_path(f)
+            if cache and is_sidecar_valid(sidecar, f):
+                X, y, query_ids, qids = load_rankeval_file(sidecar,
+                                                           features=features)
+            elif cache:
+                X, y, query_ids, qids = _group_runs(*load_svmlight_file(
+                    f, query_id=True, original_qids=True, n_threads=n_threads))
+                dataset = Dataset(X, y, query_ids, name, qids=qids)
+                dump_rankeval_file(dataset.X, dataset.y, dataset.query_ids,
+                                   sidecar, source=f, qids=dataset.qids)
+                if features is None:
+                    return dataset
+                X = np.ascontiguousarray(X[:, features])
+            else:
+                X, y, query_ids, qids = _group_runs(*load_svmlight_file(
+                    f, query_id=True, features=features, original_qids=True,
+                    n_threads=n_threads))
+        elif format == "rankeval":
+            X, y, query_ids, qids = load_rankeval_file(f, features=features)
+            if features is None:
+                features = read_header(f)["features"]
+        elif format in ARROW_FORMATS:
+            # the rows are grouped by query by the constructor
+            X, y, query_ids, file_features = load_arrow_file(
+                f, format=format, features=features)
+            qids = None
+            if features is None and \
+                    (file_features != np.arange(file_features.size)).any():
+                features = file_features
+        else:
+            raise TypeError("Dataset format %s is not yet supported!" % format)
+        dataset = Dataset(X, y, query_ids, name, features=features, qids=qids)
+
+        if queries is not None:
+            positions = dataset.query_positions(queries)
+            if (positions < 0).any():
+                raise KeyError("Queries not found: %s" % ", ".join(
+                    str(qid) for qid in np.asarray(queries)[positions < 0]))
+            dataset = dataset.subset_queries(positions).materialize(
+                name=dataset.name)
+        return dataset
+
+    @staticmethod
+    def load_many(files, names=None, format="svmlight", n_threads=None,
+                  **kwargs):
+        """
+        This static method implements the concurrent loading of several
+        datasets (e.g., the train, validation and test splits of a dataset),
+        in a pool of threads. The parsing releases the GIL, and the available
+        threads are split among the files.
+
+        All the datasets are given the same number of features: the feature
+        matrices with less features than the others (e.g., a test split not
+        having the last features) are padded with zero valued features.
+
+        Parameters
+        ----------
+        files : list of path
+            The file names of the datasets to load
+        names : None or list of str
+            The names to be given to the datasets
+        format : str
+            The format of the dataset files to load (see load)
+        n_threads : None or int
+            The overall number of threads to use. If None, all the available
+            cores are used.
+        kwargs
+            The other parameters are given to the load method
+
+        Returns
+        -------
+        datasets : list of Dataset
+            The datasets read from file, in the given order
+        """
+        if names is None:
+            names = [None] * len(files)
+        file_threads = split_threads(n_threads, len(files))
+
+        def load(args):
+            f, name = args
+            return Dataset.load(f, name=name, format=format,
+                                n_threads=file_threads, **kwargs)
+
+        datasets = parallel_map(load, list(zip(files, names)))
+
+        n_features = max([dataset.n_features for dataset in datasets] or [0])
+        for dataset in datasets:
+            if dataset.n_features == n_features:
+                continue
+            if dataset.features is not None:
+                raise ValueError("Datasets storing a subset of the features "
+                                 "have a different number of features")
+            dataset.X = pad_features(dataset.X, n_features)
+            dataset.n_features = n_features
+        return datasets
+
+    @staticmethod
+    def load_batches(f, name=None, format="svmlight", max_bytes=BATCH_BYTES,
+                     n_features=None, features=None, n_threads=None,
+                     group_queries=False):
+        """
+        This static method implements the loading of a dataset from file by
+        batches of queries (see iter_batches), so that a dataset that does not
+        fit in memory can be scored and evaluated batch by batch (e.g., by
+        rankeval.metrics.metric.eval_query_batches). Files in the "svmlight"
+        format are parsed in streaming, by blocks, while files in the
+        "rankeval" format are memory mapped.
+
+        Parameters
+        ----------
+        f : path
+            The file name of the dataset to load
+        name : str
+            The name to be given to the dataset (each batch is named after it)
+        format : str
+            The format of the dataset file to load ("svmlight" or "rankeval")
+        max_bytes : int
+            The maximum size in bytes of the feature matrix of a batch (a
+            query bigger than max_bytes is a batch on its own)
+        n_features : None or int
+            Only for the "svmlight" format. The number of features of the
+            batches. If None, the number of features of each batch is inferred
+            from the block of the file it has been parsed from, thus it is
+            recommended to give it (e.g., for scoring a model).
+        features : None or list of int
+            The ids of the features to load (see load)
+        n_threads : None or int
+            Only for the "svmlight" format. The number of threads to use for
+            parsing each block of the file.
+        group_queries : bool
+            Only for (uncompressed) files in the "svmlight" format. Whether
+            the lines of each query may be scattered across the file. If the
+            file is not grouped by query, it is first rewritten in a temporary
+            file grouped by query (see group_svmlight_file), with bounded
+            memory.
+
+        Returns
+        -------
+        batches : generator of Dataset
+            The batches of the dataset, in file order
+        """
         if format == "svmlight":
-            X, y, query_ids = load_svmlight_file(f, query_id=True)
+            grouped = None
+            if group_queries:
+                index = get_svmlight_index(f, n_threads=n_threads)
+                if not index.is_grouped():
+                    handle, grouped = tempfile.mkstemp(suffix=".svmlight")
+                    os.close(handle)
+                    f = group_svmlight_file(f, grouped, max_bytes=max_bytes,
+                                            index=index)
+            try:
+                batches = iter_svmlight_batches(f, max_bytes=max_bytes,
+                                                n_features=n_features,
+                                                features=features,
+                                                n_threads=n_threads)
+                for i, (X, y, query_ids, qids) in enumerate(batches):
+                    yield Dataset(X, y, query_ids, "%s (batch %d)" % (name, i),
+                                  features=features, qids=qids)
+            finally:
+                if grouped is not None:
+                    os.remove(grouped)
+        elif format == "rankeval":
+            dataset = Dataset.load(f, name=name, format="rankeval",
+                                   features=features)
+            for batch in dataset.iter_batches(max_bytes=max_bytes):
+                yield batch
         else:
             raise TypeError("Dataset format %s is not yet supported!" % format)
-        return Dataset(X, y, query_ids, name)
+
+    @staticmethod
+    def concatenate(datasets, name=None):
+        """
+        This static method implements the concatenation of several datasets
+        (e.g., daily slices of a collection) in a single dataset, storing the
+        queries of the datasets in the given order. The feature matrices are
+        not copied: X is a ChunkedMatrix referring to them, which the models
+        score block by block. Use compact for copying the feature matrix in a
+        single contiguous array, when needed.
+
+        Parameters
+        ----------
+        datasets : list of Dataset
+            The datasets to concatenate, all with the same features
+        name : str
+            The name to be given to the dataset
+
+        Returns
+        -------
+        dataset : Dataset
+            The concatenated dataset
+        """
+        if not datasets:
+            raise ValueError("At least a dataset is required")
+        features = datasets[0].features
+        for dataset in datasets[1:]:
+            if dataset.n_features != datasets[0].n_features or \
+                    (dataset.features is None) != (features is None) or \
+                    features is not None and \
+                    not np.array_equal(dataset.features, features):
+                raise ValueError("The datasets have different features")
+
+        offsets = np.cumsum([0] + [dataset.n_instances
+                                   for dataset in datasets])
+        query_ids = np.concatenate(
+            [dataset.query_ids[:-1] + offset
+             for dataset, offset in zip(datasets, offsets)] + [offsets[-1:]])
+        return Dataset(ChunkedMatrix([dataset.X for dataset in datasets]),
+                       np.concatenate([dataset.y for dataset in datasets]),
+                       query_ids.astype(np.int64), name=name,
+                       features=features,
+                       qids=np.concatenate([dataset.qids
+                                            for dataset in datasets]))
+
+    def save(self, f, format="rankeval", columnar=False):
+        """
+        This method implements the writing of the dataset on file. By default,
+        the dataset is stored in the "rankeval" binary format, which stores the
+        features, the labels and the query offsets as aligned arrays that are
+        memory mapped (instead of parsed) by the load method.
+
+        Parameters
+        ----------
+        f : path
+            The file path where to store the dataset
+        format : str
+            The format to use for storing the dataset on file (see dump)
+        columnar : bool
+            Only for the "rankeval" format. If True, the features are stored by
+            columns, so that a subset of them can be loaded without reading the
+            others. Row-wise files are instead memory mapped without any copy.
+        """
+        if format == "rankeval":
+            dump_rankeval_file(self.X, self.y, self.query_ids, f,
+                               features=self.features, columnar=columnar,
+                               qids=self.qids)
+        else:
+            self.dump(f, format)
 
     def subset_features(self, features):
         """
         Create a new Dataset with only the features identified by the given
         features parameters (indices). It is useful for performing feature
-        selection.
+        selection. The returned dataset is a DatasetView, which does not copy
+        the feature matrix until it is explicitly accessed (the models are
+        scored directly on the matrix of this dataset).
 
         Parameters
         ----------
@@ -104,12 +430,242 @@ class Dataset(object):
 
         Returns
         -------
-        dataset : rankeval.dataset.Dataset
+        dataset : rankeval.dataset.DatasetView
             The resulting dataset with the given subset of features
         """
-        new_dataset = copy.deepcopy(self)
-        new_dataset.X = new_dataset.X[:, features]
-        return new_dataset
+        return DatasetView(self, features=features)
+
+    def subset_queries(self, queries):
+        """
+        Create a new Dataset with only the queries identified by the given
+        queries parameter (indices of the queries, a slice or a boolean mask).
+        It is useful for performing per-fold analyses. The returned dataset is
+        a DatasetView: if the selected queries are contiguous, the feature
+        matrix and the labels of the view are slices of the ones of this
+        dataset (no copy is done).
+
+        Parameters
+        ----------
+        queries : numpy array, list or slice
+            The indices of the queries to select in the resulting dataset
+
+        Returns
+        -------
+        dataset : rankeval.dataset.DatasetView
+            The resulting dataset with the given subset of queries
+        """
+        return DatasetView(self, queries=queries)
+
+    def query_strata(self, stratify_by):
+        """
+        Returns the stratum of each query, for a stratified sampling of the
+        queries (see sample_queries).
+
+        Parameters
+        ----------
+        stratify_by : str or numpy 1d array
+            The criterion used to group the queries in strata: "max_label"
+            (the highest label of the instances of the query), "n_relevant"
+            (the number of instances with a positive label), or a value for
+            each query of the dataset (e.g., a query class).
+
+        Returns
+        -------
+        strata : numpy 1d array of int
+            The stratum of each query (n_queries), numbered from 0
+        """
+        if isinstance(stratify_by, six.string_types):
+            non_empty = np.diff(self.query_ids) > 0
+            starts = self.query_ids[:-1][non_empty]
+            values = np.zeros(self.n_queries, dtype=np.float64)
+            if stratify_by == "max_label":
+                values[non_empty] = np.maximum.reduceat(self.y, starts)
+            elif stratify_by == "n_relevant":
+                values[non_empty] = np.add.reduceat(
+                    (self.y > 0).astype(np.int64), starts)
+            else:
+                raise ValueError("Stratification %s is not supported!"
+                                 % stratify_by)
+        else:
+            values = np.asarray(stratify_by)
+            if values.shape != (self.n_queries,):
+                raise ValueError("stratify_by should have a value for each "
+                                 "query of the dataset")
+        return np.unique(values, return_inverse=True)[1]
+
+    def sample_queries(self, frac=None, n=None, stratify_by=None, seed=None):
+        """
+        Sample (without replacement) a subset of the queries of the dataset,
+        e.g., for fast exploratory analyses. The sample can be stratified, so
+        that the distribution of the strata (e.g., of the highest label of the
+        queries) in the sample matches the one of the dataset: each stratum
+        contributes a number of queries proportional to its size. The
+        returned dataset is a DatasetView storing the sampled queries in the
+        order of the dataset (see subset_queries).
+
+        Parameters
+        ----------
+        frac : None or float
+            The fraction of the queries to sample (mutually exclusive with n)
+        n : None or int
+            The number of queries to sample (mutually exclusive with frac)
+        stratify_by : None, str or numpy 1d array
+            The criterion used to group the queries in strata (see
+            query_strata). If None, the queries are sampled uniformly.
+        seed : None or int
+            The seed of the random number generator
+
+        Returns
+        -------
+        dataset : rankeval.dataset.DatasetView
+            The resulting dataset with the sampled queries
+        """
+        if (frac is None) == (n is None):
+            raise ValueError("Exactly one of frac and n should be given")
+        if n is None:
+            if not 0 <= frac <= 1:
+                raise ValueError("frac should be in [0, 1], got %r" % frac)
+            n = int(round(frac * self.n_queries))
+        if not 0 <= n <= self.n_queries:
+            raise ValueError("n should be in [0, %d], got %r"
+                             % (self.n_queries, n))
+
+        random_state = np.random.RandomState(seed)
+        strata = np.zeros(self.n_queries, dtype=np.intp)
+        if stratify_by is not None:
+            strata = self.query_strata(stratify_by)
+        sizes = np.bincount(strata)
+
+        # proportional allocation, assigning the remaining queries to the
+        # strata with the largest remainders (ties broken at random)
+        quotas = sizes * (float(n) / max(self.n_queries, 1))
+        allocation = np.floor(quotas).astype(np.intp)
+        order = np.lexsort((random_state.random_sample(sizes.size),
+                            allocation - quotas))
+        allocation[order[:n - allocation.sum()]] += 1
+
+        # rank the queries of each stratum at random, taking the first ones
+        order = np.lexsort((random_state.random_sample(self.n_queries),
+                            strata))
+        ranks = np.arange(self.n_queries) - \
+            (np.cumsum(sizes) - sizes)[strata[order]]
+        queries = np.sort(order[ranks < allocation[strata[order]]])
+        return DatasetView(self, queries=queries,
+                           name="Sample of %s" % self.name)
+
+    def iter_batches(self, max_bytes=BATCH_BYTES):
+        """
+        Iterate over the dataset by batches of contiguous queries (a query is
+        never split), whose feature matrix is at most max_bytes bytes (a query
+        bigger than max_bytes is a batch on its own). The batches are views of
+        the dataset (no copy is done): for a memory mapped dataset, only the
+        rows of the current batch are read from disk.
+
+        Parameters
+        ----------
+        max_bytes : int
+            The maximum size in bytes of the feature matrix of a batch
+
+        Returns
+        -------
+        batches : generator of rankeval.dataset.DatasetView
+            The batches of the dataset, in order
+        """
+        bounds = query_batch_bounds(self.query_ids, self.n_features * 4,
+                                    max_bytes)
+        for i, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+            yield DatasetView(self, queries=slice(start, end),
+                              name="%s (batch %d)" % (self.name, i))
+
+    def shard(self, n_shards):
+        """
+        Partition the dataset in shards of contiguous queries (a query is never
+        split), balanced by number of instances rather than by number of
+        queries. The concatenation of the shards, in order, is the dataset.
+
+        Parameters
+        ----------
+        n_shards : int
+            The number of shards (at most the number of queries)
+
+        Returns
+        -------
+        shards : list of rankeval.dataset.DatasetView
+            The shards of the dataset (views, no copy is done)
+        """
+        bounds = shard_bounds(self.query_ids, n_shards)
+        return [DatasetView(self, queries=slice(start, end),
+                            name="%s (shard %d of %d)"
+                                 % (self.name, i, n_shards))
+                for i, (start, end) in enumerate(zip(bounds[:-1], bounds[1:]))]
+
+    def write_shards(self, prefix, n_shards, columnar=False):
+        """
+        Write the dataset in shards (see shard), each one stored in the
+        "rankeval" binary format, along with a JSON manifest describing them.
+        Each worker of a distributed evaluation can then load only its shard
+        (see load_shard), and the per-query results of the shards can be
+        merged back in the order of the queries of the dataset (see
+        rankeval.dataset.shards.merge_query_scores).
+
+        Parameters
+        ----------
+        prefix : str
+            The path prefix of the files to write: the shards are stored in
+            <prefix>.shard-<i>-of-<n>.rankeval and the manifest in
+            <prefix>.manifest.json
+        n_shards : int
+            The number of shards
+        columnar : bool
+            Whether the features of the shards have to be stored by columns
+            (see save)
+
+        Returns
+        -------
+        manifest : str
+            The path of the manifest
+        """
+        return write_shards(self, prefix, n_shards, columnar=columnar)
+
+    @staticmethod
+    def load_shard(manifest, shard, name=None, features=None):
+        """
+        This static method implements the loading of a single shard of a
+        dataset written by write_shards.
+
+        Parameters
+        ----------
+        manifest : path
+            The file name of the manifest of the sharded dataset
+        shard : int
+            The index of the shard to load
+        name : str
+            The name to be given to the shard
+        features : None or list of int
+            The ids of the features to load (see load)
+
+        Returns
+        -------
+        dataset : Dataset
+            The shard read from file
+        """
+        return Dataset.load(shard_path(manifest, shard), name=name,
+                            format="rankeval", features=features)
+
+    def scoring_matrix(self):
+        """
+        Returns the feature matrix to use for scoring the dataset, along with
+        the columns of the matrix storing the features of the dataset.
+
+        Returns
+        -------
+        X : numpy 2d array of float
+            The feature matrix to score
+        columns : None or numpy 1d array of int
+            The column of X storing each feature (column) of the dataset. None
+            means that X is the feature matrix of the dataset.
+        """
+        return self.X, None
 
     def dump(self, f, format):
         """
@@ -120,25 +676,256 @@ class Dataset(object):
         f : path
             The file path where to store the dataset
         format : str
-            The format to use for dumping the dataset on file (actually supported is only "svmlight" format)
-        """
-        if len(self.query_ids) != self.X.shape[0]:
-            # we need to unroll the query_ids (it is compacted: it reports only
-            # the offset where a new query id starts)
-            query_ids = np.ndarray(self.X.shape[0], dtype=np.float32)
-            last_idx = 0
-            for qid, qid_offset in enumerate(self.query_ids, start=1):
-                for idx in np.arange(last_idx, qid_offset):
-                    query_ids[idx] = qid
-                last_idx = qid_offset
-        else:
-            query_ids = self.query_ids
+            The format to use for dumping the dataset on file. Supported
+            formats are "svmlight", "rankeval" (binary format), "parquet" and
+            "arrow" (see load)
+        """
+        if format == "rankeval":
+            dump_rankeval_file(self.X, self.y, self.query_ids, f,
+                               features=self.features, qids=self.qids)
+            return
+
+        # we need to unroll the query_ids (it is compacted: it reports only
+        # the offset where a new query id starts)
+        query_ids = np.repeat(self.qids, np.diff(self.query_ids))
 
         if format == "svmlight":
             dump_svmlight_file(self.X, self.y, f, query_ids)
+        elif format in ARROW_FORMATS:
+            dump_arrow_file(self.X, self.y, query_ids, f, format=format,
+                            features=self.features)
         else:
             raise TypeError("Dataset format %s is not yet supported!" % format)
 
+    def compress(self, encodings=ENCODINGS):
+        """
+        Compress the feature matrix in memory, storing each feature with the
+        lossless representation requiring the least memory (uint8/uint16 codes
+        of a per-feature codebook, float16 or float32). After the compression,
+        X is a CompressedMatrix: the models score it by decoding a block of
+        rows at a time, while indexing X decodes only the selected elements.
+
+        Parameters
+        ----------
+        encodings : list of str
+            The representations that can be used for the features (see
+            rankeval.dataset.compressed_matrix.ENCODINGS)
+
+        Returns
+        -------
+        dataset : Dataset
+            The dataset itself (compressed in place)
+        """
+        if not isinstance(self.X, CompressedMatrix):
+            self.X = CompressedMatrix(self.X, encodings=encodings)
+        return self
+
+    def decompress(self):
+        """
+        Decompress the feature matrix in memory (see compress), storing it
+        again as a dense float32 matrix.
+
+        Returns
+        -------
+        dataset : Dataset
+            The dataset itself (decompressed in place)
+        """
+        if isinstance(self.X, CompressedMatrix):
+            self.X = np.asarray(self.X)
+        return self
+
+    def compact(self):
+        """
+        Copy the blocks of a chunked feature matrix (see concatenate) in a
+        single contiguous matrix.
+
+        Returns
+        -------
+        dataset : Dataset
+            The dataset itself (compacted in place)
+        """
+        if isinstance(self.X, ChunkedMatrix):
+            self.X = self.X.compact()
+        return self
+
+    def normalize(self, method="query_minmax", inplace=True):
+        """
+        Normalize the features, either within each query ("query_minmax" and
+        "query_zscore") or over the whole dataset ("global_zscore"). The
+        statistics of the queries are computed with segmented reductions over
+        the query offsets, processing the feature matrix by blocks of queries
+        (see rankeval.dataset.normalization.normalize_features).
+
+        Parameters
+        ----------
+        method : str
+            The normalization to apply: "query_minmax" scales the values of
+            each feature in [0, 1] within each query, "query_zscore"
+            standardizes them (zero mean and unit variance) within each query
+            and "global_zscore" standardizes them over the whole dataset.
+        inplace : bool
+            Whether the feature matrix has to be normalized in place (no copy
+            of the matrix is allocated; a compressed matrix is decompressed
+            first and a chunked one is compacted). Otherwise, a normalized
+            copy of the dataset is returned.
+            The feature matrix of a view selecting all the features of
+            contiguous queries is a slice of the one of the original dataset,
+            which is then normalized as well.
+
+        Returns
+        -------
+        dataset : Dataset
+            The normalized dataset (this dataset if inplace is True)
+        """
+        if method not in NORMALIZATIONS:
+            raise TypeError("Normalization %s is not supported!" % method)
+        if inplace:
+            dataset = self.decompress().compact()
+        else:
+            dataset = DatasetView(self).materialize(name=self.name)
+        normalize_features(dataset.X, dataset.query_ids, method=method)
+        return dataset
+
+    def feature_sketch(self, n_threads=None, block_rows=4096, capacity=1024,
+                       seed=0):
+        """
+        Summarize the features of the dataset in a mergeable sketch (see
+        rankeval.dataset.feature_stats.FeatureSketch), in a single pass over
+        blocks of rows (the columns of X are never materialized). The rows are
+        split among n_threads threads, whose sketches are then merged.
+
+        Parameters
+        ----------
+        n_threads : None or int
+            The number of threads to use. If None, all the available cores
+            are used.
+        block_rows : int
+            The number of rows of each block
+        capacity : int
+            The number of items of each level of the quantile sketch (see
+            FeatureSketch)
+        seed : None or int
+            The seed of the random number generator used by the sketch
+
+        Returns
+        -------
+        sketch : FeatureSketch
+            The sketch of the features of the dataset
+        """
+        X, columns = self.scoring_matrix()
+        n_tasks = max(min(split_threads(n_threads, 1),
+                          self.n_instances // block_rows), 1)
+        bounds = np.linspace(0, self.n_instances, n_tasks + 1).astype(np.intp)
+
+        def summarize(task):
+            sketch = FeatureSketch(self.n_features, capacity=capacity,
+                                   seed=None if seed is None else seed + task)
+            for start in range(bounds[task], bounds[task + 1], block_rows):
+                end = min(start + block_rows, bounds[task + 1])
+                block = np.asarray(_row_slice(X, start, end))
+                sketch.update(block if columns is None
+                              else block[:, columns])
+            return sketch
+
+        sketches = parallel_map(summarize, range(n_tasks))
+        for sketch in sketches[1:]:
+            sketches[0].merge(sketch)
+        return sketches[0]
+
+    def describe_features(self, quantiles=QUANTILES, n_threads=None):
+        """
+        Compute the statistics of each feature: min, max, mean, standard
+        deviation, fraction of zeros and (estimated) quantiles. The statistics
+        are computed by a single parallel pass over blocks of rows (see
+        feature_sketch). For streamed or sharded datasets, the sketches of the
+        batches or of the shards can be merged (see FeatureSketch.merge).
+
+        Parameters
+        ----------
+        quantiles : list of float
+            The quantiles to report
+        n_threads : None or int
+            The number of threads to use. If None, all the available cores
+            are used.
+
+        Returns
+        -------
+        statistics : xarray.DataArray
+            A DataArray with the statistics of each feature (see
+            FeatureSketch.describe)
+        """
+        features = self.features if self.features is not None \
+            else np.arange(self.n_features)
+        return self.feature_sketch(n_threads=n_threads).describe(
+            quantiles, features=features)
+
+    def query_offsets(self, qid):
+        """
+        Returns the offsets of the query with the given (original) id, in
+        constant time.
+
+        Parameters
+        ----------
+        qid : int
+            The original id of the query (see qids)
+
+        Returns
+        -------
+        offsets : tuple of (int, int)
+            The (start, end) offsets of the rows of the query
+        """
+        position = self.query_positions([qid])[0]
+        if position < 0:
+            raise KeyError(qid)
+        return self.query_ids[position], self.query_ids[position + 1]
+
+    def query_positions(self, qids):
+        """
+        Returns the position (index) of the queries with the given (original)
+        ids, e.g., for joining per-query data (query classes, logs, etc.) with
+        the queries of the dataset. The lookup is vectorized: the ids are
+        mapped with a direct-address table when they are dense enough, with a
+        binary search over the sorted ids otherwise.
+
+        Parameters
+        ----------
+        qids : numpy array or list of int
+            The original ids of the queries to look up
+
+        Returns
+        -------
+        positions : numpy 1d array of int
+            The position of each query in the dataset, -1 for the ids that do
+            not belong to the dataset
+        """
+        qids = np.asarray(qids, dtype=np.int64)
+        positions = np.full(qids.shape, -1, dtype=np.intp)
+        if self.qids.size == 0:
+            return positions
+
+        if self._qid_lookup is None:
+            min_qid, max_qid = self.qids.min(), self.qids.max()
+            if max_qid - min_qid < 4 * self.qids.size + 1024:
+                table = np.full(max_qid - min_qid + 1, -1, dtype=np.intp)
+                table[self.qids[::-1] - min_qid] = \
+                    np.arange(self.qids.size)[::-1]
+                self._qid_lookup = (min_qid, max_qid, table)
+            else:
+                order = np.argsort(self.qids, kind='mergesort')
+                self._qid_lookup = (None, self.qids[order], order)
+
+        min_qid, max_qid, table = self._qid_lookup
+        if min_qid is not None:
+            found = (qids >= min_qid) & (qids <= max_qid)
+            positions[found] = table[qids[found] - min_qid]
+        else:
+            sorted_qids, order = max_qid, table
+            index = np.minimum(np.searchsorted(sorted_qids, qids),
+                               sorted_qids.size - 1)
+            found = sorted_qids[index] == qids
+            positions[found] = order[index[found]]
+        return positions
+
     def clear_X(self):
         """
         This method clears the space used by the dataset instance for storing X (the dataset features).
@@ -174,4 +961,252 @@ class Dataset(object):
     def __ne__(self, other):
         # Not strictly necessary, but to avoid having both x==y and x!=y
         # True at the same time
-        return not(self == other)
\ No newline at end of file
+        return not(self == other)
+
+
+class DatasetView(Dataset):
+    """
+    This class implements a lightweight view of a Dataset, selecting a subset
+    of its queries and/or of its features, without copying the feature matrix.
+
+    If the selected queries are contiguous (e.g., a slice of queries), the
+    labels and the rows of the feature matrix are slices of the ones of the
+    original dataset. The selection of the features is lazy: the feature
+    matrix of the view (the X attribute) is materialized, as a contiguous
+    matrix, only the first time it is accessed. Models are scored on the rows
+    of the original matrix, by referring their split nodes to the selected
+    columns, thus the matrix is not materialized for scoring the view.
+
+    Attributes
+    ----------
+    dataset : Dataset
+        The original dataset (never a view: views of views refer to the
+        original dataset)
+    queries : None or numpy 1d array of int
+        The indices of the queries of the original dataset selected by the view
+        (None means all the queries)
+    columns : None or numpy 1d array of int
+        The columns of the original feature matrix selected by the view (None
+        means all the columns)
+    """
+
+    def __init__(self, dataset, queries=None, features=None, name=None):
+        """
+        Create a view of the given dataset.
+
+        Parameters
+        ----------
+        dataset : Dataset
+            The dataset to select the queries and the features from
+        queries : None, list, numpy array or slice
+            The indices of the queries to select (a slice or a boolean mask are
+            also supported). None selects all the queries.
+        features : None, list, numpy array or slice
+            The indices of the features (columns) to select (a slice or a
+            boolean mask are also supported). None selects all the features.
+        name : str
+            The name to be given to the view
+        """
+        queries_ids = None
+        if queries is not None:
+            queries_ids = np.arange(dataset.n_queries)[queries]
+        columns = None
+        if features is not None:
+            columns = np.arange(dataset.n_features)[features]
+
+        # refer the selection to the original dataset
+        if isinstance(dataset, DatasetView):
+            if dataset.queries is not None:
+                queries_ids = dataset.queries if queries_ids is None \
+                    else dataset.queries[queries_ids]
+            if dataset.columns is not None:
+                columns = dataset.columns if columns is None \
+                    else dataset.columns[columns]
+            dataset = dataset.dataset
+
+        self.dataset = dataset
+        self.queries = queries_ids
+        self.columns = columns
+        self._X = None
+
+        offsets = dataset.query_ids
+        self._rows = None
+        if queries_ids is None:
+            self._start, self._end = 0, dataset.n_instances
+            self.query_ids = offsets
+        elif queries_ids.size == 0 or (np.diff(queries_ids) == 1).all():
+            first = queries_ids[0] if queries_ids.size else 0
+            last = first + queries_ids.size
+            self._start, self._end = offsets[first], offsets[last]
+            self.query_ids = offsets[first:last + 1] - self._start
+        else:
+            sizes = offsets[queries_ids + 1] - offsets[queries_ids]
+            self.query_ids = np.append(0, np.cumsum(sizes))
+            # row index of each instance of the selected queries
+            self._rows = np.repeat(offsets[queries_ids] - self.query_ids[:-1],
+                                   sizes) + np.arange(self.query_ids[-1])
+
+        if self._rows is None:
+            self.y = dataset.y[self._start:self._end]
+        else:
+            self.y = dataset.y[self._rows]
+        self.qids = dataset.qids if queries_ids is None \
+            else dataset.qids[queries_ids]
+        self._qid_lookup = None
+
+        self.features = dataset.features
+        if columns is not None and dataset.features is not None:
+            self.features = dataset.features[columns]
+
+        self.name = "View of %s" % dataset.name
+        if name is not None:
+            self.name = name
+
+        self.n_instances = len(self.y)
+        self.n_features = dataset.n_features if columns is None \
+            else columns.size
+        self.n_queries = len(self.query_ids) - 1
+
+    @property
+    def X(self):
+        """
+        The feature matrix of the view. It is a slice of the original matrix
+        if the view selects all the features of contiguous queries, otherwise
+        it is materialized (and cached) the first time it is accessed.
+        """
+        if self._X is None and self.dataset is not None:
+            if self._rows is None:
+                X = _row_slice(self.dataset.X, self._start, self._end)
+                if self.columns is not None:
+                    X = np.ascontiguousarray(X[:, self.columns])
+            elif self.columns is None:
+                X = self.dataset.X[self._rows]
+            elif isinstance(self.dataset.X,
+                            (CompressedMatrix, ChunkedMatrix)):
+                X = self.dataset.X[self._rows][:, self.columns]
+            else:
+                X = self.dataset.X[np.ix_(self._rows, self.columns)]
+            self._X = X
+        return self._X
+
+    @X.setter
+    def X(self, X):
+        self._X = X
+
+    def clear_X(self):
+        """
+        This method clears the space used by the view for storing X: the
+        materialized matrix and the reference to the original dataset are
+        dropped, thus X is None afterwards.
+        """
+        self._X = None
+        self.dataset = None
+
+    def is_materialized(self):
+        """
+        Returns True if the feature matrix of the view has been materialized
+        (or it is a slice of the original matrix).
+        """
+        return self._X is not None
+
+    def scoring_matrix(self):
+        """
+        Returns the feature matrix to use for scoring the view, along with the
+        columns of the matrix storing the features of the view. If the view
+        selects contiguous queries and its matrix has not been materialized
+        yet, the rows of the original matrix are returned (without copy).
+
+        Returns
+        -------
+        X : numpy 2d array of float
+            The feature matrix to score
+        columns : None or numpy 1d array of int
+            The column of X storing each feature (column) of the view. None
+            means that X is the feature matrix of the view.
+        """
+        if self._X is None and self._rows is None and \
+                self.dataset is not None:
+            return _row_slice(self.dataset.X, self._start, self._end), \
+                self.columns
+        return self.X, None
+
+    def materialize(self, name=None):
+        """
+        Create a new (independent) Dataset with a copy of the data selected by
+        the view.
+
+        Parameters
+        ----------
+        name : str
+            The name to be given to the dataset
+
+        Returns
+        -------
+        dataset : Dataset
+            The dataset storing a copy of the data of the view
+        """
+        return Dataset(np.array(self.X, order='C'), self.y.copy(),
+                       self.query_ids.copy(),
+                       name=self.name if name is None else name,
+                       features=self.features, qids=self.qids.copy())
+
+
+def _row_slice(X, start, end):
+    if isinstance(X, (CompressedMatrix, ChunkedMatrix)):
+        return X.rows(start, end)
+    return X[start:end]
+
+
+def _group_runs(X, y, query_ids, qids):
+    """
+    Group the rows of the queries whose rows are not contiguous (e.g., a qid
+    appearing in several runs of lines of a svmlight file), given the offsets
+    and the qid of each run. The queries are kept in order of first
+    appearance and the rows of each query in their original order. The data
+    are returned as they are if each qid appears in a single run.
+    """
+    qids = np.asarray(qids)
+    unique, first_runs, inverse = np.unique(qids, return_index=True,
+                                            return_inverse=True)
+    if unique.size == qids.size:
+        return X, y, query_ids, qids
+
+    # rank each query by its first run, and sort the runs by rank (stable)
+    ranks = np.empty(unique.size, dtype=np.intp)
+    ranks[np.argsort(first_runs)] = np.arange(unique.size)
+    run_order = np.argsort(ranks[inverse], kind='mergesort')
+    query_ids = np.asarray(query_ids, dtype=np.int64)
+    sizes = np.diff(query_ids)[run_order]
+    starts = query_ids[:-1][run_order]
+    order = np.repeat(starts - (np.cumsum(sizes) - sizes), sizes) + \
+        np.arange(sizes.sum())
+
+    query_sizes = np.bincount(ranks[inverse], weights=np.diff(query_ids),
+                              minlength=unique.size).astype(np.int64)
+    return X[order], y[order], np.append(0, np.cumsum(query_sizes)), \
+        qids[np.sort(first_runs)]
+
+
+def _group_queries(row_qids):
+    """
+    Returns the offsets of the queries and the id of each query, given the
+    query id of each row. If the rows of a query are not contiguous, also the
+    (stable) order of the rows grouping them by query is returned (None
+    otherwise), keeping the queries in order of first appearance.
+    """
+    row_qids = np.asarray(row_qids)
+    starts = np.flatnonzero(np.r_[True, row_qids[1:] != row_qids[:-1]]) \
+        if row_qids.size else np.empty(0, dtype=np.intp)
+    qids = row_qids[starts]
+    order = None
+    if np.unique(qids).size != qids.size:
+        # the queries are interleaved: rank each query by its first row
+        _, first_rows, inverse = np.unique(row_qids, return_index=True,
+                                           return_inverse=True)
+        ranks = np.empty(first_rows.size, dtype=np.intp)
+        ranks[np.argsort(first_rows)] = np.arange(first_rows.size)
+        order = np.argsort(ranks[inverse], kind='mergesort')
+        row_qids = row_qids[order]
+        starts = np.flatnonzero(np.r_[True, row_qids[1:] != row_qids[:-1]])
+        qids = row_qids[starts]
+    return np.append(starts, row_qids.size), qids, order
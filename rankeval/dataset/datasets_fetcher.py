@@ -8,9 +8,12 @@
 import os
 import six
 import json
+import time
 import shutil
+import hashlib
 import tarfile
 import fnmatch
+from multiprocessing.pool import ThreadPool
 from os import environ
 from os import makedirs
 from os.path import exists
@@ -21,15 +24,63 @@ from .dataset import Dataset
 from .dataset_container import DatasetContainer
 
 if six.PY3:
-    from urllib.request import urlopen
+    from urllib.request import urlopen, Request
+    from urllib.error import HTTPError, URLError
 else:
-    from urllib2 import urlopen
+    from urllib2 import urlopen, Request, HTTPError, URLError
 
+CATALOGUE_URL = "http://rankeval.isti.cnr.it/rankeval-datasets/dataset_dictionary.json"
+CATALOGUE_FILE = "dataset_dictionary.json"
+# seconds a cached catalogue is used before fetching it again
+CATALOGUE_TTL = 24 * 60 * 60
+# size in bytes of the chunks archives are downloaded by
+CHUNK_BYTES = 1 << 20
+PARTIAL_SUFFIX = ".part"
 
-def __dataset_catalogue__():
-    resource_path = "http://rankeval.isti.cnr.it/rankeval-datasets/dataset_dictionary.json"
-    json_file = urlopen(resource_path)
-    data = json.load(json_file)
+
+def __dataset_catalogue__(data_home=None, url=None, ttl=CATALOGUE_TTL,
+                          offline=False):
+    """
+    Return the catalogue of the available datasets. The catalogue is cached
+    in the data dir, and it is fetched again only when the cached copy is
+    older than ttl seconds. If the catalogue cannot be fetched (e.g., no
+    network is available), a stale cached copy is used.
+
+    Parameters
+    ----------
+    data_home : optional, None by default.
+        The data folder storing the cached catalogue (see __get_data_home__).
+    url : optional, None by default.
+        The url of the catalogue. If None, CATALOGUE_URL is used.
+    ttl : optional, CATALOGUE_TTL by default.
+        The number of seconds the cached catalogue is considered fresh.
+    offline : optional, False by default.
+        If True, the cached catalogue is used whatever its age, and an
+        IOError is raised if it is missing.
+    """
+    cached_file = join(__get_data_home__(data_home), CATALOGUE_FILE)
+    if exists(cached_file):
+        age = time.time() - os.path.getmtime(cached_file)
+        if offline or age < ttl:
+            with open(cached_file, 'r') as f:
+                return json.load(f)
+    elif offline:
+        raise IOError('dataset catalogue not found')
+
+    try:
+        content = urlopen(url or CATALOGUE_URL).read()
+        data = json.loads(content.decode('utf-8'))
+    except (URLError, IOError, ValueError):
+        if not exists(cached_file):
+            raise
+        # the stale copy is better than nothing
+        with open(cached_file, 'r') as f:
+            return json.load(f)
+
+    tmp_file = "%s.%d%s" % (cached_file, os.getpid(), PARTIAL_SUFFIX)
+    with open(tmp_file, 'wb') as f:
+        f.write(content)
+    os.rename(tmp_file, cached_file)
     return data
 
 
@@ -54,10 +105,17 @@ def __get_data_home__(data_home=None):
 
 
 def __fetch_dataset_and_models__(dataset_dictionary, fold=None, data_home=None,
-                                 download_if_missing=True, force_download=True,
+                                 download_if_missing=True, force_download=False,
                                  with_models=True):
     """ Download a given dataset (and models, if needed).
 
+    The dataset and the models are downloaded and extracted concurrently,
+    and the binary sidecar cache of each split (see Dataset.load) is built
+    right after the extraction. An interrupted download is resumed by the
+    next call, and the archives are verified against the checksums of the
+    catalogue (DATASET_CHECKSUM and MODELS_CHECKSUM), if any. Nothing is
+    downloaded if the data are already on disk.
+
     Parameters
     ----------
     dataset_dictionary : mandatory.
@@ -84,7 +142,7 @@ def __fetch_dataset_and_models__(dataset_dictionary, fold=None, data_home=None,
     models_home = os.path.join(data_home, "models")
 
     # DATASET
-    if not download_if_missing and not os.path.exists(data_home):
+    if not download_if_missing and not os.path.exists(dataset_home):
         raise IOError('dataset not found')
 
     if (fold is not None) and (dataset_dictionary.get('COMMON_SUBFOLDER_NAME') is None):
@@ -96,9 +154,12 @@ def __fetch_dataset_and_models__(dataset_dictionary, fold=None, data_home=None,
             shutil.rmtree(data_home)
             os.makedirs(data_home)
 
-    # preparing file names...
-    archive_name = os.path.join(dataset_home, dataset_dictionary['DATASET_ARCHIVE_NAME'])
-    models_archive_name = os.path.join(models_home, dataset_dictionary['MODELS_ARCHIVE_NAME'])
+    # preparing file names (the archives are stored next to the folders
+    # they are extracted in, which exist only when complete)...
+    if not os.path.exists(data_home):
+        os.makedirs(data_home)
+    archive_name = os.path.join(data_home, dataset_dictionary['DATASET_ARCHIVE_NAME'])
+    models_archive_name = os.path.join(data_home, dataset_dictionary['MODELS_ARCHIVE_NAME'])
 
     if fold is None:
         train_file_path = os.path.join(dataset_home, dataset_dictionary['TRAIN_FILE'])
@@ -116,24 +177,39 @@ def __fetch_dataset_and_models__(dataset_dictionary, fold=None, data_home=None,
     # everything will be stored in a dictionary to return
     data = dict()
 
-    dataset_already_downloaded = False
-    if os.path.exists(dataset_home):
-        dataset_already_downloaded = True
-
-    if not dataset_already_downloaded:
-        os.makedirs(dataset_home)
-
-        print "Downloading dataset. This may take a few minutes."
-
-        data_url = dataset_dictionary['DATASET_URL']
-        print "Downloading dataset from %s " % data_url
-        opener = urlopen(data_url)
-        with open(archive_name, 'wb') as f:
-            f.write(opener.read())
-
-        print "Decompressing %s" % archive_name
-        tarfile.open(archive_name, "r:gz").extractall(path=dataset_home)
-        os.remove(archive_name)
+    split_files = [train_file_path, test_file_path]
+    if dataset_dictionary.get('VALIDATION_FILE') is not None:
+        split_files.append(validation_file_path)
+
+    def fetch_dataset():
+        print "Downloading dataset from %s " % dataset_dictionary['DATASET_URL']
+        __fetch_archive__(dataset_dictionary['DATASET_URL'], archive_name,
+                          dataset_home,
+                          dataset_dictionary.get('DATASET_CHECKSUM'))
+        if dataset_dictionary['DATASET_FORMAT'] == "svmlight":
+            print "Building the binary caches of the dataset"
+            Dataset.load_many(split_files, format="svmlight", cache=True)
+
+    def fetch_models():
+        print "Downloading letor models from %s" % dataset_dictionary['MODELS_URL']
+        __fetch_archive__(dataset_dictionary['MODELS_URL'],
+                          models_archive_name, models_home,
+                          dataset_dictionary.get('MODELS_CHECKSUM'))
+
+    tasks = []
+    if not os.path.exists(dataset_home):
+        tasks.append(fetch_dataset)
+    if with_models and download_if_missing and not os.path.exists(models_home):
+        tasks.append(fetch_models)
+
+    if tasks:
+        print "Downloading data. This may take a few minutes."
+        pool = ThreadPool(len(tasks))
+        try:
+            pool.map(lambda task: task(), tasks)
+        finally:
+            pool.close()
+            pool.join()
 
     license_agreement = ""
     if dataset_dictionary.get('LICENSE_FILE') is not None:
@@ -153,24 +229,6 @@ def __fetch_dataset_and_models__(dataset_dictionary, fold=None, data_home=None,
 
     # MODELS
     if with_models is True:
-        models_already_downloaded = False
-        if os.path.exists(models_home):
-            models_already_downloaded = True
-
-        if not models_already_downloaded:
-            os.makedirs(models_home)
-
-            models_url = dataset_dictionary['MODELS_URL']
-            print "Downloading letor models from %s" % models_url
-            opener = urlopen(models_url)
-            with open(models_archive_name, 'wb') as f:
-                f.write(opener.read())
-
-            print "Decompressing %s" % models_archive_name
-            tarfile.open(models_archive_name, "r:gz").extractall(
-                path=models_home)
-            os.remove(models_archive_name)
-
         # filling data structure to return
         matches = []
         if fold is None:
@@ -187,12 +245,102 @@ def __fetch_dataset_and_models__(dataset_dictionary, fold=None, data_home=None,
     return data
 
 
+def __download__(url, path, checksum=None, chunk_bytes=CHUNK_BYTES):
+    """ Download a file in streaming, by chunks, resuming a previous
+    interrupted download if any.
+
+    The content is written on a partial file (the given path with the
+    PARTIAL_SUFFIX suffix), which is renamed to path once the download is
+    complete and verified. If the partial file already exists, only the
+    missing bytes are requested (by an HTTP Range request); the download
+    starts over if the server does not support ranges.
+
+    Parameters
+    ----------
+    url : mandatory.
+        The url of the file to download.
+    path : mandatory.
+        The path of the downloaded file.
+    checksum : optional, None by default.
+        The expected checksum of the file, as "<algorithm>:<hex digest>"
+        (e.g., "sha256:..."), with any algorithm supported by hashlib. An
+        IOError is raised (and the partial file deleted) if it does not match.
+    chunk_bytes : optional, CHUNK_BYTES by default.
+        The size in bytes of the chunks the file is read and written by.
+    """
+    partial_path = path + PARTIAL_SUFFIX
+    digest = None
+    if checksum is not None:
+        algorithm, expected = checksum.split(':', 1)
+        digest = hashlib.new(algorithm)
+
+    offset = os.path.getsize(partial_path) if exists(partial_path) else 0
+    request = Request(url)
+    if offset:
+        request.add_header('Range', 'bytes=%d-' % offset)
+    try:
+        response = urlopen(request)
+    except HTTPError as e:
+        if e.code != 416:
+            raise
+        # the range is not satisfiable: download the whole file again
+        offset = 0
+        response = urlopen(Request(url))
+    if response.getcode() != 206:
+        offset = 0
+
+    try:
+        with open(partial_path, 'r+b' if offset else 'wb') as f:
+            if offset and digest is not None:
+                # the hash of the bytes already downloaded
+                for chunk in iter(lambda: f.read(chunk_bytes), b''):
+                    digest.update(chunk)
+            f.seek(offset)
+            f.truncate()
+            for chunk in iter(lambda: response.read(chunk_bytes), b''):
+                if digest is not None:
+                    digest.update(chunk)
+                f.write(chunk)
+    finally:
+        response.close()
+
+    if digest is not None and digest.hexdigest() != expected.lower():
+        os.remove(partial_path)
+        raise IOError('checksum mismatch for %s' % url)
+    os.rename(partial_path, path)
+    return path
+
+
+def __fetch_archive__(url, archive_name, destination, checksum=None):
+    """ Download (or resume the download of) a tar.gz archive and extract
+    it in the destination folder. The archive is extracted in a temporary
+    folder, renamed to destination once the extraction is complete, thus the
+    destination folder exists only if it is complete.
+    """
+    __download__(url, archive_name, checksum)
+
+    print "Decompressing %s" % archive_name
+    extraction_home = destination + PARTIAL_SUFFIX
+    if os.path.exists(extraction_home):
+        shutil.rmtree(extraction_home)
+    with tarfile.open(archive_name, "r:gz") as archive:
+        archive.extractall(path=extraction_home)
+    os.rename(extraction_home, destination)
+    os.remove(archive_name)
+
+
 def load_dataset(dataset_name, fold=None, download_if_missing=True,
-                 force_download=False, with_models=True):
+                 force_download=False, with_models=True, data_home=None,
+                 offline=False, catalogue_url=None):
     """
     The method allow to download a given dataset (and available models)
     by providing its name.
 
+    The catalogue of the datasets is cached in the data folder (and fetched
+    again after CATALOGUE_TTL seconds), the files are downloaded only the
+    first time and the splits are loaded from their binary caches, thus the
+    following calls neither access the network nor parse the dataset files.
+
     Datasets and models are available at the following link:
         http://rankeval.isti.cnr.it/rankeval-datasets/dataset_dictionary.json
 
@@ -213,16 +361,26 @@ def load_dataset(dataset_name, fold=None, download_if_missing=True,
     with_models : optional, True by default.
         When True, the method downloads the models generated with different
         tools (QuickRank, LightGBM, XGBoost, etc.) to ease the comparison.
+    data_home : optional, None by default.
+        Specify a data folder for the datasets (see __get_data_home__).
+    offline : optional, False by default.
+        If True, the network is never accessed: the cached catalogue is used
+        whatever its age, and an IOError is raised if the data is not locally
+        available.
+    catalogue_url : optional, None by default.
+        The url of the catalogue of the datasets. If None, CATALOGUE_URL is
+        used.
     """
-    dataset_catalogue = __dataset_catalogue__()
+    data_home = __get_data_home__(data_home)
+    dataset_catalogue = __dataset_catalogue__(data_home, url=catalogue_url,
+                                              offline=offline)
     dataset_dictionary = dataset_catalogue.get(dataset_name)
     if dataset_dictionary is None:
         return None
 
-    data_home = __get_data_home__()
     data = __fetch_dataset_and_models__(dataset_dictionary, fold, data_home,
-                                        download_if_missing,
-                                        force_download,
+                                        download_if_missing and not offline,
+                                        force_download and not offline,
                                         with_models)
 
     dataset_name = dataset_dictionary['DATASET_NAME']
@@ -232,17 +390,16 @@ def load_dataset(dataset_name, fold=None, download_if_missing=True,
 
     print "Loading files. This may take a few minutes."
 
-    if data.get('train') is not None:
-        train_dataset = Dataset.load(data['train'], name=dataset_name + "_train", format=dataset_format)
-        container.train_dataset = train_dataset
-
-    if data.get('test') is not None:
-        test_dataset = Dataset.load(data['test'], name=dataset_name + "_test", format=dataset_format)
-        container.test_dataset = test_dataset
-
-    if data.get('validation') is not None:
-        validation_dataset = Dataset.load(data['validation'], name=dataset_name + "_validation", format=dataset_format)
-        container.validation_dataset = validation_dataset
+    # the splits are loaded concurrently
+    splits = [split for split in ['train', 'test', 'validation']
+              if data.get(split) is not None]
+    datasets = Dataset.load_many([data[split] for split in splits],
+                                 names=[dataset_name + "_" + split
+                                        for split in splits],
+                                 format=dataset_format,
+                                 cache=dataset_format == "svmlight")
+    for split, dataset in zip(splits, datasets):
+        setattr(container, split + "_dataset", dataset)
 
     container.license_agreement = data['license_agreement']
 
@@ -0,0 +1,230 @@
+# Copyright (c) 2017, All Contributors (see CONTRIBUTORS file)
+# Authors: Salvatore Trani <salvatore.trani@isti.cnr.it>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+This module implements mergeable per-feature statistics (min, max, mean,
+standard deviation, fraction of zeros and quantiles) of a feature matrix.
+
+The statistics are computed in a single pass over blocks of rows, thus the
+columns of the (row-major) matrix are never materialized. The quantiles are
+estimated by a KLL-style sketch: a hierarchy of compactors, where the items of
+level i weigh 2^i, and a full level is sorted and halved (keeping every other
+item, starting from a random one) into the next level. All the features are
+sketched together (each column of a level is the compactor of a feature).
+Sketches built on different blocks, batches or shards of a dataset are merged
+into the sketch of the whole dataset.
+"""
+
+import numpy as np
+import xarray as xr
+
+# default quantiles reported by describe
+QUANTILES = (0.25, 0.5, 0.75)
+
+
+class FeatureSketch(object):
+    """
+    Mergeable summary of the values of each feature of a dataset.
+
+    Attributes
+    ----------
+    n_features : int
+        The number of features (columns) summarized
+    capacity : int
+        The number of items each level of the quantile sketch stores before
+        being compacted. The rank error of the quantiles is about
+        log2(count / capacity) / capacity.
+    count : int
+        The number of rows summarized
+    min : numpy 1d array of float
+        The minimum value of each feature
+    max : numpy 1d array of float
+        The maximum value of each feature
+    sum : numpy 1d array of float
+        The sum of the values of each feature
+    sum_squares : numpy 1d array of float
+        The sum of the squared values of each feature
+    zeros : numpy 1d array of int
+        The number of zero values of each feature
+    """
+
+    def __init__(self, n_features, capacity=1024, seed=None):
+        """
+        Create an empty sketch.
+
+        Parameters
+        ----------
+        n_features : int
+            The number of features (columns) to summarize
+        capacity : int
+            The number of items of each level of the quantile sketch
+        seed : None or int
+            The seed of the random number generator used by the compactions
+        """
+        if capacity < 2:
+            raise ValueError("capacity should be at least 2, got %r"
+                             % capacity)
+        self.n_features = n_features
+        self.capacity = capacity
+        self.count = 0
+        self.min = np.full(n_features, np.inf, dtype=np.float64)
+        self.max = np.full(n_features, -np.inf, dtype=np.float64)
+        self.sum = np.zeros(n_features, dtype=np.float64)
+        self.sum_squares = np.zeros(n_features, dtype=np.float64)
+        self.zeros = np.zeros(n_features, dtype=np.int64)
+        # the items of the i-th level weigh 2^i
+        self._levels = []
+        self._random_state = np.random.RandomState(seed)
+
+    def update(self, X):
+        """
+        Add the given rows to the sketch.
+
+        Parameters
+        ----------
+        X : numpy 2d array of float
+            A block of rows (n_rows, n_features)
+
+        Returns
+        -------
+        sketch : FeatureSketch
+            The sketch itself
+        """
+        X = np.asarray(X)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError("The block should have %d columns"
+                             % self.n_features)
+        if not X.shape[0]:
+            return self
+        self.count += X.shape[0]
+        np.minimum(self.min, X.min(axis=0), out=self.min)
+        np.maximum(self.max, X.max(axis=0), out=self.max)
+        self.sum += X.sum(axis=0, dtype=np.float64)
+        self.sum_squares += np.square(X, dtype=np.float64).sum(axis=0)
+        self.zeros += np.count_nonzero(X == 0, axis=0)
+        # the block may be a reused buffer (e.g., CompressedMatrix.iter_blocks)
+        self._insert(0, np.array(X, dtype=np.float32))
+        return self
+
+    def merge(self, other):
+        """
+        Merge the given sketch into this sketch, which then summarizes the
+        rows of both the sketches.
+
+        Parameters
+        ----------
+        other : FeatureSketch
+            The sketch to merge (e.g., the one of another shard)
+
+        Returns
+        -------
+        sketch : FeatureSketch
+            The sketch itself
+        """
+        if other.n_features != self.n_features:
+            raise ValueError("The sketches summarize a different number of "
+                             "features")
+        self.count += other.count
+        np.minimum(self.min, other.min, out=self.min)
+        np.maximum(self.max, other.max, out=self.max)
+        self.sum += other.sum
+        self.sum_squares += other.sum_squares
+        self.zeros += other.zeros
+        for level, items in enumerate(other._levels):
+            if items.shape[0]:
+                self._insert(level, items.copy())
+        return self
+
+    def quantiles(self, quantiles=QUANTILES):
+        """
+        Estimate the given quantiles of each feature.
+
+        Parameters
+        ----------
+        quantiles : list of float
+            The quantiles to estimate (in [0, 1])
+
+        Returns
+        -------
+        values : numpy 2d array of float
+            The estimated quantiles (n_quantiles, n_features)
+        """
+        quantiles = np.asarray(quantiles, dtype=np.float64)
+        values = np.full((quantiles.size, self.n_features), np.nan,
+                         dtype=np.float64)
+        if not self.count:
+            return values
+
+        items = np.concatenate(self._levels)
+        weights = np.concatenate([np.full(level.shape[0], 2 ** i,
+                                          dtype=np.float64)
+                                  for i, level in enumerate(self._levels)])
+        columns = np.arange(self.n_features)
+        order = np.argsort(items, axis=0, kind='mergesort')
+        items = items[order, columns]
+        ranks = np.cumsum(weights[order], axis=0)
+        for i, quantile in enumerate(quantiles):
+            positions = np.count_nonzero(ranks < quantile * ranks[-1], axis=0)
+            values[i] = items[np.minimum(positions, items.shape[0] - 1),
+                              columns]
+        # the extremes are known exactly
+        values[quantiles <= 0] = self.min
+        values[quantiles >= 1] = self.max
+        return values
+
+    def describe(self, quantiles=QUANTILES, features=None):
+        """
+        Returns the statistics of each feature.
+
+        Parameters
+        ----------
+        quantiles : list of float
+            The quantiles to report
+        features : None or list of int
+            The ids of the summarized features (None for 0..n_features-1)
+
+        Returns
+        -------
+        statistics : xarray.DataArray
+            A DataArray with the min, max, mean, standard deviation, fraction
+            of zeros and the quantiles (named "q<quantile>") of each feature.
+        """
+        if features is None:
+            features = np.arange(self.n_features)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = self.sum / self.count
+            std = np.sqrt(np.maximum(self.sum_squares / self.count - mean ** 2,
+                                     0))
+            zero_fraction = self.zeros / float(self.count)
+        data = np.vstack([self.min, self.max, mean, std, zero_fraction,
+                          self.quantiles(quantiles)]).T
+        statistics = ['min', 'max', 'mean', 'std', 'zero_fraction'] + \
+            ['q%g' % quantile for quantile in quantiles]
+
+        return xr.DataArray(data,
+                            name='Feature Statistics',
+                            coords=[np.asarray(features), statistics],
+                            dims=['feature', 'statistic'])
+
+    def _insert(self, level, items):
+        while True:
+            if level == len(self._levels):
+                self._levels.append(np.empty((0, self.n_features),
+                                             dtype=np.float32))
+            if self._levels[level].shape[0]:
+                items = np.concatenate([self._levels[level], items])
+            if items.shape[0] <= self.capacity:
+                self._levels[level] = items
+                return
+            # compact the level: each column is sorted and every other item
+            # is promoted to the next level (an odd item stays in the level)
+            items.sort(axis=0)
+            odd = items.shape[0] % 2
+            self._levels[level] = items[items.shape[0] - odd:].copy()
+            offset = self._random_state.randint(2)
+            items = np.ascontiguousarray(items[offset:items.shape[0] - odd:2])
+            level += 1
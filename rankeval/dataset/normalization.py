@@ -0,0 +1,110 @@
+# Copyright (c) 2017, All Contributors (see CONTRIBUTORS file)
+# Authors: Salvatore Trani <salvatore.trani@isti.cnr.it>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+This module implements the (in-place) normalization of the feature matrix of
+a dataset, either within each query or over the whole dataset.
+
+The per-query statistics are computed with segmented reductions over the
+query offsets (e.g., np.minimum.reduceat), without any per-query loop. The
+matrix is processed by blocks of whole queries, thus the temporary arrays
+are bounded by the block size and no second copy of the matrix is allocated.
+"""
+
+import numpy as np
+
+from .query_batches import query_batch_bounds
+
+# the supported normalization methods
+METHODS = ["query_minmax", "query_zscore", "global_zscore"]
+
+# default size (in bytes) of the blocks of rows processed at a time
+BLOCK_BYTES = 16 << 20
+
+
+def normalize_features(X, query_ids, method="query_minmax",
+                       block_bytes=BLOCK_BYTES):
+    """
+    Normalize the feature matrix in place. Features having the same value
+    for all the instances of a query (of the dataset, for "global_zscore")
+    are normalized to 0.
+
+    Parameters
+    ----------
+    X : numpy 2d array of float
+        The (writeable) feature matrix to normalize
+    query_ids : numpy 1d array of int
+        The offsets of the queries (n_queries+1)
+    method : str
+        The normalization to apply: "query_minmax" scales the values of each
+        feature in [0, 1] within each query, "query_zscore" standardizes them
+        (zero mean and unit variance) within each query and "global_zscore"
+        standardizes them over the whole dataset.
+    block_bytes : int
+        The size in bytes of the blocks of rows processed at a time
+
+    Returns
+    -------
+    X : numpy 2d array of float
+        The normalized feature matrix (the given one)
+    """
+    if method not in METHODS:
+        raise TypeError("Normalization %s is not supported!" % method)
+    if method == "global_zscore":
+        return _global_zscore(X, block_bytes)
+
+    query_ids = np.asarray(query_ids)
+    bounds = query_batch_bounds(query_ids, X.shape[1] * X.itemsize,
+                                block_bytes)
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        block = X[query_ids[start]:query_ids[end]]
+        # reduceat does not support empty segments
+        sizes = np.diff(query_ids[start:end + 1])
+        sizes = sizes[sizes > 0]
+        if not sizes.size:
+            continue
+        starts = np.cumsum(sizes) - sizes
+
+        if method == "query_minmax":
+            shift = np.minimum.reduceat(block, starts, axis=0)
+            block -= np.repeat(shift, sizes, axis=0)
+            scale = np.maximum.reduceat(block, starts, axis=0)
+        else:
+            shift = np.add.reduceat(block, starts, axis=0, dtype=np.float64)
+            shift /= sizes[:, None]
+            block -= np.repeat(shift.astype(X.dtype), sizes, axis=0)
+            scale = np.add.reduceat(np.square(block, dtype=np.float64),
+                                    starts, axis=0)
+            scale = np.sqrt(scale / sizes[:, None]).astype(X.dtype)
+        scale[scale == 0] = 1
+        block /= np.repeat(scale, sizes, axis=0)
+    return X
+
+
+def _global_zscore(X, block_bytes):
+    n_rows = X.shape[0]
+    if not n_rows:
+        return X
+    block_rows = max(block_bytes // max(X.shape[1] * X.itemsize, 1), 1)
+    blocks = [(start, min(start + block_rows, n_rows))
+              for start in range(0, n_rows, block_rows)]
+
+    mean = np.zeros(X.shape[1], dtype=np.float64)
+    for start, end in blocks:
+        mean += X[start:end].sum(axis=0, dtype=np.float64)
+    mean /= n_rows
+
+    variance = np.zeros(X.shape[1], dtype=np.float64)
+    for start, end in blocks:
+        X[start:end] -= mean.astype(X.dtype)
+        variance += np.square(X[start:end], dtype=np.float64).sum(axis=0)
+    scale = np.sqrt(variance / n_rows).astype(X.dtype)
+    scale[scale == 0] = 1
+
+    for start, end in blocks:
+        X[start:end] /= scale
+    return X
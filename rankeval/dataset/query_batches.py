@@ -0,0 +1,167 @@
+# Copyright (c) 2017, All Contributors (see CONTRIBUTORS file)
+# Authors: Salvatore Trani <salvatore.trani@isti.cnr.it>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+This module implements the iteration over a dataset by batches of queries,
+allowing to score and evaluate collections that do not fit in memory.
+
+Each batch stores whole queries (a query is never split across batches) and
+its feature matrix is at most max_bytes bytes (unless a single query is
+bigger). Batches of an in-memory or memory mapped dataset are slices of its
+arrays (see Dataset.iter_batches), while svmlight files are parsed in
+streaming, by blocks, so that only a block at a time is held in memory.
+"""
+
+import numpy as np
+import six
+
+from ._svmlight_format import _load_svmlight_buffer
+from .svmlight_format import _columns_map, _decompressed_blocks, \
+    _infer_compression, _line_blocks, _threaded, pad_features
+
+# default size (in bytes) of the feature matrix of a batch
+BATCH_BYTES = 64 << 20
+
+
+def query_batch_bounds(query_ids, row_bytes, max_bytes=BATCH_BYTES):
+    """
+    Partition the queries in batches of contiguous queries, each one storing
+    at most max_bytes bytes (a query bigger than max_bytes is a batch on its
+    own).
+
+    Parameters
+    ----------
+    query_ids : numpy 1d array of int
+        The offsets of the queries (n_queries+1)
+    row_bytes : int
+        The size in bytes of a row (instance)
+    max_bytes : int
+        The maximum size in bytes of a batch
+
+    Returns
+    -------
+    bounds : numpy 1d array of int
+        The first query of each batch, followed by the number of queries,
+        i.e., the i-th batch stores the queries in the range
+        [bounds[i], bounds[i+1])
+    """
+    query_ids = np.asarray(query_ids)
+    n_queries = len(query_ids) - 1
+    max_rows = max(int(max_bytes // max(row_bytes, 1)), 1)
+    bounds = [0]
+    while bounds[-1] < n_queries:
+        start = bounds[-1]
+        end = np.searchsorted(query_ids, query_ids[start] + max_rows,
+                              side='right') - 1
+        bounds.append(min(max(end, start + 1), n_queries))
+    return np.array(bounds, dtype=np.int64)
+
+
+def iter_svmlight_batches(f, max_bytes=BATCH_BYTES, n_features=None,
+                          features=None, n_threads=None, compression="infer"):
+    """
+    Iterate over the queries of a svmlight file by batches, parsing the file
+    in streaming (see load_svmlight_file). The file is read and parsed by
+    blocks of about max_bytes bytes, thus the memory used does not depend on
+    the size of the file. The lines of each query have to be contiguous in the
+    file.
+
+    Parameters
+    ----------
+    f : str or file object
+        Path to the (possibly compressed) file, or a (binary) file object to
+        read from
+    max_bytes : int
+        The maximum size in bytes of the feature matrix of a batch
+    n_features : None or int
+        The number of features (columns) of the batches. If None, each batch
+        has as many columns as the highest feature id of its block of the file,
+        thus the batches may have a different number of columns.
+    features : None or list of int
+        The (0-based) ids of the features to load (see load_svmlight_file)
+    n_threads : None or int
+        The number of threads to use for parsing each block
+    compression : str or None
+        The compression of the file (see load_svmlight_file)
+
+    Returns
+    -------
+    (X, y, query_ids, qids)
+
+    for each batch, where X is a dense numpy matrix of shape
+    (n_samples, n_features), y is a ndarray of shape (n_samples,), query_ids is
+    a ndarray of shape (n_queries+1,) with the offsets of the queries of the
+    batch and qids is a ndarray of shape (n_queries,) with the qid of each
+    query.
+    """
+    columns_map, n_features = _columns_map(features, n_features)
+    if isinstance(f, six.string_types):
+        if compression == "infer":
+            compression = _infer_compression(f)
+        with open(f, "rb") as f_in:
+            for batch in _svmlight_stream_batches(
+                    f_in, compression, max_bytes, n_features, columns_map,
+                    n_threads):
+                yield batch
+    else:
+        if compression == "infer":
+            compression = _infer_compression(getattr(f, "name", ""))
+        for batch in _svmlight_stream_batches(
+                f, compression, max_bytes, n_features, columns_map,
+                n_threads):
+            yield batch
+
+
+def _svmlight_stream_batches(f_in, compression, max_bytes, n_features,
+                             columns_map, n_threads):
+    blocks = _threaded(_decompressed_blocks(f_in, compression))
+    # the rows of the last query parsed, which may continue in the next block
+    carry = None
+    for block in _line_blocks(blocks, max(max_bytes, 1)):
+        data, labels, offsets, qids = _load_svmlight_buffer(
+            block, n_threads or 0, n_features or 0, columns_map)
+        del block
+        if not labels.size:
+            continue
+        if not offsets.size:
+            raise RuntimeError("error in SVMlight/libSVM reader: "
+                               "Missing qid label")
+        X = data.reshape(labels.size, -1)
+        y = labels
+        offsets = offsets.astype(np.int64)
+
+        if carry is not None:
+            X_carry, y_carry, qid_carry = carry
+            n_columns = max(X.shape[1], X_carry.shape[1])
+            X = np.concatenate([pad_features(X_carry, n_columns),
+                                pad_features(X, n_columns)])
+            y = np.concatenate([y_carry, y])
+            if qids[0] == qid_carry:
+                # the first query of the block continues the carried one
+                offsets = np.append(0, offsets[1:] + y_carry.size)
+            else:
+                offsets = np.append(0, offsets + y_carry.size)
+                qids = np.append(qid_carry, qids)
+        carry = (X[offsets[-2]:].copy(), y[offsets[-2]:].copy(), qids[-1])
+
+        # all the queries but the last one are complete
+        for batch in _split_batches(X, y, offsets[:-1], qids[:-1], max_bytes):
+            yield batch
+        del X, y, data, labels
+
+    if carry is not None:
+        X_carry, y_carry, qid_carry = carry
+        yield (X_carry, y_carry, np.array([0, y_carry.size], dtype=np.int64),
+               np.array([qid_carry], dtype=np.int64))
+
+
+def _split_batches(X, y, offsets, qids, max_bytes):
+    bounds = query_batch_bounds(offsets, X.shape[1] * X.itemsize, max_bytes)
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        first, last = offsets[start], offsets[end]
+        yield (X[first:last], y[first:last], offsets[start:end + 1] - first,
+               np.asarray(qids[start:end], dtype=np.int64))
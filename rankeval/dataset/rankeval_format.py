@@ -0,0 +1,334 @@
+# Copyright (c) 2017, All Contributors (see CONTRIBUTORS file)
+# Authors: Salvatore Trani <salvatore.trani@isti.cnr.it>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+This module implements the rankeval binary format, used for storing a dataset
+(features, labels, query offsets and, optionally, the original query ids) in a
+file that can be memory mapped
+instead of parsed.
+
+The file starts with a magic string and the length of a JSON header, reporting
+the shape, dtype and position of each array and, optionally, the size, mtime
+and hash of the source file the dataset has been parsed from. The arrays
+follow the header, each one aligned to ALIGNMENT bytes. The feature matrix can
+be stored either by rows (default, memory mapped as is) or by columns
+(columnar layout), allowing to read only a subset of the features.
+
+The binary file can also be used as a sidecar cache of a text (svmlight) file:
+it is stored next to the source file and it is considered valid until the
+source file changes.
+"""
+
+import hashlib
+import json
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b"RANKEVAL"
+VERSION = 1
+ALIGNMENT = 64
+SIDECAR_SUFFIX = ".rankeval"
+
+_PREFIX = struct.Struct("<8sII")
+
+
+def load_rankeval_file(f, mmap=True, features=None):
+    """
+    Load a dataset stored in the rankeval binary format.
+
+    Parameters
+    ----------
+    f : str
+        Path to the file to load.
+    mmap : bool
+        Whether the arrays have to be memory mapped (copy-on-write, i.e., the
+        changes are not written back on file) or read in memory. A feature
+        matrix stored with the columnar layout is always read in memory (by
+        rows), as well as a subset of the features.
+    features : None or list of int
+        The ids of the features to load. If given, the i-th column of X stores
+        the feature features[i]. With the columnar layout, only the given
+        features are read from file.
+
+    Returns
+    -------
+    (X, y, query_ids, qids)
+
+    where X is a dense numpy matrix of shape (n_samples, n_features),
+          y is a ndarray of shape (n_samples,),
+          query_ids is a ndarray of shape (n_queries+1,) with the offsets of the
+          queries,
+          qids is a ndarray of shape (n_queries,) with the original id of each
+          query, or None if the file does not store them.
+    """
+    header = read_header(f)
+    columnar = header["arrays"]["X"].get("columnar", False)
+
+    columns = None
+    if features is not None:
+        columns = _feature_columns(features, header.get("features"))
+
+    arrays = []
+    for name in ["X", "y", "query_ids", "qids"]:
+        if name not in header["arrays"]:
+            arrays.append(None)
+            continue
+        info = header["arrays"][name]
+        shape = tuple(info["shape"])
+        if name == "X" and columnar:
+            n_samples, n_features = shape
+            X_t = _load_array(f, info, (n_features, n_samples), mmap=True)
+            if columns is None:
+                array = np.ascontiguousarray(X_t.T)
+            else:
+                # each feature is a contiguous block of the file
+                array = np.empty((n_samples, columns.size), dtype=X_t.dtype)
+                for i, column in enumerate(columns):
+                    array[:, i] = X_t[column]
+            del X_t
+        elif name == "X" and columns is not None:
+            X = _load_array(f, info, shape, mmap=True)
+            array = np.ascontiguousarray(X[:, columns])
+            del X
+        else:
+            array = _load_array(f, info, shape, mmap=mmap)
+        arrays.append(array)
+
+    return tuple(arrays)
+
+
+def dump_rankeval_file(X, y, query_ids, f, source=None, features=None,
+                       columnar=False, qids=None):
+    """
+    Dump the dataset in the rankeval binary format. The file is written
+    atomically, i.e., it is first written with a temporary name and then
+    renamed, so that concurrent readers never see a partial file.
+
+    Parameters
+    ----------
+    X : numpy 2d array of float
+        The matrix with feature values
+    y : numpy 1d array of float
+        The vector with label values
+    query_ids : numpy 1d array of int
+        The offsets of the queries (n_queries+1)
+    f : str
+        Path to the file to write
+    source : None or str
+        Path to the file the dataset has been loaded from. If given, its size,
+        mtime and hash are stored in the header, for validating the file as a
+        sidecar cache of the source.
+    features : None or list of int
+        The ids of the features stored in the columns of X, if X stores only a
+        subset of the features. If None, the i-th column stores the feature i.
+    columnar : bool
+        Whether the feature matrix has to be stored by columns (allowing to
+        read only a subset of the features) instead of by rows (allowing to
+        memory map the whole matrix without any copy).
+    qids : None or numpy 1d array of int
+        The original id of each query (n_queries)
+    """
+    X = np.asarray(X, dtype=np.float32)
+    arrays = [("X", np.ascontiguousarray(X.T if columnar else X)),
+              ("y", np.ascontiguousarray(y, dtype=np.float32)),
+              ("query_ids", np.ascontiguousarray(query_ids, dtype=np.int64))]
+    if qids is not None:
+        arrays.append(("qids", np.ascontiguousarray(qids, dtype=np.int64)))
+    # the shape of X is always reported by rows
+    extra_info = {"X": {"shape": list(X.shape), "columnar": columnar}}
+
+    header = {"version": VERSION,
+              "arrays": {},
+              "features": None,
+              "source": file_signature(source) if source else None}
+    if features is not None:
+        header["features"] = [int(feature) for feature in features]
+
+    # the offsets of the arrays depend on the header length: reserve enough
+    # room for the header, by computing it with the biggest offsets
+    json_len = len(_encode_header(header, arrays, extra_info, 2 ** 62))
+    data_start = _align(_PREFIX.size + json_len)
+    json_header = _encode_header(header, arrays, extra_info, data_start)
+    json_header += b" " * (data_start - _PREFIX.size - len(json_header))
+
+    tmp_file = "%s.tmp.%d" % (f, os.getpid())
+    try:
+        with open(tmp_file, 'wb') as f_out:
+            f_out.write(_PREFIX.pack(MAGIC, VERSION, len(json_header)))
+            f_out.write(json_header)
+            for name, array in arrays:
+                f_out.write(b"\0" * (_align(f_out.tell()) - f_out.tell()))
+                f_out.write(array.tobytes())
+        os.rename(tmp_file, f)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def read_header(f):
+    """
+    Read the header of a file stored in the rankeval binary format.
+
+    Parameters
+    ----------
+    f : str
+        Path to the file
+
+    Returns
+    -------
+    header : dict
+        The header of the file
+    """
+    with open(f, 'rb') as f_in:
+        prefix = f_in.read(_PREFIX.size)
+        if len(prefix) < _PREFIX.size:
+            raise ValueError("%s is not a rankeval binary file" % f)
+        magic, version, json_len = _PREFIX.unpack(prefix)
+        if magic != MAGIC:
+            raise ValueError("%s is not a rankeval binary file" % f)
+        if version > VERSION:
+            raise ValueError("Unsupported rankeval binary file version %d"
+                             % version)
+        return json.loads(f_in.read(json_len).decode("utf-8"))
+
+
+def sidecar_path(source):
+    """
+    Returns the path of the binary sidecar cache of the given source file.
+    """
+    return source + SIDECAR_SUFFIX
+
+
+def is_sidecar_valid(sidecar, source):
+    """
+    Check whether the sidecar cache is valid for the given source file. The
+    cache is valid if the source file has the same size and mtime it had when
+    the cache has been created. If only the mtime changed (e.g., the file has
+    been touched or copied), the hash of the content is compared.
+
+    Parameters
+    ----------
+    sidecar : str
+        Path to the sidecar cache
+    source : str
+        Path to the source file
+
+    Returns
+    -------
+    valid : bool
+        True if the sidecar can be used in place of the source file
+    """
+    if not os.path.exists(sidecar):
+        return False
+    try:
+        cached = read_header(sidecar)["source"]
+    except (ValueError, IOError, KeyError):
+        return False
+    return matches_signature(cached, source)
+
+
+def file_signature(source):
+    """
+    Returns the signature (size, mtime and md5 hash) of the given file, to be
+    stored in a sidecar file for checking whether the file changed.
+
+    Parameters
+    ----------
+    source : str
+        Path to the file
+
+    Returns
+    -------
+    signature : dict
+        The signature of the file
+    """
+    stat = os.stat(source)
+    return {"size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "md5": _file_hash(source)}
+
+
+def matches_signature(signature, source):
+    """
+    Check whether the file matches the given signature (see file_signature),
+    i.e., it has the same size and mtime. If only the mtime changed, the hash
+    of the content is compared.
+
+    Parameters
+    ----------
+    signature : dict
+        The signature of the file, as returned by file_signature
+    source : str
+        Path to the file
+
+    Returns
+    -------
+    valid : bool
+        True if the file did not change
+    """
+    if not signature:
+        return False
+    stat = os.stat(source)
+    if stat.st_size != signature["size"]:
+        return False
+    if stat.st_mtime == signature["mtime"]:
+        return True
+    return _file_hash(source) == signature["md5"]
+
+
+def _load_array(f, info, shape, mmap):
+    if mmap and np.prod(shape) > 0:
+        return np.memmap(f, dtype=info["dtype"], mode='c',
+                         offset=info["offset"], shape=shape)
+    with open(f, 'rb') as f_in:
+        f_in.seek(info["offset"])
+        array = np.fromfile(f_in, dtype=info["dtype"],
+                            count=int(np.prod(shape)))
+    array.shape = shape
+    return array
+
+
+def _feature_columns(features, stored_features):
+    """
+    Returns the columns of the stored matrix storing the given features.
+    """
+    features = np.asarray(features, dtype=np.int64)
+    if stored_features is None:
+        return features
+    stored_features = np.asarray(stored_features, dtype=np.int64)
+    order = np.argsort(stored_features)
+    positions = np.searchsorted(stored_features, features, sorter=order)
+    positions = np.minimum(positions, stored_features.size - 1)
+    columns = order[positions]
+    if not np.array_equal(stored_features[columns], features):
+        raise ValueError("Some of the features are not stored in the file")
+    return columns
+
+
+def _file_hash(source, block_size=1 << 20):
+    md5 = hashlib.md5()
+    with open(source, 'rb') as f_in:
+        for block in iter(lambda: f_in.read(block_size), b""):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def _encode_header(header, arrays, extra_info, offset):
+    for name, array in arrays:
+        offset = _align(offset)
+        header["arrays"][name] = {"dtype": array.dtype.str,
+                                  "shape": list(array.shape),
+                                  "offset": offset}
+        header["arrays"][name].update(extra_info.get(name, {}))
+        offset += array.nbytes
+    return json.dumps(header, sort_keys=True).encode("utf-8")
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
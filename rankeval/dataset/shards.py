@@ -0,0 +1,257 @@
+# Copyright (c) 2017, All Contributors (see CONTRIBUTORS file)
+# Authors: Salvatore Trani <salvatore.trani@isti.cnr.it>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+This module implements the query-sharded dataset format, allowing to split
+the evaluation of a dataset across several workers (e.g., machines).
+
+A dataset is partitioned in shards of contiguous queries (a query is never
+split), balanced by number of instances (documents) rather than by number of
+queries. Each shard is stored in the rankeval binary format (see
+rankeval_format), and a JSON manifest describes the shards: the file of each
+shard and the range of queries and instances it stores. Each worker loads only
+its shard, and the per-query results of the workers (e.g., the detailed scores
+of a metric) are merged back in the order of the queries of the whole dataset.
+"""
+
+import json
+import os
+
+import numpy as np
+
+from .rankeval_format import load_rankeval_file, dump_rankeval_file
+
+MANIFEST_VERSION = 1
+
+
+def shard_bounds(query_ids, n_shards):
+    """
+    Partition the queries in n_shards shards of contiguous queries, balanced
+    by number of instances. Each shard has at least one query.
+
+    Parameters
+    ----------
+    query_ids : numpy 1d array of int
+        The offsets of the queries (n_queries+1)
+    n_shards : int
+        The number of shards
+
+    Returns
+    -------
+    bounds : numpy 1d array of int
+        The first query of each shard, followed by the number of queries
+        (n_shards+1), i.e., the i-th shard stores the queries in the range
+        [bounds[i], bounds[i+1])
+    """
+    query_ids = np.asarray(query_ids)
+    n_queries = len(query_ids) - 1
+    if n_shards < 1 or n_shards > n_queries:
+        raise ValueError("The number of shards has to be between 1 and the "
+                         "number of queries (%d), got %r"
+                         % (n_queries, n_shards))
+
+    # the query boundary closest to each ideal cut
+    cuts = np.arange(1, n_shards) * (query_ids[-1] / float(n_shards))
+    after = np.clip(np.searchsorted(query_ids, cuts), 1, n_queries)
+    before = after - 1
+    bounds = np.where(cuts - query_ids[before] < query_ids[after] - cuts,
+                      before, after)
+
+    # each shard needs at least one query, i.e., the bounds have to be
+    # strictly increasing (bounds[k] - k non decreasing)
+    shift = np.arange(n_shards - 1)
+    bounds = np.clip(np.maximum.accumulate(bounds - shift),
+                     1, n_queries - n_shards + 1) + shift
+    return np.concatenate([[0], bounds, [n_queries]]).astype(np.int64)
+
+
+def write_shards(dataset, prefix, n_shards, columnar=False):
+    """
+    Write the dataset in n_shards shards, balanced by number of instances, in
+    the rankeval binary format, along with their manifest. The shard files are
+    named <prefix>.shard-<i>-of-<n>.rankeval and the manifest
+    <prefix>.manifest.json. The shards are written one at a time, thus only a
+    shard at a time is materialized in memory.
+
+    Parameters
+    ----------
+    dataset : Dataset
+        The dataset to shard
+    prefix : str
+        The path prefix of the files to write
+    n_shards : int
+        The number of shards
+    columnar : bool
+        Whether the features of the shards have to be stored by columns (see
+        rankeval_format.dump_rankeval_file)
+
+    Returns
+    -------
+    manifest : str
+        The path of the manifest
+    """
+    bounds = shard_bounds(dataset.query_ids, n_shards)
+    directory, base_name = os.path.split(prefix)
+
+    shards = []
+    for i, shard in enumerate(dataset.shard(n_shards)):
+        file_name = "%s.shard-%05d-of-%05d.rankeval" % (base_name, i, n_shards)
+        dump_rankeval_file(shard.X, shard.y, shard.query_ids,
+                           os.path.join(directory, file_name),
+                           features=shard.features, columnar=columnar,
+                           qids=shard.qids)
+        shards.append({"file": file_name,
+                       "first_query": int(bounds[i]),
+                       "n_queries": int(bounds[i + 1] - bounds[i]),
+                       "first_instance": int(dataset.query_ids[bounds[i]]),
+                       "n_instances": int(shard.n_instances)})
+        del shard
+
+    manifest = {"version": MANIFEST_VERSION,
+                "name": dataset.name,
+                "n_queries": int(dataset.n_queries),
+                "n_instances": int(dataset.n_instances),
+                "n_features": int(dataset.n_features),
+                "shards": shards}
+    manifest_file = prefix + ".manifest.json"
+    with open(manifest_file, "w") as f_out:
+        json.dump(manifest, f_out, indent=2, sort_keys=True)
+    return manifest_file
+
+
+def read_manifest(f):
+    """
+    Read the manifest of a sharded dataset.
+
+    Parameters
+    ----------
+    f : str
+        Path to the manifest
+
+    Returns
+    -------
+    manifest : dict
+        The manifest, whose "shards" entry lists the shards with their file
+        (relative to the directory of the manifest), first query, number of
+        queries, first instance and number of instances
+    """
+    with open(f) as f_in:
+        manifest = json.load(f_in)
+    if manifest.get("version", 0) > MANIFEST_VERSION:
+        raise ValueError("Unsupported manifest version %r"
+                         % manifest["version"])
+    return manifest
+
+
+def shard_path(f, shard):
+    """
+    Returns the path of the file storing the given shard of a sharded
+    dataset.
+
+    Parameters
+    ----------
+    f : str
+        Path to the manifest
+    shard : int
+        The index of the shard
+
+    Returns
+    -------
+    path : str
+        The path of the shard file
+    """
+    manifest = read_manifest(f)
+    n_shards = len(manifest["shards"])
+    if not 0 <= shard < n_shards:
+        raise ValueError("Shard %r does not exist (%d shards)"
+                         % (shard, n_shards))
+    return os.path.join(os.path.dirname(f), manifest["shards"][shard]["file"])
+
+
+def load_shard(f, shard, mmap=True, features=None):
+    """
+    Load a single shard of a sharded dataset.
+
+    Parameters
+    ----------
+    f : str
+        Path to the manifest
+    shard : int
+        The index of the shard to load
+    mmap : bool
+        Whether the arrays have to be memory mapped
+    features : None or list of int
+        The ids of the features to load (see load_rankeval_file)
+
+    Returns
+    -------
+    (X, y, query_ids, qids)
+
+    as returned by load_rankeval_file.
+    """
+    return load_rankeval_file(shard_path(f, shard), mmap=mmap,
+                              features=features)
+
+
+def merge_query_scores(f, shard_scores, metric=None):
+    """
+    Merge the per-query results computed on the shards (e.g., the detailed
+    scores of a metric) in the order of the queries of the whole dataset.
+
+    The per-query scores of some metrics depend on the size of the evaluated
+    dataset (e.g., MSE normalizes them by the number of instances): the
+    detailed scores of these metrics are merged exactly into the detailed
+    scores of the whole dataset only if the metric is given (see
+    Metric.merge_scores).
+
+    Parameters
+    ----------
+    f : str or dict
+        Path to the manifest, or the manifest itself
+    shard_scores : dict or list
+        The per-query results of each shard: a dict from the shard index to
+        the results of the shard, or a list with the results of all the shards
+        in order
+    metric : None or Metric
+        The metric the detailed scores of the shards have been computed with.
+        If given, the scores are merged by the metric.
+
+    Returns
+    -------
+    scores : numpy 1d array
+        The per-query results of the whole dataset (n_queries)
+    """
+    manifest = read_manifest(f) if not isinstance(f, dict) else f
+    shards = manifest["shards"]
+    if not isinstance(shard_scores, dict):
+        shard_scores = dict(enumerate(shard_scores))
+    missing = sorted(set(range(len(shards))) - set(shard_scores))
+    if missing:
+        raise ValueError("Missing results of shards %s"
+                         % ", ".join(str(shard) for shard in missing))
+
+    for shard, values in shard_scores.items():
+        if np.shape(values)[0] != shards[shard]["n_queries"]:
+            raise ValueError("Shard %d has %d queries, got %d results"
+                             % (shard, shards[shard]["n_queries"],
+                                np.shape(values)[0]))
+    if metric is not None:
+        order = range(len(shards))
+        return metric.merge_scores(
+            [np.asarray(shard_scores[shard]) for shard in order],
+            [shards[shard]["n_instances"] for shard in order])[1]
+
+    scores = None
+    for shard, values in shard_scores.items():
+        values = np.asarray(values)
+        info = shards[shard]
+        if scores is None:
+            scores = np.empty((manifest["n_queries"],) + values.shape[1:],
+                              dtype=values.dtype)
+        start = info["first_query"]
+        scores[start:start + info["n_queries"]] = values
+    return scores
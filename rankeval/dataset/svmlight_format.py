@@ -5,11 +5,48 @@ loader for the svmlight / libsvm sparse dataset format.  """
 #          Lars Buitinck <L.J.Buitinck@uva.nl>
 # License: Simple BSD.
 
-from _svmlight_format import _load_svmlight_file, _dump_svmlight_file
-import numpy as np
-
+import bz2
+import gzip
+import multiprocessing
+import os
+import tarfile
+import threading
+import zlib
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
 
-def load_svmlight_file(file_path, buffer_mb=40, query_id=False):
+import numpy as np
+import six
+from six.moves import queue
+
+from _svmlight_format import _load_svmlight_file, _load_svmlight_buffer, \
+    _format_svmlight
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# compression formats inferred from the file extension
+COMPRESSIONS = {".gz": "gzip",
+                ".bz2": "bz2",
+                ".xz": "xz",
+                ".lzma": "xz",
+                ".zst": "zstd",
+                ".zstd": "zstd"}
+
+
+def load_svmlight_file(file_path, buffer_mb=40, query_id=False, n_threads=None,
+                       n_features=None, features=None, compression="infer",
+                       member=None, original_qids=False):
     """Load datasets in the svmlight / libsvm format into sparse CSR matrix
 
     This format is a text-based format, with one sample per line. It does
@@ -21,6 +58,21 @@ def load_svmlight_file(file_path, buffer_mb=40, query_id=False):
     This format is used as the default format for both svmlight and the
     libsvm command line programs.
 
+    The file is memory mapped and parsed in parallel, splitting it in chunks
+    at line boundaries. A first fast pass counts the samples and the features
+    (the latter is skipped if n_features is given), so that the dense matrix is
+    allocated only once and directly filled by the parsing: the peak memory is
+    the size of the final matrix.
+
+    Compressed files (gzip, bz2, xz and, if the zstandard package is
+    installed, zstd), file objects and members of tar archives are instead
+    parsed in streaming: the decompression runs on a separate thread, feeding
+    the parser with blocks of buffer_mb megabytes, and nothing is written on
+    disk. The parsed blocks are kept until the end of the stream (the number
+    of samples is not known before), thus the peak memory can be up to twice
+    the size of the final matrix (usually about its size, since the matrix
+    pages are committed only while the blocks are copied and released).
+
     Parsing a text based source can be expensive. When working on
     repeatedly on the same dataset, it is recommended to wrap this
     loader with joblib.Memory.cache to store a memmapped backup of the
@@ -29,46 +81,306 @@ def load_svmlight_file(file_path, buffer_mb=40, query_id=False):
 
     Parameters
     ----------
-    file_path: str
-        Path to a file to load.
+    file_path: str or file object
+        Path to a file to load, or a (binary) file object to read from.
     buffer_mb : integer
-        Buffer size to use for low level read
+        Size of the blocks parsed when reading in streaming (compressed files,
+        file objects and archive members), and buffer size to use for low level
+        read on platforms not supporting memory mapping
     query_id : bool
         True if the query ids has to be loaded, false otherwise
+    n_threads : None or int
+        The number of threads to use for parsing the file. If None, all the
+        available cores are used.
+    n_features : None or int
+        The number of features (columns) of the matrix to build. If None, it is
+        inferred from the file. Otherwise, features beyond n_features raise an
+        error, while files with less features are padded with zeros.
+    features : None or list of int
+        The (0-based) ids of the features to load. If given, the i-th column of
+        X stores the feature features[i], while all the other features are
+        skipped during the parsing (without even parsing their values).
+    compression : str or None
+        The compression of the file: "gzip", "bz2", "xz", "zstd" or None. By
+        default it is inferred from the file extension (for archive members,
+        from the member name).
+    member : None or str
+        If given, file_path is a (possibly compressed) tar archive and member
+        is the name of the archive member to load, which is read directly from
+        the archive without extracting it.
+    original_qids : bool
+        Only if query_id is True. Whether the original qid of each query has to
+        be returned as well.
 
     Returns
     -------
-    (X, y, [query_ids])
+    (X, y, [query_ids, [qids]])
 
     where X is a dense numpy matrix of shape (n_samples, n_features) and type dtype,
           y is a ndarray of shape (n_samples,).
           query_ids is a ndarray of shape(nsamples,) if query_id is True, it is not returned otherwise
+          qids is a ndarray of shape (n_queries,) with the qid of each query
+          (as written in the file), returned only if original_qids is True
     """
-    data, labels, qids = _load_svmlight_file(file_path, buffer_mb)
-
-    # reshape the numpy array into a matrix
+    if n_features is not None and n_features <= 0:
+        raise ValueError("n_features should be a positive integer, got %r"
+                         % n_features)
+
+    columns_map, n_features = _columns_map(features, n_features)
+
+    if not isinstance(file_path, six.string_types) and \
+            not hasattr(file_path, "read"):
+        raise TypeError("file_path should be a path or a file object, got %r"
+                        % type(file_path))
+
+    if member is not None:
+        with tarfile.open(file_path, "r:*") as archive:
+            f_member = archive.extractfile(member)
+            if f_member is None:
+                raise IOError("%s is not a file in %s" % (member, file_path))
+            if compression == "infer":
+                compression = _infer_compression(member)
+            data, labels, qids, values = _load_svmlight_stream(
+                f_member, compression, buffer_mb, n_threads, n_features,
+                columns_map)
+    elif hasattr(file_path, "read"):
+        if compression == "infer":
+            compression = _infer_compression(getattr(file_path, "name", ""))
+        data, labels, qids, values = _load_svmlight_stream(
+            file_path, compression, buffer_mb, n_threads, n_features,
+            columns_map)
+    else:
+        if compression == "infer":
+            compression = _infer_compression(file_path)
+        if compression is None:
+            # infinite values are converted to max_float by the parser
+            data, labels, qids, values = _load_svmlight_file(
+                file_path, buffer_mb, n_threads or 0, n_features or 0,
+                columns_map)
+        else:
+            with open(file_path, "rb") as f_in:
+                data, labels, qids, values = _load_svmlight_stream(
+                    f_in, compression, buffer_mb, n_threads, n_features,
+                    columns_map)
+
+    # reshape the numpy array into a matrix (no copy)
     n_samples = len(labels)
-    n_features = len(data) / n_samples
+    if n_features is None:
+        n_features = len(data) / n_samples if n_samples else 0
     data.shape = (n_samples, n_features)
-    if data.dtype != np.float32:
-        new_data = data.astype(dtype=np.float32)
-        del data
-        data = new_data
-
-    # Convert infinite values to max_float representation (SVM reader problem)
-    # This patch is needed because some dataset have infinite values and because
-    # the split condition is <=, while sole software uses <. In order to
-    # reconduct the former condition to the latter, we slightly decrease the
-    # split. However, slightly decreasing inf does not have any effect.
-    data[data == np.inf] = np.finfo(data.dtype).max
 
     if not query_id:
         return data, labels
+    elif original_qids:
+        return data, labels, qids, values
     else:
         return data, labels, qids
 
 
-def load_svmlight_files(files, buffer_mb=40, query_id=False):
+def _columns_map(features, n_features):
+    """
+    Returns the map from the feature ids to the columns of the matrix to build
+    (-1 for the features to skip) given the features to load, along with the
+    number of columns of the matrix.
+    """
+    if features is None:
+        return None, n_features
+    if n_features is not None:
+        raise ValueError("n_features and features are mutually exclusive")
+    features = np.asarray(features, dtype=np.int32)
+    if features.size == 0 or features.min() < 0 or \
+            np.unique(features).size != features.size:
+        raise ValueError("features should be a non-empty list of "
+                         "distinct feature ids")
+    columns_map = np.full(features.max() + 1, -1, dtype=np.int32)
+    columns_map[features] = np.arange(features.size, dtype=np.int32)
+    return columns_map, features.size
+
+
+def _infer_compression(file_name):
+    """
+    Infer the compression of a file from its extension.
+    """
+    return COMPRESSIONS.get(os.path.splitext(file_name)[1].lower())
+
+
+def _decompressed_blocks(f_in, compression, read_size=1 << 22):
+    """
+    Generator of the decompressed blocks of the given (binary) file object.
+    Concatenated streams (e.g., files compressed in parallel) are supported.
+    """
+    if compression is None:
+        new_decompressor = None
+    elif compression == "gzip":
+        new_decompressor = lambda: zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif compression == "bz2":
+        new_decompressor = bz2.BZ2Decompressor
+    elif compression == "xz":
+        if lzma is None:
+            raise ImportError("xz decompression requires the lzma module "
+                              "(backports.lzma on python 2)")
+        new_decompressor = lzma.LZMADecompressor
+    elif compression == "zstd":
+        if zstandard is None:
+            raise ImportError("zstd decompression requires the zstandard "
+                              "package")
+        new_decompressor = lambda: zstandard.ZstdDecompressor().decompressobj()
+    else:
+        raise TypeError("Compression %s not supported!" % compression)
+
+    decompressor = new_decompressor() if new_decompressor else None
+    while True:
+        block = f_in.read(read_size)
+        if not block:
+            break
+        if decompressor is None:
+            yield block
+            continue
+        while block:
+            try:
+                decompressed = decompressor.decompress(block)
+            except EOFError:
+                # the previous stream ended exactly at the end of a block
+                decompressor = new_decompressor()
+                continue
+            yield decompressed
+            block = getattr(decompressor, "unused_data", b"")
+            if block:
+                decompressor = new_decompressor()
+
+
+def _threaded(blocks, max_queued=4):
+    """
+    Consume the given generator on a separate thread, so that its work (e.g.,
+    the decompression, which releases the GIL) overlaps with the caller.
+    """
+    blocks_queue = queue.Queue(maxsize=max_queued)
+    stop = threading.Event()
+
+    def put(item):
+        # give up as soon as the consumer stops
+        while not stop.is_set():
+            try:
+                blocks_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def producer():
+        try:
+            for block in blocks:
+                if not put((block, None)):
+                    return
+            put((None, None))
+        except Exception as e:
+            put((None, e))
+
+    thread = threading.Thread(target=producer, name="svmlight-decompress")
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            block, error = blocks_queue.get()
+            if error is not None:
+                raise error
+            if block is None:
+                break
+            yield block
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _line_blocks(blocks, block_size):
+    """
+    Regroup the given blocks of bytes in blocks of (at least) block_size bytes
+    ending at a line boundary.
+    """
+    pending, pending_size = [], 0
+    for block in blocks:
+        pending.append(block)
+        pending_size += len(block)
+        if pending_size < block_size:
+            continue
+        data = b"".join(pending)
+        cut = data.rfind(b"\n") + 1
+        if cut:
+            yield data[:cut]
+            data = data[cut:]
+        pending, pending_size = [data], len(data)
+    data = b"".join(pending)
+    if data:
+        yield data
+
+
+def _load_svmlight_stream(f_in, compression, buffer_mb, n_threads,
+                          n_features, columns_map):
+    """
+    Parse the svmlight file read (and decompressed) from the given file
+    object, by blocks of buffer_mb megabytes. Returns the flat data array,
+    the labels, the query offsets and the qid of each query, as the
+    _load_svmlight_file function.
+
+    The number of rows is not known until the end of the stream, thus the
+    parsed blocks are kept until then, and copied in the feature matrix one at
+    a time, releasing each block once copied. The matrix is allocated zeroed
+    (calloc), i.e., its pages are committed only when written, thus the memory
+    peak is usually about the size of the matrix plus a block. It can reach
+    twice the size of the matrix where the allocator zeroes the memory
+    eagerly.
+    """
+    blocks = _threaded(_decompressed_blocks(f_in, compression))
+    parsed = []
+    for block in _line_blocks(blocks, max(buffer_mb, 1) << 20):
+        data, labels, qids, values = _load_svmlight_buffer(
+            block, n_threads or 0, n_features or 0, columns_map)
+        del block
+        if labels.size:
+            parsed.append((data, labels, qids, values))
+
+    n_rows = sum(labels.size for _, labels, _, _ in parsed)
+    if n_features is None:
+        n_features = max([data.size // labels.size
+                          for data, labels, _, _ in parsed] or [0])
+    with_qids = [qids.size > 0 for _, _, qids, _ in parsed]
+    if any(with_qids) and not all(with_qids):
+        raise RuntimeError("error in SVMlight/libSVM reader: "
+                           "Missing qid label")
+
+    X = np.zeros((n_rows, n_features), dtype=np.float32)
+    y = np.empty(n_rows, dtype=np.float32)
+    offsets, query_values = [], []
+    row, last_qid = 0, None
+    # pop the blocks in file order, releasing each one once copied
+    parsed.reverse()
+    while parsed:
+        data, labels, qids, values = parsed.pop()
+        n_block = labels.size
+        X[row:row + n_block, :data.size // n_block] = \
+            data.reshape(n_block, -1)
+        y[row:row + n_block] = labels
+        if qids.size:
+            # the first query continues the last one of the previous block
+            skip = 1 if values[0] == last_qid else 0
+            offsets.append(qids[skip:-1] + row)
+            query_values.append(values[skip:])
+            last_qid = values[-1]
+        row += n_block
+        del data, labels, qids
+
+    if offsets:
+        offsets.append([n_rows])
+        qids = np.concatenate(offsets).astype(np.int32)
+        values = np.concatenate(query_values)
+    else:
+        qids = np.empty(0, dtype=np.int32)
+        values = np.empty(0, dtype=np.int_)
+    return X.ravel(), y, qids, values
+
+
+def load_svmlight_files(files, buffer_mb=40, query_id=False, n_threads=None,
+                        n_features=None):
     """Load dataset from multiple files in SVMlight format
 
     This function is equivalent to mapping load_svmlight_file over a list of
@@ -76,17 +388,18 @@ def load_svmlight_files(files, buffer_mb=40, query_id=False):
     and the samples vectors are constrained to all have the same number of
     features.
 
+    The files are loaded concurrently by a pool of threads (the parser releases
+    the GIL), splitting the available threads among the files.
+
     Parameters
     ----------
     files : iterable over str
         Paths to files to load.
 
     n_features: int or None
-        The number of features to use. If None, it will be inferred from the
-        first file. This argument is useful to load several files that are
-        subsets of a bigger sliced dataset: each subset might not have
-        examples of every feature, hence the inferred shape might vary from
-        one slice to another.
+        The number of features of all the files. If None, it is the maximum
+        number of features among the files, and the matrices of the files with
+        less features are padded with zeros.
 
     Returns
     -------
@@ -105,16 +418,66 @@ def load_svmlight_files(files, buffer_mb=40, query_id=False):
     --------
     load_svmlight_file
     """
-    files = iter(files)
-    result = list(load_svmlight_file(next(files), buffer_mb, query_id=query_id))
+    files = list(files)
+    file_threads = split_threads(n_threads, len(files))
+
+    def load(f):
+        return list(load_svmlight_file(f, buffer_mb, query_id=query_id,
+                                       n_threads=file_threads,
+                                       n_features=n_features))
 
-    for f in files:
-        result += load_svmlight_file(f, buffer_mb, query_id=query_id)
+    results = parallel_map(load, files)
 
-    return result
+    if n_features is None:
+        n_features = max([result[0].shape[1] for result in results] or [0])
+    for result in results:
+        result[0] = pad_features(result[0], n_features)
 
+    return [array for result in results for array in result]
 
-def dump_svmlight_file(X, y, f, query_id=None, zero_based=True):
+
+def split_threads(n_threads, n_tasks):
+    """
+    Returns the number of threads each one of n_tasks concurrent tasks can use,
+    for not exceeding n_threads threads overall (all the cores if None).
+    """
+    if not n_threads:
+        n_threads = multiprocessing.cpu_count()
+    return max(1, n_threads // max(n_tasks, 1))
+
+
+def parallel_map(function, items):
+    """
+    Apply the function to each item concurrently, in a pool of threads (one
+    for each item), returning the results in order. The function is expected
+    to release the GIL for most of its work (e.g., parsing or reading a file).
+    """
+    if len(items) <= 1:
+        return [function(item) for item in items]
+    pool = ThreadPool(len(items))
+    try:
+        return pool.map(function, items, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def pad_features(X, n_features):
+    """
+    Pad the given matrix with zero valued columns up to n_features columns.
+    The matrix is returned as is if it already has n_features columns.
+    """
+    if X.shape[1] == n_features:
+        return X
+    if X.shape[1] > n_features:
+        raise ValueError("The matrix has more than %d features" % n_features)
+    padded = np.zeros((X.shape[0], n_features), dtype=X.dtype)
+    padded[:, :X.shape[1]] = X
+    return padded
+
+
+def dump_svmlight_file(X, y, f, query_id=None, zero_based=True,
+                       n_threads=None, compression="infer"):
     """Dump the dataset in svmlight / libsvm file format.
 
     This format is a text-based format, with one sample per line. It does
@@ -123,6 +486,11 @@ def dump_svmlight_file(X, y, f, query_id=None, zero_based=True):
     The first element of each line can be used to store a target variable
     to predict.
 
+    The rows are formatted in blocks, each one in parallel, using the shortest
+    representation of each float that is read back as the same float. Each
+    block is written (and compressed) on a separate thread while the next one
+    is being formatted.
+
     Parameters
     ----------
     X : CSR sparse matrix, shape = [n_samples, n_features]
@@ -132,12 +500,9 @@ def dump_svmlight_file(X, y, f, query_id=None, zero_based=True):
     y : array-like, shape = [n_samples]
         Target values.
 
-    f : str
-        Specifies the path that will contain the data.
-
-    comment : list, optional 
-        Comments to append to each row after a # character
-        If specified, len(comment) must equal n_samples
+    f : str or file object
+        Specifies the path that will contain the data, or the (binary) file
+        object where to write the data.
 
     query_id: list, optional 
         Query identifiers to prepend to each row
@@ -146,22 +511,137 @@ def dump_svmlight_file(X, y, f, query_id=None, zero_based=True):
     zero_based : boolean, optional
         Whether column indices should be written zero-based (True) or one-based
         (False).
+
+    n_threads : None or int
+        The number of threads to use for formatting the rows. If None, all the
+        available cores are used.
+
+    compression : str or None
+        The compression of the output file: "gzip", "bz2", "xz", "zstd" or
+        None. By default it is inferred from the file extension.
+    """
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    y = np.ascontiguousarray(y, dtype=np.float32)
+    if X.ndim != 2 or X.shape[0] != y.shape[0]:
+        raise ValueError("X.shape[0] and y.shape[0] should be the same, "
+                         "got: %r and %r instead." % (X.shape[0], y.shape[0]))
+
+    if query_id is not None and len(query_id) == 0:
+        query_id = None
+    if query_id is not None:
+        query_id = np.asarray(query_id, dtype=np.int64)
+        if query_id.shape[0] != X.shape[0]:
+            raise ValueError("X.shape[0] and len(query_id) should be the same, "
+                             "got: %r and %r instead." % (X.shape[0],
+                                                          len(query_id)))
+
+    if compression == "infer":
+        name = getattr(f, "name", f)
+        compression = _infer_compression(name) \
+            if isinstance(name, six.string_types) else None
+
+    # blocks of about 32MB of text
+    block_rows = max(1, (32 << 20) // (X.shape[1] * 12 + 24))
+
+    with _open_output(f, compression) as f_out:
+        with _threaded_writer(f_out) as write:
+            for start in range(0, X.shape[0], block_rows):
+                end = start + block_rows
+                write(_format_svmlight(
+                    X[start:end], y[start:end],
+                    query_id[start:end] if query_id is not None else None,
+                    int(zero_based), n_threads or 0))
+
+
+@contextmanager
+def _open_output(f, compression):
+    """
+    Open the (compressed) output file. If f is already a file object, it is
+    not closed on exit.
     """
     if hasattr(f, "write"):
-        raise ValueError("File handler not supported. Use a file path.")
+        f_out, f_raw = f, None
+    else:
+        f_out = f_raw = open(f, "wb")
+
+    try:
+        if compression == "gzip":
+            f_out = gzip.GzipFile(fileobj=f_out, mode="wb")
+        elif compression == "bz2":
+            f_out = _CompressedWriter(f_out, bz2.BZ2Compressor())
+        elif compression == "xz":
+            if lzma is None:
+                raise ImportError("xz compression requires the lzma module "
+                                  "(backports.lzma on python 2)")
+            f_out = _CompressedWriter(f_out, lzma.LZMACompressor())
+        elif compression == "zstd":
+            if zstandard is None:
+                raise ImportError("zstd compression requires the zstandard "
+                                  "package")
+            f_out = _CompressedWriter(f_out,
+                                      zstandard.ZstdCompressor().compressobj())
+        elif compression is not None:
+            raise TypeError("Compression %s not supported!" % compression)
+
+        yield f_out
+
+        if f_out is not f and f_out is not f_raw:
+            f_out.close()
+    finally:
+        if f_raw is not None:
+            f_raw.close()
+
+
+class _CompressedWriter(object):
+    """
+    Minimal file object compressing the data with the given compressor object
+    before writing it on the underlying file object.
+    """
 
-    # todo: this test is ok if we know the number of features! to divide X.shape[0] with
-    # if X.shape[0] != y.shape[0]:
-    #     raise ValueError("X.shape[0] and y.shape[0] should be the same, "
-    #                      "got: %r and %r instead." % (X.shape[0], y.shape[0]))
+    def __init__(self, f_out, compressor):
+        self.f_out = f_out
+        self.compressor = compressor
 
-    if query_id is None:
-        query_id = []
-    # elif X.shape[0] != len(query_id):
-    #         raise ValueError("X.shape[0] and len(query_id) should be the same, "
-    #                      "got: %r and %r instead." % (X.shape[0], len(query_id)))
+    def write(self, data):
+        self.f_out.write(self.compressor.compress(data))
 
-    X = np.array(X, dtype=np.float32)
-    y = np.array(y, dtype=np.float32)
+    def close(self):
+        self.f_out.write(self.compressor.flush())
 
-    _dump_svmlight_file(f, X, y, query_id, int(zero_based))
\ No newline at end of file
+
+@contextmanager
+def _threaded_writer(f_out, max_queued=2):
+    """
+    Context manager returning a function writing the given blocks of bytes on
+    f_out, in order, on a separate thread (the writing and the compression
+    release the GIL). All the blocks have been written on exit.
+    """
+    blocks_queue = queue.Queue(maxsize=max_queued)
+    errors = []
+
+    def consumer():
+        while True:
+            block = blocks_queue.get()
+            if block is None:
+                break
+            if not errors:
+                try:
+                    f_out.write(block)
+                except Exception as e:
+                    errors.append(e)
+
+    def write(block):
+        if errors:
+            raise errors[0]
+        blocks_queue.put(block)
+
+    thread = threading.Thread(target=consumer, name="svmlight-write")
+    thread.daemon = True
+    thread.start()
+    try:
+        yield write
+    finally:
+        blocks_queue.put(None)
+        thread.join()
+    if errors:
+        raise errors[0]
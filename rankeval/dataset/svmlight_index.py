@@ -0,0 +1,452 @@
+# Copyright (c) 2017, All Contributors (see CONTRIBUTORS file)
+# Authors: Salvatore Trani <salvatore.trani@isti.cnr.it>
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+This module implements a byte-offset index of the queries of a svmlight file,
+allowing to load only some queries of a (large) file without parsing the
+whole file.
+
+The index is built in a single (parallel) pass over the memory mapped file,
+which only looks at the qid of each line, and it stores, for each run of
+consecutive lines with the same qid, the qid, the byte offset and length of the
+run and its number of rows. The index is stored next to the file (sidecar,
+same file name with the INDEX_SUFFIX suffix) and it is considered valid until
+the file changes.
+"""
+
+import heapq
+import json
+import os
+import shutil
+import tempfile
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+from .rankeval_format import file_signature, matches_signature
+from ._svmlight_format import _index_svmlight_file, _load_svmlight_buffer
+
+INDEX_SUFFIX = ".qidx"
+
+# default size (in bytes) of the sorted runs spilled on disk by
+# group_svmlight_file
+SPILL_BYTES = 64 << 20
+
+
+class SvmlightIndex(object):
+    """
+    Byte-offset index of the queries of a svmlight file. Each entry of the
+    index refers to a run, i.e., a maximal sequence of consecutive lines with
+    the same qid. A query has more than one run if its lines are not
+    contiguous in the file.
+
+    Attributes
+    ----------
+    qids : numpy 1d array of int
+        The qid of each run
+    offsets : numpy 1d array of int
+        The byte offset of each run
+    lengths : numpy 1d array of int
+        The byte length of each run
+    n_rows : numpy 1d array of int
+        The number of rows (instances) of each run
+    n_features : int
+        The number of features of the file
+    """
+
+    def __init__(self, qids, offsets, lengths, n_rows, n_features):
+        self.qids = np.asarray(qids, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.n_rows = np.asarray(n_rows, dtype=np.int64)
+        self.n_features = int(n_features)
+        self._order = None
+
+    @staticmethod
+    def build(f, n_threads=None):
+        """
+        Build the index of the given svmlight file.
+
+        Parameters
+        ----------
+        f : str
+            Path to the (uncompressed) svmlight file. All the lines have to
+            store the qid.
+        n_threads : None or int
+            The number of threads to use for scanning the file. If None, all
+            the available cores are used.
+
+        Returns
+        -------
+        index : SvmlightIndex
+            The index of the file
+        """
+        return SvmlightIndex(*_index_svmlight_file(f, n_threads or 0))
+
+    @staticmethod
+    def load(f, source=None):
+        """
+        Load the index stored in the given file.
+
+        Parameters
+        ----------
+        f : str
+            Path to the index file
+        source : None or str
+            Path to the indexed svmlight file. If given, the index is returned
+            only if it is still valid for the file (None otherwise).
+
+        Returns
+        -------
+        index : SvmlightIndex or None
+            The index, or None if the index is missing or not valid
+        """
+        if not os.path.exists(f):
+            return None
+        try:
+            with open(f, 'rb') as f_in:
+                arrays = dict(np.load(f_in).items())
+            signature = json.loads(arrays["source"].tobytes().decode("utf-8"))
+        except (ValueError, IOError, KeyError):
+            return None
+        if source is not None and not matches_signature(signature, source):
+            return None
+        return SvmlightIndex(arrays["qids"], arrays["offsets"],
+                             arrays["lengths"], arrays["n_rows"],
+                             arrays["n_features"])
+
+    def save(self, f, source):
+        """
+        Store the index in the given file (atomically).
+
+        Parameters
+        ----------
+        f : str
+            Path to the index file
+        source : str
+            Path to the indexed svmlight file, whose signature is stored for
+            validating the index
+        """
+        signature = json.dumps(file_signature(source)).encode("utf-8")
+        tmp_file = "%s.tmp.%d" % (f, os.getpid())
+        try:
+            with open(tmp_file, 'wb') as f_out:
+                np.savez(f_out, qids=self.qids, offsets=self.offsets,
+                         lengths=self.lengths, n_rows=self.n_rows,
+                         n_features=self.n_features,
+                         source=np.frombuffer(signature, dtype=np.uint8))
+            os.rename(tmp_file, f)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    def is_grouped(self):
+        """
+        Returns True if the lines of each query are contiguous in the file,
+        i.e., each query has a single run.
+        """
+        return np.unique(self.qids).size == self.qids.size
+
+    def query_ranks(self):
+        """
+        Returns the rank of the query of each run, in order of first
+        appearance of the queries in the file.
+
+        Returns
+        -------
+        ranks : numpy 1d array of int
+            The rank of the query of each run
+        """
+        _, first_runs, inverse = np.unique(self.qids, return_index=True,
+                                           return_inverse=True)
+        ranks = np.empty(first_runs.size, dtype=np.int64)
+        ranks[np.argsort(first_runs)] = np.arange(first_runs.size)
+        return ranks[inverse]
+
+    def runs(self, qids):
+        """
+        Returns the runs of the given queries.
+
+        Parameters
+        ----------
+        qids : list of int
+            The qids of the queries
+
+        Returns
+        -------
+        runs : list of numpy 1d array of int
+            The runs (in file order) of each query
+        """
+        if self._order is None:
+            self._order = np.argsort(self.qids, kind='mergesort')
+        sorted_qids = self.qids[self._order]
+        qids = np.asarray(qids, dtype=np.int64)
+        starts = np.searchsorted(sorted_qids, qids, side='left')
+        ends = np.searchsorted(sorted_qids, qids, side='right')
+        missing = qids[starts == ends]
+        if missing.size:
+            raise KeyError("Queries not found: %s"
+                           % ", ".join(str(qid) for qid in missing[:10]))
+        return [self._order[start:end] for start, end in zip(starts, ends)]
+
+
+def index_path(f):
+    """
+    Returns the path of the sidecar index of the given svmlight file.
+    """
+    return f + INDEX_SUFFIX
+
+
+def get_svmlight_index(f, n_threads=None, save=True):
+    """
+    Returns the index of the given svmlight file, loading the sidecar index if
+    it is valid, or building it otherwise.
+
+    Parameters
+    ----------
+    f : str
+        Path to the svmlight file
+    n_threads : None or int
+        The number of threads to use for building the index
+    save : bool
+        Whether a newly built index has to be stored as the sidecar index of
+        the file
+
+    Returns
+    -------
+    index : SvmlightIndex
+        The index of the file
+    """
+    index = SvmlightIndex.load(index_path(f), source=f)
+    if index is None:
+        index = SvmlightIndex.build(f, n_threads=n_threads)
+        if save:
+            index.save(index_path(f), source=f)
+    return index
+
+
+def load_svmlight_queries(f, queries, n_threads=None, features=None,
+                          index=None):
+    """
+    Load only the given queries of a svmlight file. The byte ranges of the
+    queries are found by means of the index of the file (see
+    get_svmlight_index) and read (with a seek) and parsed in parallel, while
+    the rest of the file is never read.
+
+    Parameters
+    ----------
+    f : str
+        Path to the svmlight file
+    queries : list of int
+        The qids of the queries to load. The queries are returned in the given
+        order.
+    n_threads : None or int
+        The number of threads to use for reading and parsing the queries. If
+        None, all the available cores are used.
+    features : None or list of int
+        The (0-based) ids of the features to load (see load_svmlight_file)
+    index : None or SvmlightIndex
+        The index of the file. If None, it is retrieved by get_svmlight_index.
+
+    Returns
+    -------
+    (X, y, query_ids, qids)
+
+    where X is a dense numpy matrix of shape (n_samples, n_features),
+          y is a ndarray of shape (n_samples,),
+          query_ids is a ndarray of shape (n_queries+1,) with the offsets of the
+          queries,
+          qids is a ndarray of shape (n_queries,) with the qid of each query.
+    """
+    if index is None:
+        index = get_svmlight_index(f, n_threads=n_threads)
+
+    n_features = index.n_features
+    columns_map = None
+    if features is not None:
+        features = np.asarray(features, dtype=np.int32)
+        columns_map = np.full(max(features.max() + 1, n_features), -1,
+                              dtype=np.int32)
+        columns_map[features] = np.arange(features.size, dtype=np.int32)
+        n_features = features.size
+
+    qids = np.asarray(queries, dtype=np.int64)
+    query_runs = index.runs(qids)
+    sizes = np.array([index.n_rows[runs].sum() for runs in query_runs],
+                     dtype=np.int64)
+    query_ids = np.append(0, np.cumsum(sizes)).astype(np.int32)
+
+    # the destination row of each run (queries may be requested twice)
+    runs = np.concatenate(query_runs) if query_runs \
+        else np.empty(0, dtype=np.intp)
+    destinations = np.append(0, np.cumsum(index.n_rows[runs])[:-1])
+
+    # read the runs in file order, merging adjacent byte ranges
+    order = np.argsort(index.offsets[runs], kind='mergesort')
+    blocks = []
+    for position in order:
+        run = runs[position]
+        if blocks and blocks[-1][1] == index.offsets[run]:
+            blocks[-1][1] += index.lengths[run]
+            blocks[-1][2].append(position)
+        else:
+            blocks.append([index.offsets[run],
+                           index.offsets[run] + index.lengths[run],
+                           [position]])
+
+    X = np.zeros((query_ids[-1], n_features), dtype=np.float32)
+    y = np.empty(query_ids[-1], dtype=np.float32)
+
+    def load_block(block):
+        start, end, positions = block
+        with open(f, 'rb') as f_in:
+            f_in.seek(start)
+            content = f_in.read(end - start)
+        data, labels, _, _ = _load_svmlight_buffer(content, 1, n_features,
+                                                   columns_map)
+        data.shape = (labels.size, n_features)
+        row = 0
+        for position in positions:
+            n_rows = index.n_rows[runs[position]]
+            destination = destinations[position]
+            X[destination:destination + n_rows] = data[row:row + n_rows]
+            y[destination:destination + n_rows] = labels[row:row + n_rows]
+            row += n_rows
+
+    # reading and parsing release the GIL
+    pool = ThreadPool(n_threads or None)
+    try:
+        pool.map(load_block, blocks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    return X, y, query_ids, qids
+
+
+def group_svmlight_file(f, output, max_bytes=SPILL_BYTES, tmp_dir=None,
+                        n_threads=None, index=None):
+    """
+    Rewrite a svmlight file whose queries are interleaved (the lines of a
+    query are scattered across the file) so that the lines of each query are
+    contiguous, by an external sort with bounded memory. The queries are kept
+    in order of first appearance, and the lines of each query in their
+    original order.
+
+    The runs of the file (see SvmlightIndex) are read sequentially by chunks
+    of about max_bytes bytes; the runs of each chunk are sorted by query and
+    spilled on a temporary file, and the spilled files are finally merged
+    into the output file (written atomically). Only a chunk at a time is held
+    in memory, while a file is kept open for each chunk during the merge.
+
+    Parameters
+    ----------
+    f : str
+        Path to the (uncompressed) svmlight file
+    output : str
+        Path to the output file
+    max_bytes : int
+        The size in bytes of the chunks sorted in memory
+    tmp_dir : None or str
+        The directory where to create the temporary files (the default
+        temporary directory if None)
+    n_threads : None or int
+        The number of threads to use for building the index of the file
+    index : None or SvmlightIndex
+        The index of the file. If None, it is retrieved by get_svmlight_index.
+
+    Returns
+    -------
+    output : str
+        The path of the output file
+    """
+    if index is None:
+        index = get_svmlight_index(f, n_threads=n_threads)
+    ranks = index.query_ranks()
+
+    spill_dir = tempfile.mkdtemp(prefix="rankeval-sort-", dir=tmp_dir)
+    tmp_output = "%s.tmp.%d" % (output, os.getpid())
+    try:
+        spills = []
+        with open(f, 'rb') as f_in:
+            for first, last in _run_chunks(index.lengths, max_bytes):
+                spill = os.path.join(spill_dir, "spill-%d" % len(spills))
+                spills.append((spill,) + _spill_runs(f_in, index, ranks,
+                                                     first, last, spill))
+        with open(tmp_output, 'wb') as f_out:
+            _merge_spills(spills, f_out)
+        os.rename(tmp_output, output)
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+        if os.path.exists(tmp_output):
+            os.remove(tmp_output)
+    return output
+
+
+def _run_chunks(lengths, max_bytes):
+    """
+    Split the runs in chunks of consecutive runs of at most max_bytes bytes
+    (a run bigger than max_bytes is a chunk on its own).
+    """
+    cumulative = np.append(0, np.cumsum(lengths))
+    start = 0
+    while start < lengths.size:
+        end = np.searchsorted(cumulative, cumulative[start] + max_bytes,
+                              side='right') - 1
+        end = min(max(end, start + 1), lengths.size)
+        yield start, end
+        start = end
+
+
+def _spill_runs(f_in, index, ranks, first, last, spill):
+    """
+    Write the runs in the range [first, last) sorted by query rank (stable) on
+    the spill file. Returns the rank and the length of each segment (the
+    consecutive runs of a query) of the spill file.
+    """
+    start = index.offsets[first]
+    f_in.seek(start)
+    content = f_in.read(index.offsets[last - 1] + index.lengths[last - 1] -
+                        start)
+    offsets = index.offsets[first:last] - start
+    lengths = index.lengths[first:last].copy()
+    if not content.endswith(b"\n"):
+        # the last line of the file
+        content += b"\n"
+        lengths[-1] += 1
+
+    order = np.argsort(ranks[first:last], kind='mergesort')
+    with open(spill, 'wb') as f_spill:
+        for run in order:
+            f_spill.write(content[offsets[run]:offsets[run] + lengths[run]])
+
+    run_ranks = ranks[first:last][order]
+    segments = np.flatnonzero(np.r_[True, run_ranks[1:] != run_ranks[:-1]])
+    return run_ranks[segments], np.add.reduceat(lengths[order], segments)
+
+
+def _merge_spills(spills, f_out):
+    """
+    Merge the sorted spill files into the output file, copying the segments
+    of each query in order of rank (and of spill file, for the same rank).
+    """
+    files = [open(spill, 'rb') for spill, _, _ in spills]
+    try:
+        segments = heapq.merge(*[_spill_segments(i, segment_ranks,
+                                                 segment_lengths)
+                                 for i, (_, segment_ranks, segment_lengths)
+                                 in enumerate(spills)])
+        for _, i, length in segments:
+            f_out.write(files[i].read(length))
+    finally:
+        for f_spill in files:
+            f_spill.close()
+
+
+def _spill_segments(spill, segment_ranks, segment_lengths):
+    for rank, length in zip(segment_ranks, segment_lengths):
+        yield rank, spill, length
@@ -89,6 +89,45 @@ class Metric(six.with_metaclass(ABCMeta)):
             Represents the metric score for one query.
         """
 
+    def merge_scores(self, detailed_scores, n_instances):
+        """
+        This method merges the detailed scores computed on several portions
+        of a dataset (e.g., its batches or shards, each one storing whole
+        queries) into the overall and detailed scores that eval returns on the
+        whole dataset. By default the per-query scores are concatenated and
+        averaged; metrics whose per-query scores depend on the size of the
+        evaluated dataset (e.g., MSE) override it.
+
+        Parameters
+        ----------
+        detailed_scores : list of numpy 1d array of float
+            The detailed scores of each portion, in the order of the queries
+        n_instances : list of int
+            The number of instances of each portion
+
+        Returns
+        -------
+        avg_score: float
+            The overall score of the whole dataset
+        detailed_scores: numpy 1d array of floats
+            The detailed scores of the queries of the whole dataset
+        """
+        self.detailed_scores = np.concatenate(detailed_scores) \
+            if len(detailed_scores) else np.zeros(0, dtype=np.float32)
+        return self.detailed_scores.mean(), self.detailed_scores
+
+    def clear_cache(self, dataset=None):
+        """
+        This method is used to clear the internal cache of the metric (e.g.,
+        the ideal scores of the queries of the evaluated datasets), for the
+        given dataset or for all the datasets if None.
+
+        Parameters
+        ----------
+        dataset : None or Dataset
+            The dataset whose cached data have to be removed
+        """
+
     def query_iterator(self, dataset, y_pred):
         """
         This method iterates over dataset document scores and predicted scores
@@ -113,4 +152,43 @@ class Metric(six.with_metaclass(ABCMeta)):
                 enumerate(dataset.query_offset_iterator()):
             yield (query_id,
                    dataset.y[start_offset:end_offset],
-                   y_pred[start_offset:end_offset])
\ No newline at end of file
+                   y_pred[start_offset:end_offset])
+
+
+def eval_query_batches(batches, model, metrics):
+    """
+    This method evaluates the model with the given metrics over a dataset
+    given by batches of queries (see Dataset.iter_batches and
+    Dataset.load_batches). Each batch is scored and evaluated, then it is
+    released, thus the memory used does not depend on the size of the
+    dataset (except for the per-query scores, one for each query).
+
+    Parameters
+    ----------
+    batches : iterable of Dataset
+        The batches of the dataset, in order
+    model : RTEnsemble
+        The model to evaluate
+    metrics : list of Metric
+        The metrics to compute
+
+    Returns
+    -------
+    scores : list of (float, numpy 1d array of float)
+        For each metric, the overall score and the detailed scores of each
+        query (in the order of the batches), as returned by Metric.eval on
+        the whole dataset
+    """
+    detailed_scores = [[] for _ in metrics]
+    n_instances = []
+    for batch in batches:
+        y_pred = model.score(batch, cache=False)
+        for i, metric in enumerate(metrics):
+            detailed_scores[i].append(metric.eval(batch, y_pred)[1].copy())
+            metric.clear_cache(batch)
+        n_instances.append(batch.n_instances)
+        del batch, y_pred
+
+    # each metric aggregates the scores of the batches (see merge_scores)
+    return [metric.merge_scores(metric_scores, n_instances)
+            for metric, metric_scores in zip(metrics, detailed_scores)]
@@ -63,6 +63,38 @@ class MSE(Metric):
                 self.eval_per_query(q_y, q_y_pred) / dataset.n_instances
         return self.detailed_scores.sum(), self.detailed_scores
 
+    def merge_scores(self, detailed_scores, n_instances):
+        """
+        This method merges the detailed MSE scores computed on several
+        portions of a dataset (see Metric.merge_scores). The scores of each
+        portion are normalized by its number of instances, thus they are
+        normalized again by the number of instances of the whole dataset.
+
+        Parameters
+        ----------
+        detailed_scores : list of numpy 1d array of float
+            The detailed MSE scores of each portion, in the order of the
+            queries
+        n_instances : list of int
+            The number of instances of each portion
+
+        Returns
+        -------
+        avg_score: float
+            The overall MSE score of the whole dataset
+        detailed_scores: numpy 1d array of floats
+            The detailed MSE scores of the queries of the whole dataset
+        """
+        total = max(sum(n_instances), 1)
+        self.detailed_scores = np.zeros(0, dtype=np.float32)
+        if len(detailed_scores):
+            self.detailed_scores = np.concatenate([
+                np.asarray(scores, dtype=np.float64) * n
+                for scores, n in zip(detailed_scores, n_instances)])
+            self.detailed_scores = \
+                (self.detailed_scores / total).astype(np.float32)
+        return self.detailed_scores.sum(), self.detailed_scores
+
     def eval_per_query(self, y, y_pred):
         """
         This method helps compute the MSE score per query. It is called by
@@ -95,6 +95,23 @@ class NDCG(Metric):
 
         return super(self.__class__, self).eval(dataset, y_pred)
 
+    def clear_cache(self, dataset=None):
+        """
+        This method is used to clear the cached ideal DCG scores, of the given
+        dataset or of all the datasets if None.
+
+        Parameters
+        ----------
+        dataset : None or Dataset
+            The dataset whose ideal DCG scores have to be removed
+        """
+        if dataset is None:
+            self._cache_idcg_score.clear()
+        else:
+            self._cache_idcg_score.pop(dataset, None)
+        if self._current_dataset is dataset or dataset is None:
+            self._current_dataset = None
+
     def eval_per_query(self, y, y_pred):
         """
         This method helps compute the NDCG score per query. It is called by the
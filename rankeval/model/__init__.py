@@ -14,9 +14,10 @@ from proxy_LightGBM import ProxyLightGBM
 from proxy_QuickRank import ProxyQuickRank
 from proxy_ScikitLearn import ProxyScikitLearn
 from proxy_XGBoost import ProxyXGBoost
-from rt_ensemble import RTEnsemble
+from rt_ensemble import RTEnsemble, TreesIndex
 
 __all__ = ['RTEnsemble',
+           'TreesIndex',
            'ProxyQuickRank',
            'ProxyLightGBM',
            'ProxyXGBoost',
@@ -33,7 +33,7 @@ import re
 
 import numpy as np
 
-from rt_ensemble import RTEnsemble
+from rt_ensemble import RTEnsemble, _model_file
 
 tree_reg = re.compile("^Tree=(\d+)")
 num_leaves_reg = re.compile("^num_leaves=(\d+)")
@@ -56,30 +56,35 @@ class ProxyLightGBM(object):
     """
 
     @staticmethod
-    def load(file_path, model):
+    def load(file_path, model, n_trees=None):
         """
         Load the model from the file identified by file_path.
 
         Parameters
         ----------
-        file_path : str
+        file_path : str or file object
             The path to the filename where the model has been saved
         model : RTEnsemble
             The model instance to fill
+        n_trees : None or int
+            The maximum number of trees to load. The parsing stops as soon as
+            n_trees trees have been read. By default all the trees are loaded.
         """
-        n_trees, n_nodes = ProxyLightGBM._count_nodes(file_path)
+        n_trees, n_nodes = ProxyLightGBM._count_nodes(file_path, n_trees)
         # Initialize the model and allocate the needed space
         # given the shape and size of the ensemble
         model.initialize(n_trees, n_nodes)
 
-        curr_tree = root_node = 0
-        num_leaves = num_splits = 0
-        with open(file_path, 'r') as f:
+        curr_tree = -1
+        root_node = num_leaves = num_splits = 0
+        with _model_file(file_path) as f:
             for line in f:
 
                 match = tree_reg.match(line)
                 if match:
-                    curr_tree = int(match.group(1))
+                    curr_tree += 1
+                    if curr_tree == n_trees:
+                        break
                     root_node += num_leaves + num_splits
                     model.trees_root[curr_tree] = root_node
                     continue
@@ -164,6 +169,84 @@ class ProxyLightGBM(object):
                     continue
 
 
+    @staticmethod
+    def load_booster(booster, model):
+        """
+        Load the model from a trained LightGBM Booster, reading the tree
+        structures returned by its dump_model method (no intermediate file).
+
+        Parameters
+        ----------
+        booster : lightgbm.Booster or lightgbm.LGBMModel
+            The trained model to convert
+        model : RTEnsemble
+            The model instance to fill
+        """
+        try:
+            import lightgbm
+        except ImportError:
+            raise ImportError("LightGBM is required for loading a LightGBM "
+                              "booster")
+
+        if isinstance(booster, lightgbm.LGBMModel):
+            booster = booster.booster_
+
+        trees_info = booster.dump_model()['tree_info']
+        n_trees = len(trees_info)
+        num_leaves = np.array([tree_info['num_leaves']
+                               for tree_info in trees_info], dtype=np.int32)
+        sizes = 2 * num_leaves - 1
+
+        # Initialize the model and allocate the needed space
+        # given the shape and size of the ensemble
+        model.initialize(n_trees, int(sizes.sum()))
+
+        model.trees_root[:] = np.cumsum(sizes) - sizes
+        # leaves output already take into account the shrinkage
+        model.trees_weight[:] = 1.0
+
+        # The split nodes are stored first (following the split_index), then
+        # the leaves (following the leaf_index), as in the textual format.
+        split_nodes, split_features, thresholds = [], [], []
+        left_children, right_children = [], []
+        leaf_nodes, leaf_values = [], []
+
+        def node_index(node, root_node, num_splits):
+            if 'split_index' in node:
+                return root_node + node['split_index']
+            return root_node + num_splits + node.get('leaf_index', 0)
+
+        for root_node, n_leaves, tree_info in \
+                zip(model.trees_root, num_leaves, trees_info):
+            num_splits = n_leaves - 1
+            stack = [tree_info['tree_structure']]
+            while stack:
+                node = stack.pop()
+                if 'split_index' not in node:
+                    leaf_nodes.append(node_index(node, root_node, num_splits))
+                    leaf_values.append(node['leaf_value'])
+                    continue
+
+                if node['decision_type'] != '<=':
+                    raise AssertionError("Decision Tree not supported")
+                if node['missing_type'] != 'None':
+                    raise AssertionError("Missing Values not supported!")
+
+                split_nodes.append(root_node + node['split_index'])
+                split_features.append(node['split_feature'])
+                thresholds.append(node['threshold'])
+                left_children.append(
+                    node_index(node['left_child'], root_node, num_splits))
+                right_children.append(
+                    node_index(node['right_child'], root_node, num_splits))
+                stack.extend([node['right_child'], node['left_child']])
+
+        model.trees_nodes_feature[split_nodes] = split_features
+        model.trees_nodes_value[split_nodes] = thresholds
+        model.trees_left_child[split_nodes] = left_children
+        model.trees_right_child[split_nodes] = right_children
+        model.trees_nodes_value[leaf_nodes] = leaf_values
+
     @staticmethod
     def save(file_path, model):
         """
@@ -180,19 +263,114 @@ class ProxyLightGBM(object):
         -------
         status : bool
             Returns true if the save is successful, false otherwise
+
+        Notes
+        -----
+        The model is written in a streaming fashion, tree by tree, directly
+        from the node arrays of the model. Since LightGBM does not have neither
+        tree weights nor a global bias, the weight of each tree and the
+        learning rate are folded into the leaves output, while the base score
+        is added to the leaves output of the first tree.
+        """
+        n_features = max(int(model.trees_nodes_feature.max()) + 1, 1)
+        with open(file_path, 'w') as f_out:
+            f_out.write("tree\n"
+                        "version=v2\n"
+                        "num_class=1\n"
+                        "num_tree_per_iteration=1\n"
+                        "label_index=0\n"
+                        "max_feature_idx=%d\n"
+                        "objective=regression\n"
+                        "feature_names=%s\n"
+                        "feature_infos=%s\n\n" %
+                        (n_features - 1,
+                         ' '.join("Column_%d" % f for f in xrange(n_features)),
+                         ' '.join(["none"] * n_features)))
+
+            for idx_tree in xrange(model.n_trees):
+                f_out.write(ProxyLightGBM._get_tree_text(model, idx_tree))
+
+            f_out.write("end of trees\n")
+
+        return True
+
+    @staticmethod
+    def _get_tree_text(model, idx_tree):
+        """
+        Builds the textual representation of the given tree, using the
+        LightGBM format: the split nodes are renumbered from 0 (the root), the
+        leaves from -1 downward.
+
+        Parameters
+        ----------
+        model : RTEnsemble
+            The model
+        idx_tree : int
+            The index of the tree to represent
+
+        Returns
+        -------
+        text : str
+            The textual representation of the tree, in the LightGBM format.
         """
-        raise NotImplementedError("Feature not implemented!")
+        root_node = model.trees_root[idx_tree]
+        end_node = model.n_nodes
+        if idx_tree + 1 < model.n_trees:
+            end_node = model.trees_root[idx_tree + 1]
+
+        left_child = model.trees_left_child[root_node:end_node]
+        right_child = model.trees_right_child[root_node:end_node]
+        is_leaf = (left_child == -1) & (right_child == -1)
+        splits = np.where(~is_leaf)[0]
+        leaves = np.where(is_leaf)[0]
+
+        new_ids = np.empty(end_node - root_node, dtype=np.int64)
+        new_ids[splits] = np.arange(splits.size)
+        new_ids[leaves] = -np.arange(1, leaves.size + 1)
+
+        leaf_values = model.trees_nodes_value[root_node:end_node][leaves] * \
+            np.float64(model.trees_weight[idx_tree]) * model.learning_rate
+        if idx_tree == 0 and model.base_score:
+            leaf_values += model.base_score
+
+        def to_str(values):
+            return ' '.join(map(repr, values.tolist()))
+
+        return "Tree=%d\n" \
+               "num_leaves=%d\n" \
+               "num_cat=0\n" \
+               "split_feature=%s\n" \
+               "split_gain=%s\n" \
+               "threshold=%s\n" \
+               "decision_type=%s\n" \
+               "left_child=%s\n" \
+               "right_child=%s\n" \
+               "leaf_value=%s\n" \
+               "shrinkage=1\n\n" % (
+                   idx_tree,
+                   leaves.size,
+                   to_str(model.trees_nodes_feature[root_node + splits]),
+                   ' '.join(["0"] * splits.size),
+                   to_str(model.trees_nodes_value[root_node + splits]),
+                   ' '.join(["0"] * splits.size),
+                   to_str(new_ids[left_child[splits] - root_node]),
+                   to_str(new_ids[right_child[splits] - root_node]),
+                   to_str(leaf_values))
 
     @staticmethod
-    def _count_nodes(file_path):
+    def _count_nodes(file_path, n_trees=None):
         """
         Count the total number of nodes (both split and leaf nodes)
         in the model identified by file_path.
 
         Parameters
         ----------
-        file_path : str
+        file_path : str or file object
             The path to the filename where the model has been saved
+        n_trees : None or int
+            The maximum number of trees to consider. The parsing stops as soon
+            as n_trees trees have been read. By default all the trees are
+            considered.
 
         Returns
         -------
@@ -200,11 +378,12 @@ class ProxyLightGBM(object):
             The total number of trees and nodes (both split and leaf nodes)
             in the model identified by file_path.
         """
+        max_trees = n_trees
 
         n_nodes = 0
         n_trees = 0
 
-        with open(file_path, 'r') as f:
+        with _model_file(file_path) as f:
             for line in f:
                 match = num_leaves_reg.match(line)
                 if match:
@@ -216,7 +395,37 @@ class ProxyLightGBM(object):
                     continue
                 match = tree_reg.match(line)
                 if match:
+                    if n_trees == max_trees:
+                        break
                     n_trees += 1
                     continue
 
         return n_trees, n_nodes
+
+    @staticmethod
+    def _index_trees(file_path):
+        """
+        Compute the byte offsets of the trees in the model identified by
+        file_path, without parsing them.
+
+        Parameters
+        ----------
+        file_path : str
+            The path to the filename where the model has been saved
+
+        Returns
+        -------
+        offsets : numpy 1d array of int
+            The byte offset where each tree starts, followed by the byte
+            offset where the file ends.
+        """
+        offsets = []
+        pos = 0
+        with open(file_path, 'rb') as f:
+            for line in f:
+                if line.startswith(b'Tree='):
+                    offsets.append(pos)
+                pos += len(line)
+        offsets.append(pos)
+        return np.array(offsets, dtype=np.int64)
+
@@ -21,7 +21,12 @@ nodes on the other hand are described by an "output" tag with the value as
 content.
 """
 
-from rt_ensemble import RTEnsemble
+import mmap
+import re
+
+import numpy as np
+
+from rt_ensemble import RTEnsemble, _model_file
 
 try:
     import xml.etree.cElementTree as etree
@@ -36,93 +41,74 @@ class ProxyQuickRank(object):
     """
 
     @staticmethod
-    def load(file_path, model):
+    def load(file_path, model, n_trees=None):
         """
         Load the model from the file identified by file_path.
 
         Parameters
         ----------
-        file_path : str
+        file_path : str or file object
             The path to the filename where the model has been saved
         model : RTEnsemble
             The model instance to fill
+        n_trees : None or int
+            The maximum number of trees to load. The parsing stops as soon as
+            n_trees trees have been read. By default all the trees are loaded.
         """
-        n_trees, n_nodes = ProxyQuickRank._count_nodes(file_path)
+        n_trees, n_nodes = ProxyQuickRank._count_nodes(file_path, n_trees)
         # Initialize the model and allocate the needed space
         # given the shape and size of the ensemble
         model.initialize(n_trees, n_nodes)
 
-        # get an iterable
-        context = etree.iterparse(file_path, events=("start", "end"))
-
-        # get the root element
-        _, root = next(context)
-
-        curr_tree = curr_node = -1
-        split_stack = []
-        for event, elem in context:
-
-            if event == 'start':
-                if elem.tag == 'tree':
-                    curr_tree += 1  # increase the current number index
-                    curr_node += 1  # increase the current node index
-                    # save the curr node as the root of a new tree
-                    model.trees_root[curr_tree] = curr_node
-                    model.trees_weight[curr_tree] = elem.attrib['weight']
-                elif elem.tag == 'split':
-                    if 'pos' in elem.attrib:
-                        parent_node = split_stack[-1]
-                        curr_node += 1
-                        if elem.attrib['pos'] == 'left':
-                            model.trees_left_child[parent_node] = curr_node
-                        else:
-                            model.trees_right_child[parent_node] = curr_node
-                    split_stack.append(curr_node)
-            else:   # event = 'end'
-                if elem.tag == 'split':
-                    split_stack.pop()
-                elif elem.tag == 'feature':
-                    model.trees_nodes_feature[curr_node] = \
-                        int(elem.text.strip()) - 1
-                elif elem.tag == 'threshold' or elem.tag == 'output':
-                    model.trees_nodes_value[curr_node] = elem.text.strip()
-
-            # clear the memory
-            if event == 'end':
-                elem.clear()    # discard the element
-                root.clear()    # remove child reference from the root
-
-
-    @staticmethod
-    def _xmlprettyprint(stringlist):
-        indent = ''
-        in_tag = False
-        file_start = True
-        for token in stringlist:
-            if token.startswith('</') or token.endswith('/>'):
-                indent = indent[:-1]
-                if not in_tag:
-                    yield '\n' + indent
-                yield token
-                in_tag = False
-            elif token.startswith('<'):
-                if not file_start:
-                    yield '\n' + indent
-                yield token
-                indent += '\t'
-                in_tag = True
-                file_start = False
-            elif token == '>':
-                yield '>'
-            elif in_tag:
-                yield token
-            else:
-                yield '\n' + token
+        with _model_file(file_path) as f:
+            # get an iterable
+            context = etree.iterparse(f, events=("start", "end"))
+
+            # get the root element
+            _, root = next(context)
+
+            curr_tree = curr_node = -1
+            split_stack = []
+            for event, elem in context:
+
+                if event == 'start':
+                    if elem.tag == 'tree':
+                        curr_tree += 1  # increase the current number index
+                        if curr_tree == n_trees:
+                            break
+                        curr_node += 1  # increase the current node index
+                        # save the curr node as the root of a new tree
+                        model.trees_root[curr_tree] = curr_node
+                        model.trees_weight[curr_tree] = elem.attrib['weight']
+                    elif elem.tag == 'split':
+                        if 'pos' in elem.attrib:
+                            parent_node = split_stack[-1]
+                            curr_node += 1
+                            if elem.attrib['pos'] == 'left':
+                                model.trees_left_child[parent_node] = curr_node
+                            else:
+                                model.trees_right_child[parent_node] = curr_node
+                        split_stack.append(curr_node)
+                else:   # event = 'end'
+                    if elem.tag == 'split':
+                        split_stack.pop()
+                    elif elem.tag == 'feature':
+                        model.trees_nodes_feature[curr_node] = \
+                            int(elem.text.strip()) - 1
+                    elif elem.tag == 'threshold' or elem.tag == 'output':
+                        model.trees_nodes_value[curr_node] = elem.text.strip()
+
+                # clear the memory
+                if event == 'end':
+                    elem.clear()    # discard the element
+                    root.clear()    # remove child reference from the root
 
     @staticmethod
     def save(file_path, model):
         """
-        Save the model onto the file identified by file_path.
+        Save the model onto the file identified by file_path. The model is
+        written in a streaming fashion, tree by tree, directly from the node
+        arrays of the model.
 
         Parameters
         ----------
@@ -135,89 +121,136 @@ class ProxyQuickRank(object):
         -------
         status : bool
             Returns true if the save is successful, false otherwise
-        """
-
-        # ROOT
-        root = etree.Element("ranker")
-
-        # Learning process info
-        n_info = etree.SubElement(root, "info")
-
-        etree.SubElement(n_info, "type").text = "MART"
-        etree.SubElement(n_info, "trees").text = repr(model.n_trees)
-        etree.SubElement(n_info, "leaves").text = repr(model.max_leaves())
-        etree.SubElement(n_info, "shrinkage").text = repr(model.learning_rate)
-        etree.SubElement(n_info, "leafsupport").text = repr(0)
-        etree.SubElement(n_info, "discretization").text = repr(0)
-        etree.SubElement(n_info, "estop").text = repr(0)
-
-        # Ensemble
-        n_ensemble = etree.Element("ensemble")
-        root.append(n_ensemble)
 
-        for idx_tree in xrange(model.n_trees):
-            n_tree = etree.SubElement(n_ensemble, "tree",
-                                      {"id": repr(idx_tree+1),
-                                       "weight": repr(model.trees_weight[idx_tree])})
-            cur_node = model.trees_root[idx_tree]
-
-            n_split = ProxyQuickRank._get_node_xml_element(model, cur_node)
-            n_tree.append(n_split)
+        Notes
+        -----
+        Since QuickRank models do not have neither a learning rate (reported
+        only for information purpose) nor a global bias, the learning rate is
+        folded into the tree weights, while the base score is added to the
+        leaves output of the first tree. If the weight of the first tree is 0
+        (e.g., a null learning rate), the base score is written as an
+        additional tree made of a single leaf.
+        """
+        # the base score cannot be folded into a tree with weight 0
+        constant_tree = bool(model.base_score) and model.n_trees > 0 and \
+            ProxyQuickRank._tree_weight(model, 0) == 0
+        n_trees = model.n_trees + int(constant_tree)
 
         with open(file_path, 'w') as f_out:
-            print >>f_out, ''.join(ProxyQuickRank._xmlprettyprint(etree.tostringlist(root)))
-
+            # Learning process info
+            f_out.write("<ranker>\n"
+                        "\t<info>\n"
+                        "\t\t<type>MART</type>\n"
+                        "\t\t<trees>%d</trees>\n"
+                        "\t\t<leaves>%d</leaves>\n"
+                        "\t\t<shrinkage>%r</shrinkage>\n"
+                        "\t\t<leafsupport>0</leafsupport>\n"
+                        "\t\t<discretization>0</discretization>\n"
+                        "\t\t<estop>0</estop>\n"
+                        "\t</info>\n"
+                        "\t<ensemble>\n" % (n_trees,
+                                             model.max_leaves(),
+                                             model.learning_rate))
+
+            # Ensemble
+            for idx_tree in xrange(model.n_trees):
+                f_out.write(ProxyQuickRank._get_tree_xml(model, idx_tree))
+            if constant_tree:
+                f_out.write('\t\t<tree id="%d" weight="1.0">\n'
+                            '\t\t\t<split>\n'
+                            '\t\t\t\t<output>%r</output>\n'
+                            '\t\t\t</split>\n'
+                            '\t\t</tree>\n' % (n_trees,
+                                               float(model.base_score)))
+
+            f_out.write("\t</ensemble>\n"
+                        "</ranker>\n")
 
         return True
 
     @staticmethod
-    def _get_node_xml_element(model, node_id, child=None):
+    def _get_tree_xml(model, idx_tree):
         """
-        Builds and xml.etree.ElementTree representing the given node (and its children).
+        Builds the xml representation of the given tree, by visiting it
+        iteratively (no recursion is involved).
 
         Parameters
         ----------
         model : RTEnsemble
             The model
-        node_id : int
-            The node id from which the visit is started
-        child : string or None
-            Whether the node is a "left" or "right" child. The None value identifies the root.
+        idx_tree : int
+            The index of the tree to represent
 
         Returns
         -------
-        etree : xml.etree.ElementTree.Element
-            The Element tree.
+        xml : str
+            The xml representation of the tree, in the QuickRank format.
         """
-        n_split = etree.Element("split")
-        if child:
-            n_split.set("pos", child)
+        weight = ProxyQuickRank._tree_weight(model, idx_tree)
+        bias = 0
+        if idx_tree == 0 and model.base_score and weight != 0:
+            bias = model.base_score / weight
+
+        lines = ['\t\t<tree id="%d" weight="%r">' % (idx_tree + 1, weight)]
+
+        # the split nodes not closed yet are the ancestors of the current node
+        n_open_splits = 0
+        for node_id, depth, pos in model._preorder_visit(idx_tree):
+            while n_open_splits > depth:
+                n_open_splits -= 1
+                lines.append('\t' * (n_open_splits + 3) + '</split>')
+
+            indent = '\t' * (depth + 3)
+            if pos is None:
+                lines.append(indent + '<split>')
+            else:
+                lines.append(indent + '<split pos="%s">' % pos)
+
+            if model.is_leaf_node(node_id):
+                output = model.trees_nodes_value[node_id]
+                if bias:
+                    output = float(output) + bias
+                lines.append(indent + '\t<output>%r</output>' % output)
+                lines.append(indent + '</split>')
+            else:
+                lines.append(indent + '\t<feature>%d</feature>' %
+                             (model.trees_nodes_feature[node_id] + 1))
+                lines.append(indent + '\t<threshold>%r</threshold>' %
+                             model.trees_nodes_value[node_id])
+                n_open_splits += 1
 
-        if model.is_leaf_node(node_id):
-            etree.SubElement(n_split, "output").text = repr(model.trees_nodes_value[node_id])
-        else:
-            feature_idx = model.trees_nodes_feature[node_id] + 1
-            feature_threshold = model.trees_nodes_value[node_id]
-            etree.SubElement(n_split, "feature").text = repr(feature_idx)
-            etree.SubElement(n_split, "threshold").text = repr(feature_threshold)
+        while n_open_splits > 0:
+            n_open_splits -= 1
+            lines.append('\t' * (n_open_splits + 3) + '</split>')
+        lines.append('\t\t</tree>\n')
 
-            child = ProxyQuickRank._get_node_xml_element(model, model.trees_left_child[node_id], "left")
-            n_split.append(child)
-            child = ProxyQuickRank._get_node_xml_element(model, model.trees_right_child[node_id], "right")
-            n_split.append(child)
+        return '\n'.join(lines)
 
-        return n_split
+    @staticmethod
+    def _tree_weight(model, idx_tree):
+        """
+        Returns the weight of the given tree, with the learning rate folded
+        into it.
+        """
+        weight = model.trees_weight[idx_tree]
+        if model.learning_rate != 1:
+            weight = np.float32(weight * model.learning_rate)
+        return weight
 
     @staticmethod
-    def _count_nodes(file_path):
+    def _count_nodes(file_path, n_trees=None):
         """
         Count the total number of nodes (both split and leaf nodes)
         in the model identified by file_path.
 
         Parameters
         ----------
-        file_path : str
+        file_path : str or file object
             The path to the filename where the model has been saved
+        n_trees : None or int
+            The maximum number of trees to consider. The parsing stops as soon
+            as n_trees trees have been read. By default all the trees are
+            considered.
 
         Returns
         -------
@@ -225,21 +258,55 @@ class ProxyQuickRank(object):
             The total number of trees and nodes (both split and leaf nodes)
             in the model identified by file_path.
         """
-        # get an iterable
-        context = etree.iterparse(file_path, events=("end",))
-
-        # get the root element
-        _, root = next(context)
+        max_trees = n_trees
 
         n_nodes = 0
         n_trees = 0
-        for _, elem in context:
-            if elem.tag == 'tree':
-                n_trees += 1
-            elif elem.tag == 'feature' or elem.tag == 'output':
-                n_nodes += 1
+        with _model_file(file_path) as f:
+            # get an iterable
+            context = etree.iterparse(f, events=("end",))
 
-            elem.clear()    # discard the element
-            root.clear()    # remove root reference to the child
+            # get the root element
+            _, root = next(context)
+
+            for _, elem in context:
+                if elem.tag == 'tree':
+                    n_trees += 1
+                    if n_trees == max_trees:
+                        break
+                elif elem.tag == 'feature' or elem.tag == 'output':
+                    n_nodes += 1
+
+                elem.clear()    # discard the element
+                root.clear()    # remove root reference to the child
 
         return n_trees, n_nodes
+
+    @staticmethod
+    def _index_trees(file_path):
+        """
+        Compute the byte offsets of the trees in the model identified by
+        file_path, without parsing them.
+
+        Parameters
+        ----------
+        file_path : str
+            The path to the filename where the model has been saved
+
+        Returns
+        -------
+        offsets : numpy 1d array of int
+            The byte offset where each tree starts, followed by the byte
+            offset where the last tree ends.
+        """
+        with open(file_path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                offsets = [match.start() for match in
+                           re.finditer(br'<tree[\s>]', data)]
+                end = data.rfind(b'</tree>')
+                end = end + len(b'</tree>') if end >= 0 else len(data)
+                offsets.append(end)
+            finally:
+                data.close()
+        return np.array(offsets, dtype=np.int64)
@@ -28,7 +28,7 @@ import re
 
 import numpy as np
 
-from rt_ensemble import RTEnsemble
+from rt_ensemble import RTEnsemble, _model_file
 
 base_score_reg = re.compile("^base_score=(.+)$")
 learning_rate_reg = re.compile("^learning_rate=(.+)$")
@@ -44,18 +44,21 @@ class ProxyScikitLearn(object):
     """
 
     @staticmethod
-    def load(file_path, model):
+    def load(file_path, model, n_trees=None):
         """
         Load the model from the file identified by file_path.
 
         Parameters
         ----------
-        file_path : str
+        file_path : str or file object
             The path to the filename where the model has been saved
         model : RTEnsemble
             The model instance to fill
+        n_trees : None or int
+            The maximum number of trees to load. The parsing stops as soon as
+            n_trees trees have been read. By default all the trees are loaded.
         """
-        n_trees, n_nodes = ProxyScikitLearn._count_nodes(file_path)
+        n_trees, n_nodes = ProxyScikitLearn._count_nodes(file_path, n_trees)
         # Initialize the model and allocate the needed space
         # given the shape and size of the ensemble
         model.initialize(n_trees, n_nodes)
@@ -63,8 +66,9 @@ class ProxyScikitLearn(object):
         root_node = 0
         num_nodes = 0
         learning_rate = 1
+        curr_tree = -1
         queue = list()
-        with open(file_path, 'r') as f:
+        with _model_file(file_path) as f:
             for line in f:
 
                 match = base_score_reg.match(line)
@@ -80,7 +84,9 @@ class ProxyScikitLearn(object):
                 match_tree = tree_reg.match(line)
                 if match_tree:
                     assert(len(queue) == 0)
-                    curr_tree = int(match_tree.group(1))
+                    curr_tree += 1
+                    if curr_tree == n_trees:
+                        break
                     root_node += num_nodes
                     num_nodes = 0
                     model.trees_root[curr_tree] = root_node
@@ -133,19 +139,80 @@ class ProxyScikitLearn(object):
         -------
         status : bool
             Returns true if the save is successful, false otherwise
+
+        Notes
+        -----
+        The model is written in a streaming fashion, tree by tree, directly
+        from the node arrays of the model, using the same format adopted by
+        export_scikit_model. The weight of each tree is folded into the leaves
+        output.
         """
-        raise NotImplementedError("Feature not implemented!")
+        with open(file_path, 'w') as f_out:
+            f_out.write("base_score=%r\n" % float(model.base_score or 0.))
+            f_out.write("learning_rate=%r\n" % float(model.learning_rate))
+            for idx_tree in xrange(model.n_trees):
+                f_out.write(ProxyScikitLearn._get_tree_text(model, idx_tree))
+
+        return True
 
     @staticmethod
-    def _count_nodes(file_path):
+    def _get_tree_text(model, idx_tree):
+        """
+        Builds the textual representation of the given tree, by visiting it
+        iteratively (no recursion is involved). The node ids are local to the
+        tree.
+
+        Parameters
+        ----------
+        model : RTEnsemble
+            The model
+        idx_tree : int
+            The index of the tree to represent
+
+        Returns
+        -------
+        text : str
+            The textual representation of the tree.
+        """
+        root_node = model.trees_root[idx_tree]
+        end_node = model.n_nodes
+        if idx_tree + 1 < model.n_trees:
+            end_node = model.trees_root[idx_tree + 1]
+        weight = np.float64(model.trees_weight[idx_tree])
+
+        features = model.trees_nodes_feature[root_node:end_node]
+        lines = ["booster[%d] [%s]:" % (
+            idx_tree, ' '.join("f%d" % f for f in np.unique(features[
+                features >= 0])))]
+        for node_id, depth, _ in model._preorder_visit(idx_tree):
+            indent = '\t' * (depth + 1)
+            if model.is_leaf_node(node_id):
+                lines.append("%s%d:leaf=%r" % (
+                    indent, node_id - root_node,
+                    float(model.trees_nodes_value[node_id] * weight)))
+            else:
+                lines.append("%s%d:[f%d<=%r]" % (
+                    indent, node_id - root_node,
+                    model.trees_nodes_feature[node_id],
+                    model.trees_nodes_value[node_id]))
+        lines.append('')
+
+        return '\n'.join(lines)
+
+    @staticmethod
+    def _count_nodes(file_path, n_trees=None):
         """
         Count the total number of nodes (both split and leaf nodes)
         in the model identified by file_path.
 
         Parameters
         ----------
-        file_path : str
+        file_path : str or file object
             The path to the filename where the model has been saved
+        n_trees : None or int
+            The maximum number of trees to consider. The parsing stops as soon
+            as n_trees trees have been read. By default all the trees are
+            considered.
 
         Returns
         -------
@@ -153,15 +220,18 @@ class ProxyScikitLearn(object):
             The total number of trees and nodes (both split and leaf nodes)
             in the model identified by file_path.
         """
+        max_trees = n_trees
 
         n_nodes = 0
         n_trees = 0
 
-        with open(file_path, 'r') as f:
+        with _model_file(file_path) as f:
             for line in f:
 
                 match = tree_reg.match(line)
                 if match:
+                    if n_trees == max_trees:
+                        break
                     n_trees += 1
                     continue
 
@@ -176,19 +246,127 @@ class ProxyScikitLearn(object):
         return n_trees, n_nodes
 
     @staticmethod
-    def export_scikit_model(model, file_path):
-        if not hasattr(model, 'estimators_'):
+    def _index_trees(file_path):
+        """
+        Compute the byte offsets of the trees in the model identified by
+        file_path, without parsing them.
+
+        Parameters
+        ----------
+        file_path : str
+            The path to the filename where the model has been saved
+
+        Returns
+        -------
+        offsets : numpy 1d array of int
+            The byte offset where each tree starts, followed by the byte
+            offset where the file ends.
+        """
+        offsets = []
+        pos = 0
+        with open(file_path, 'rb') as f:
+            for line in f:
+                if line.startswith(b'booster['):
+                    offsets.append(pos)
+                pos += len(line)
+        offsets.append(pos)
+        return np.array(offsets, dtype=np.int64)
+
+
+    @staticmethod
+    def load_estimator(estimator, model):
+        """
+        Load the model from a fitted Scikit-Learn ensemble of regression trees,
+        reading directly the arrays of the trees (no intermediate file).
+
+        Gradient boosting ensembles (having an init_ estimator) are loaded
+        with their base score and learning rate, while averaging ensembles
+        (e.g., random forests) are loaded by weighting each tree by the inverse
+        of the number of trees.
+
+        Parameters
+        ----------
+        estimator : sklearn.ensemble estimator
+            The fitted ensemble to convert
+        model : RTEnsemble
+            The model instance to fill
+        """
+        try:
+            from sklearn.tree import _tree
+        except ImportError:
+            raise ImportError("Scikit-Learn is required for loading a "
+                              "Scikit-Learn estimator")
+
+        if not hasattr(estimator, 'estimators_'):
             raise TypeError("Only ensemble-based models are supported!")
 
-        if not hasattr(model, 'init_'):
+        trees = [tree.tree_ for tree in np.ravel(estimator.estimators_)]
+        n_trees = len(trees)
+        sizes = np.array([tree_.node_count for tree_ in trees], dtype=np.int32)
+
+        # Initialize the model and allocate the needed space
+        # given the shape and size of the ensemble
+        model.initialize(n_trees, int(sizes.sum()))
+
+        model.trees_root[:] = np.cumsum(sizes) - sizes
+        if hasattr(estimator, 'init_'):
+            model.trees_weight[:] = 1
+            model.base_score = ProxyScikitLearn._get_base_score(estimator)
+            model.learning_rate = estimator.learning_rate
+        else:
+            model.trees_weight[:] = 1. / n_trees
+
+        for root_node, tree_ in zip(model.trees_root, trees):
+            end_node = root_node + tree_.node_count
+            is_leaf = tree_.children_left == _tree.TREE_LEAF
+
+            left = tree_.children_left + root_node
+            right = tree_.children_right + root_node
+            left[is_leaf] = right[is_leaf] = -1
+            model.trees_left_child[root_node:end_node] = left
+            model.trees_right_child[root_node:end_node] = right
+
+            model.trees_nodes_feature[root_node:end_node] = \
+                np.where(is_leaf, -1, tree_.feature)
+            model.trees_nodes_value[root_node:end_node] = \
+                np.where(is_leaf, tree_.value[:, 0, 0], tree_.threshold)
+
+    @staticmethod
+    def _get_base_score(estimator):
+        """
+        Retrieve the initial prediction (global bias) of a Scikit-Learn
+        gradient boosting ensemble.
+
+        Parameters
+        ----------
+        estimator : sklearn.ensemble estimator
+            The fitted gradient boosting ensemble
+
+        Returns
+        -------
+        base_score : float
+            The initial prediction score of all instances
+        """
+        if not hasattr(estimator, 'init_'):
             raise TypeError("Base score missing!")
-        if hasattr(model.init_, "quantile"):
-            base_score = model.init_.quantile
-        elif hasattr(model.init_, "mean"):
-            base_score = model.init_.mean
+        if hasattr(estimator.init_, "quantile"):
+            return float(estimator.init_.quantile)
+        elif hasattr(estimator.init_, "mean"):
+            return float(estimator.init_.mean)
+        elif hasattr(estimator.init_, "constant_"):
+            return float(np.ravel(estimator.init_.constant_)[0])
+        elif estimator.init_ == 'zero':
+            return 0.
         else:
             raise TypeError("Base score unknown!")
 
+    @staticmethod
+    def export_scikit_model(model, file_path):
+        if not hasattr(model, 'estimators_'):
+            raise TypeError("Only ensemble-based models are supported!")
+
+        base_score = ProxyScikitLearn._get_base_score(model)
+
 
         with open(file_path, 'w') as writer:
             if not hasattr(model, 'init_'):
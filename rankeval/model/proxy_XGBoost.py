@@ -34,11 +34,12 @@ different predictions with respect to the original model. Without a fix by
 XGBoost authors, DO NOT USE this proxy.
 """
 
+import json
 import re
 import sys
 import numpy as np
 
-from rt_ensemble import RTEnsemble
+from rt_ensemble import RTEnsemble, _model_file
 
 tree_reg = re.compile("^booster\[(\d+)\]")
 node_reg = re.compile("(\d+):\[f(\d+)<(.*)\]")
@@ -52,32 +53,38 @@ class ProxyXGBoost(object):
     """
 
     @staticmethod
-    def load(file_path, model):
+    def load(file_path, model, n_trees=None):
         """
         Load the model from the file identified by file_path.
 
         Parameters
         ----------
-        file_path : str
+        file_path : str or file object
             The path to the filename where the model has been saved
         model : RTEnsemble
             The model instance to fill
+        n_trees : None or int
+            The maximum number of trees to load. The parsing stops as soon as
+            n_trees trees have been read. By default all the trees are loaded.
         """
-        n_trees, n_nodes = ProxyXGBoost._count_nodes(file_path)
+        n_trees, n_nodes = ProxyXGBoost._count_nodes(file_path, n_trees)
         # Initialize the model and allocate the needed space
         # given the shape and size of the ensemble
         model.initialize(n_trees, n_nodes)
 
         root_node = 0
         num_nodes = 0
+        curr_tree = -1
         queue = list()
-        with open(file_path, 'r') as f:
+        with _model_file(file_path) as f:
             for line in f:
 
                 match_tree = tree_reg.match(line)
                 if match_tree:
                     assert(len(queue) == 0)
-                    curr_tree = int(match_tree.group(1))
+                    curr_tree += 1
+                    if curr_tree == n_trees:
+                        break
                     root_node += num_nodes
                     num_nodes = 0
                     model.trees_root[curr_tree] = root_node
@@ -120,6 +127,76 @@ class ProxyXGBoost(object):
                     # of being the left or right child.
                     queue.extend([(node_id, 'R'), (node_id, 'L')])
 
+    @staticmethod
+    def load_booster(booster, model, read_base_score=True):
+        """
+        Load the model from a trained XGBoost Booster, reading the tree
+        structures returned by its trees_to_dataframe method (no intermediate
+        file).
+
+        Parameters
+        ----------
+        booster : xgboost.Booster or xgboost.XGBModel
+            The trained model to convert
+        model : RTEnsemble
+            The model instance to fill
+        read_base_score : bool
+            Whether the base score has to be read from the booster
+            configuration (when the installed XGBoost version exposes it).
+        """
+        try:
+            import xgboost
+        except ImportError:
+            raise ImportError("XGBoost is required for loading a XGBoost "
+                              "booster")
+
+        if isinstance(booster, xgboost.XGBModel):
+            booster = booster.get_booster()
+
+        df = booster.trees_to_dataframe().sort_values(['Tree', 'Node'])
+        tree_ids = df['Tree'].values
+        n_trees = tree_ids.max() + 1 if tree_ids.size else 0
+        sizes = np.bincount(tree_ids, minlength=n_trees)
+
+        # Initialize the model and allocate the needed space
+        # given the shape and size of the ensemble
+        model.initialize(n_trees, tree_ids.size)
+
+        model.trees_root[:] = np.cumsum(sizes) - sizes
+        model.trees_weight[:] = 1
+
+        # The node ids are not guaranteed to be contiguous in each tree (e.g.,
+        # after pruning), thus they are remapped by means of their "T-N" label.
+        node_index = dict(zip(df['ID'].values, np.arange(tree_ids.size)))
+        is_leaf = (df['Feature'] == 'Leaf').values
+        splits = np.where(~is_leaf)[0]
+
+        features = df['Feature'].values[splits]
+        if booster.feature_names is not None:
+            feature_map = dict((f, idx) for idx, f in
+                               enumerate(booster.feature_names))
+            features = [feature_map[f] for f in features]
+        else:
+            features = [int(f[1:]) for f in features]
+
+        # Needed because XGBoost use as split condition < in place of <=
+        thresholds = df['Split'].values[splits].astype(np.float32)
+        thresholds = np.nextafter(thresholds, thresholds - 1,
+                                  dtype=model.trees_nodes_value.dtype)
+
+        model.trees_nodes_feature[splits] = features
+        model.trees_nodes_value[splits] = thresholds
+        model.trees_nodes_value[is_leaf] = df['Gain'].values[is_leaf]
+        model.trees_left_child[splits] = \
+            [node_index[child] for child in df['Yes'].values[splits]]
+        model.trees_right_child[splits] = \
+            [node_index[child] for child in df['No'].values[splits]]
+
+        if read_base_score and hasattr(booster, 'save_config'):
+            config = json.loads(booster.save_config())
+            model.base_score = float(
+                config['learner']['learner_model_param']['base_score'])
+
     @staticmethod
     def save(file_path, model):
         """
@@ -136,19 +213,84 @@ class ProxyXGBoost(object):
         -------
         status : bool
             Returns true if the save is successful, false otherwise
+
+        Notes
+        -----
+        The model is written in a streaming fashion, tree by tree, directly
+        from the node arrays of the model, using the textual format produced
+        by the XGBoost dump_model method. The weight of each tree and the
+        learning rate are folded into the leaves output, while the difference
+        between the base score and the XGBoost default one (0.5, assumed on
+        loading) is added to the leaves output of the first tree.
+        """
+        with open(file_path, 'w') as f_out:
+            for idx_tree in xrange(model.n_trees):
+                f_out.write(ProxyXGBoost._get_tree_text(model, idx_tree))
+
+        return True
+
+    @staticmethod
+    def _get_tree_text(model, idx_tree):
+        """
+        Builds the textual representation of the given tree, by visiting it
+        iteratively (no recursion is involved). The node ids are local to the
+        tree.
+
+        Parameters
+        ----------
+        model : RTEnsemble
+            The model
+        idx_tree : int
+            The index of the tree to represent
+
+        Returns
+        -------
+        text : str
+            The textual representation of the tree, in the XGBoost format.
         """
-        raise NotImplementedError("Feature not implemented!")
+        root_node = model.trees_root[idx_tree]
+        weight = np.float64(model.trees_weight[idx_tree]) * model.learning_rate
+        bias = 0.
+        if idx_tree == 0:
+            bias = (model.base_score or 0.) - 0.5
+
+        lines = ["booster[%d]:" % idx_tree]
+        for node_id, depth, _ in model._preorder_visit(idx_tree):
+            if model.is_leaf_node(node_id):
+                leaf_value = model.trees_nodes_value[node_id] * weight + bias
+                lines.append("%s%d:leaf=%r" % ('\t' * depth,
+                                               node_id - root_node,
+                                               float(leaf_value)))
+            else:
+                # Needed because XGBoost use as split condition < in place of
+                # <= (the opposite conversion is made on loading)
+                threshold = model.trees_nodes_value[node_id]
+                threshold = np.nextafter(threshold, threshold + 1,
+                                         dtype=threshold.dtype)
+                left_child = model.trees_left_child[node_id] - root_node
+                lines.append("%s%d:[f%d<%r] yes=%d,no=%d,missing=%d" % (
+                    '\t' * depth, node_id - root_node,
+                    model.trees_nodes_feature[node_id], threshold,
+                    left_child, model.trees_right_child[node_id] - root_node,
+                    left_child))
+        lines.append('')
+
+        return '\n'.join(lines)
 
     @staticmethod
-    def _count_nodes(file_path):
+    def _count_nodes(file_path, n_trees=None):
         """
         Count the total number of nodes (both split and leaf nodes)
         in the model identified by file_path.
 
         Parameters
         ----------
-        file_path : str
+        file_path : str or file object
             The path to the filename where the model has been saved
+        n_trees : None or int
+            The maximum number of trees to consider. The parsing stops as soon
+            as n_trees trees have been read. By default all the trees are
+            considered.
 
         Returns
         -------
@@ -156,15 +298,18 @@ class ProxyXGBoost(object):
             The total number of trees and nodes (both split and leaf nodes)
             in the model identified by file_path.
         """
+        max_trees = n_trees
 
         n_nodes = 0
         n_trees = 0
 
-        with open(file_path, 'r') as f:
+        with _model_file(file_path) as f:
             for line in f:
 
                 match = tree_reg.match(line)
                 if match:
+                    if n_trees == max_trees:
+                        break
                     n_trees += 1
                     continue
 
@@ -176,4 +321,31 @@ class ProxyXGBoost(object):
                 if match_leaf:
                     n_nodes += 1
 
-        return n_trees, n_nodes
\ No newline at end of file
+        return n_trees, n_nodes
+
+    @staticmethod
+    def _index_trees(file_path):
+        """
+        Compute the byte offsets of the trees in the model identified by
+        file_path, without parsing them.
+
+        Parameters
+        ----------
+        file_path : str
+            The path to the filename where the model has been saved
+
+        Returns
+        -------
+        offsets : numpy 1d array of int
+            The byte offset where each tree starts, followed by the byte
+            offset where the file ends.
+        """
+        offsets = []
+        pos = 0
+        with open(file_path, 'rb') as f:
+            for line in f:
+                if line.startswith(b'booster['):
+                    offsets.append(pos)
+                pos += len(line)
+        offsets.append(pos)
+        return np.array(offsets, dtype=np.int64)
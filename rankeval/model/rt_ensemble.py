@@ -11,8 +11,11 @@ trees.
 """
 
 import copy
+import io
+from contextlib import contextmanager
 
 import numpy as np
+import scipy.sparse
 
 from ..scoring.scorer import Scorer
 
@@ -29,16 +32,23 @@ class RTEnsemble(object):
     delegated to the various proxies model.
     """
 
+    # the arrays modelling the trees, shared as views by the model copies
+    _TREES_ARRAYS = ("trees_root", "trees_weight", "trees_left_child",
+                     "trees_right_child", "trees_nodes_value",
+                     "trees_nodes_feature")
+
     def __init__(self, file_path, name=None, format="QuickRank",
-                 base_score=None, learning_rate=1, n_trees=None):
+                 base_score=None, learning_rate=1, n_trees=None, lazy=False):
         """
         Load the model from the file identified by file_path using the given
         format.
 
         Parameters
         ----------
-        file_path : str
-            The fpath to the filename where the model has been saved
+        file_path : str or None
+            The fpath to the filename where the model has been saved. If None,
+            an empty model is created, to be filled by a proxy model (see for
+            example the from_sklearn, from_lightgbm and from_xgboost methods)
         name : str
             The name to be given to the current model
         format : ['QuickRank', 'ScikitLearn', 'XGBoost', 'LightGBM']
@@ -52,7 +62,13 @@ class RTEnsemble(object):
              each tree. By default it is set to 1 (no shrinking at all).
         n_trees : None or int
             The maximum number of trees to load from the model. By default it is
-            set to None, meaning the method will load all the trees.
+            set to None, meaning the method will load all the trees. The
+            parsing of the model stops as soon as n_trees trees have been read.
+        lazy : bool
+            If True, the model file is only indexed (i.e., the byte offset of
+            each tree is stored) and the trees are not loaded. The trees can
+            then be materialized on demand, range by range, by means of the
+            load_trees method. By default it is set to False.
 
         Attributes
         ----------
@@ -87,6 +103,10 @@ class RTEnsemble(object):
             feature identified by the trees_nodes_feature data structure).
         trees_nodes_feature: list of integers
             Numpy array modelling the feature-id used by the selected splitting node (or -1 if the node is a leaf).
+        trees_index: TreesIndex
+            The structural index of the trees (node ranges, depth, number of
+            leaves, leaf statistics and features used by each tree). It is
+            computed on first access and cached until the trees change.
 
         Returns
         -------
@@ -94,7 +114,7 @@ class RTEnsemble(object):
             The loaded model as a RTEnsemble object
         """
         self.file = file_path
-        self.name = "RTEnsemble: " + file_path
+        self.name = "RTEnsemble: %s" % file_path
         if name is not None:
             self.name = name
         self.learning_rate = learning_rate
@@ -114,25 +134,58 @@ class RTEnsemble(object):
         self.trees_nodes_feature = None
 
         self._cache_scorer = dict()
+        self._trees_index = None
+
+        self._format = format
+        self._trees_offsets = None
+
+        if file_path is None:
+            return
+
+        proxy = RTEnsemble._get_proxy(format)
+        if lazy:
+            self._trees_offsets = proxy._index_trees(file_path)
+            self.n_trees = self._trees_offsets.size - 1
+            if n_trees is not None:
+                self.n_trees = min(n_trees, self.n_trees)
+            return
+
+        proxy.load(file_path, self, n_trees=n_trees)
+
+        if n_trees is not None and n_trees < self.n_trees:
+            self._prune_model(n_trees)
 
+    @staticmethod
+    def _get_proxy(format):
+        """
+        Returns the proxy model implementing the loading/storing of the given
+        model format.
+
+        Parameters
+        ----------
+        format : ['QuickRank', 'ScikitLearn', 'XGBoost', 'LightGBM']
+            The model format
+
+        Returns
+        -------
+        proxy : class
+            The proxy model class
+        """
         if format == "QuickRank":
             from rankeval.model import ProxyQuickRank
-            ProxyQuickRank.load(file_path, self)
+            return ProxyQuickRank
         elif format == "LightGBM":
             from rankeval.model import ProxyLightGBM
-            ProxyLightGBM.load(file_path, self)
+            return ProxyLightGBM
         elif format == "XGBoost":
             from rankeval.model import ProxyXGBoost
-            ProxyXGBoost.load(file_path, self)
+            return ProxyXGBoost
         elif format == "ScikitLearn":
             from rankeval.model import ProxyScikitLearn
-            ProxyScikitLearn.load(file_path, self)
+            return ProxyScikitLearn
         else:
             raise TypeError("Model format %s not yet supported!" % format)
 
-        if n_trees is not None and n_trees < self.n_trees:
-            self._prune_model(n_trees)
-
     def initialize(self, n_trees, n_nodes):
         """
         Initialize the internal data structures in order to reflect the given
@@ -162,6 +215,157 @@ class RTEnsemble(object):
         self.trees_nodes_feature = \
             np.full(shape=n_nodes, fill_value=-1, dtype=np.int16)
 
+        self._trees_index = None
+
+    @classmethod
+    def from_sklearn(cls, estimator, name=None, n_trees=None):
+        """
+        Build the model directly from a fitted Scikit-Learn tree ensemble
+        (e.g., GradientBoostingRegressor or RandomForestRegressor), without
+        exporting it on file.
+
+        Parameters
+        ----------
+        estimator : sklearn.ensemble estimator
+            The fitted ensemble to convert
+        name : str
+            The name to be given to the current model
+        n_trees : None or int
+            The maximum number of trees to load from the model. By default it is
+            set to None, meaning the method will load all the trees.
+
+        Returns
+        -------
+        model : RTEnsemble
+            The converted model as a RTEnsemble object
+        """
+        from rankeval.model import ProxyScikitLearn
+        if name is None:
+            name = "RTEnsemble: %s" % type(estimator).__name__
+        model = cls(None, name=name, format="ScikitLearn")
+        ProxyScikitLearn.load_estimator(estimator, model)
+        if n_trees is not None and n_trees < model.n_trees:
+            model._prune_model(n_trees)
+        return model
+
+    @classmethod
+    def from_lightgbm(cls, booster, name=None, n_trees=None):
+        """
+        Build the model directly from a trained LightGBM Booster (or one of
+        the LightGBM Scikit-Learn wrappers), without dumping it on file.
+
+        Parameters
+        ----------
+        booster : lightgbm.Booster or lightgbm.LGBMModel
+            The trained model to convert
+        name : str
+            The name to be given to the current model
+        n_trees : None or int
+            The maximum number of trees to load from the model. By default it is
+            set to None, meaning the method will load all the trees.
+
+        Returns
+        -------
+        model : RTEnsemble
+            The converted model as a RTEnsemble object
+        """
+        from rankeval.model import ProxyLightGBM
+        if name is None:
+            name = "RTEnsemble: %s" % type(booster).__name__
+        model = cls(None, name=name, format="LightGBM")
+        ProxyLightGBM.load_booster(booster, model)
+        if n_trees is not None and n_trees < model.n_trees:
+            model._prune_model(n_trees)
+        return model
+
+    @classmethod
+    def from_xgboost(cls, booster, name=None, base_score=None, n_trees=None):
+        """
+        Build the model directly from a trained XGBoost Booster (or one of
+        the XGBoost Scikit-Learn wrappers), without dumping it on file.
+
+        Parameters
+        ----------
+        booster : xgboost.Booster or xgboost.XGBModel
+            The trained model to convert
+        name : str
+            The name to be given to the current model
+        base_score : None or float
+            The initial prediction score of all instances, global bias.
+            If None, it is read from the booster configuration when available,
+            otherwise it uses the XGBoost default value (0.5).
+        n_trees : None or int
+            The maximum number of trees to load from the model. By default it is
+            set to None, meaning the method will load all the trees.
+
+        Returns
+        -------
+        model : RTEnsemble
+            The converted model as a RTEnsemble object
+        """
+        from rankeval.model import ProxyXGBoost
+        if name is None:
+            name = "RTEnsemble: %s" % type(booster).__name__
+        model = cls(None, name=name, format="XGBoost", base_score=base_score)
+        ProxyXGBoost.load_booster(booster, model,
+                                  read_base_score=base_score is None)
+        if n_trees is not None and n_trees < model.n_trees:
+            model._prune_model(n_trees)
+        return model
+
+    def is_lazy(self):
+        """
+        This method returns true if the model has been loaded lazily, i.e., if
+        only the index of the trees is available, false otherwise.
+        """
+        return self._trees_offsets is not None
+
+    def load_trees(self, start=0, end=None):
+        """
+        Materialize the trees in the range [start, end) of a lazily loaded
+        model, by parsing only the portion of the model file storing them.
+        Useful for tree-wise analysis of huge models.
+
+        The base score and the learning rate of the returned model are the
+        ones of the whole model.
+
+        Parameters
+        ----------
+        start : int
+            The index of the first tree to load
+        end : None or int
+            The index following the last tree to load. By default it is set to
+            None, meaning all the trees up to the last one.
+
+        Returns
+        -------
+        model : RTEnsemble
+            The model composed by the given range of trees
+        """
+        if not self.is_lazy():
+            raise RuntimeError("The model has not been loaded lazily")
+        if end is None or end > self.n_trees:
+            end = self.n_trees
+        if start < 0 or start > end:
+            raise ValueError("Invalid range of trees [%d, %d)" % (start, end))
+
+        offsets = self._trees_offsets
+        with open(self.file, 'rb') as f:
+            # the header and the footer of the model are kept, so that the
+            # fragment is itself a valid model
+            fragment = f.read(offsets[0])
+            f.seek(offsets[start])
+            fragment += f.read(offsets[end] - offsets[start])
+            f.seek(offsets[-1])
+            fragment += f.read()
+
+        model = RTEnsemble(None, name="%s [%d:%d]" % (self.name, start, end),
+                           format=self._format, base_score=self.base_score,
+                           learning_rate=self.learning_rate)
+        model.file = self.file
+        RTEnsemble._get_proxy(self._format).load(io.BytesIO(fragment), model)
+        return model
+
     def is_leaf_node(self, index):
         """
         This method returns true if the node identified by the given index is a
@@ -175,6 +379,51 @@ class RTEnsemble(object):
         return self.trees_left_child[index] == -1 and \
                self.trees_right_child[index] == -1
 
+    def _preorder_visit(self, idx_tree):
+        """
+        Iterative (i.e., stack-based) pre-order visit of the given tree, where
+        the left child of each split node is visited before the right one.
+        Useful for writing the model on file without incurring in the python
+        recursion limit for deep trees.
+
+        Parameters
+        ----------
+        idx_tree : int
+            The index of the tree to visit
+
+        Returns
+        -------
+        visit : generator of tuple(int, int, str or None)
+            The node index, its depth in the tree, and its position with
+            respect to the parent node ('left' or 'right', None for the root).
+        """
+        stack = [(self.trees_root[idx_tree], 0, None)]
+        while stack:
+            node, depth, pos = stack.pop()
+            yield node, depth, pos
+            if not self.is_leaf_node(node):
+                depth += 1
+                stack.append((self.trees_right_child[node], depth, 'right'))
+                stack.append((self.trees_left_child[node], depth, 'left'))
+
+    @property
+    def trees_index(self):
+        """
+        The structural index of the trees composing the model. The index is
+        built on first access (i.e., once the proxy model has filled the
+        trees) and then cached, until the trees are modified by pruning.
+
+        Returns
+        -------
+        trees_index : TreesIndex
+            The structural index of the model
+        """
+        if self._trees_index is None:
+            if self.trees_root is None:
+                raise RuntimeError("The model does not have trees loaded")
+            self._trees_index = TreesIndex(self)
+        return self._trees_index
+
     def max_leaves(self):
         """
         Computes the maximum number of leaves across the trees of the model.
@@ -184,16 +433,21 @@ class RTEnsemble(object):
         max_leaves : int
             Maximum number of leaves
         """
+        return self.trees_index.n_leaves.max()
 
-        n_leaves = np.full(shape=self.n_trees, fill_value=-1, dtype=np.int32)
-        for idx_tree in xrange(self.n_trees):
-            root_node = self.trees_root[idx_tree]
-            next_root_node = self.n_nodes
-            if idx_tree+1 != self.n_trees:
-                next_root_node = self.trees_root[idx_tree + 1]
-            n_leaves[idx_tree] = (self.trees_left_child[root_node:next_root_node] == -1).sum()
+    def used_features(self):
+        """
+        Computes the ids of the features used by at least one split node of
+        the model. Useful for loading only the features needed for scoring
+        the model (see the features parameter of Dataset.load).
 
-        return n_leaves.max()
+        Returns
+        -------
+        features : numpy 1d array
+            The sorted ids of the features used by the model
+        """
+        indptr = self.trees_index.feature_trees.indptr
+        return np.flatnonzero(np.diff(indptr)).astype(np.int32)
 
     def save(self, f, format="QuickRank"):
         """
@@ -212,22 +466,9 @@ class RTEnsemble(object):
         status : bool
             Returns true if the save is successful, false otherwise
         """
-        if format == "QuickRank":
-            from rankeval.model import ProxyQuickRank
-            return ProxyQuickRank.save(f, self)
-        elif format == "LightGBM":
-            from rankeval.model import ProxyLightGBM
-            return ProxyLightGBM.save(f, self)
-        elif format == "XGBoost":
-            from rankeval.model import ProxyXGBoost
-            return ProxyXGBoost.save(f, self)
-        elif format == "ScikitLearn":
-            from rankeval.model import ProxyScikitLearn
-            return ProxyScikitLearn.save(f, self)
-        else:
-            raise TypeError("Model format %s not yet supported!" % format)
+        return RTEnsemble._get_proxy(format).save(f, self)
 
-    def score(self, dataset, detailed=False):
+    def score(self, dataset, detailed=False, cache=True):
         """
         Score the given model on the given dataset. Depending on the detailed
         parameter, the scoring will be either basic (i.e., compute only the
@@ -242,6 +483,10 @@ class RTEnsemble(object):
         detailed : bool
             True if the model has to be scored in a detailed fashion, false
             otherwise
+        cache : bool
+            Whether the scorer has to be cached. Datasets scored only once
+            (e.g., the batches of a dataset, see Dataset.iter_batches) should
+            not be cached, for not keeping them in memory.
 
         Returns
         -------
@@ -255,17 +500,15 @@ class RTEnsemble(object):
             on a tree basis (i.e., tree by tree and instance by instance)
         """
 
-        # check that the features used by the model are "compatible" with the
-        # features in the dataset (at least, in terms of their number)
-        if np.max(self.trees_nodes_feature) + 1 > dataset.X.shape[1]:
-            raise RuntimeError("Dataset features are not compatible with "
-                               "model features")
+        if self.is_lazy():
+            raise RuntimeError("Lazy models can not be scored: use load_trees "
+                               "for materializing the trees first")
 
-        if dataset not in self._cache_scorer or \
-                detailed and self._cache_scorer[dataset].partial_y_pred is None:
+        scorer = self._cache_scorer.get(dataset) if cache else None
+        if scorer is None or detailed and scorer.partial_y_pred is None:
 
-            scorer = Scorer(self, dataset)
-            self._cache_scorer[dataset] = scorer
+            model, X = self._remap_features(dataset)
+            scorer = Scorer(model, dataset, X=X)
             # The scoring is performed only if it has not been done before...
             scorer.score(detailed)
 
@@ -279,12 +522,69 @@ class RTEnsemble(object):
                 if detailed:
                     scorer.partial_y_pred[:, :1] += self.base_score
 
-        scorer = self._cache_scorer[dataset]
+            if cache:
+                self._cache_scorer[dataset] = scorer
+
         if detailed:
             return scorer.y_pred, scorer.partial_y_pred, scorer.y_leaves
         else:
             return scorer.y_pred
 
+    def _remap_features(self, dataset):
+        """
+        Returns the model and the feature matrix to use for scoring the given
+        dataset. If the dataset stores only a subset of the features (see
+        Dataset.features), or it is a view selecting some of the columns of
+        the original matrix (see Dataset.scoring_matrix), the returned model
+        is a copy of this model (sharing the trees) whose split nodes refer to
+        the columns of the matrix instead of the feature ids.
+
+        Parameters
+        ----------
+        dataset : Dataset
+            The dataset to be scored
+
+        Returns
+        -------
+        model : RTEnsemble
+            The model to use for scoring the dataset
+        X : numpy 2d array of float
+            The feature matrix to score
+        """
+        X, matrix_columns = dataset.scoring_matrix()
+        features = getattr(dataset, "features", None)
+        if features is None:
+            # check that the features used by the model are "compatible" with
+            # the features in the dataset (at least, in terms of their number)
+            if self.trees_index.n_features > dataset.n_features:
+                raise RuntimeError("Dataset features are not compatible with "
+                                   "model features")
+            if matrix_columns is None:
+                return self, X
+            columns = np.arange(self.trees_index.n_features, dtype=np.int32)
+        else:
+            columns = np.full(max(self.trees_index.n_features,
+                                  features.max() + 1), -1, dtype=np.int32)
+            columns[features] = np.arange(features.size, dtype=np.int32)
+            used_columns = columns[self.used_features()]
+            if (used_columns < 0).any():
+                raise RuntimeError("Dataset features are not compatible with "
+                                   "model features")
+
+        if matrix_columns is not None:
+            # refer the columns of the dataset to the columns of the matrix
+            stored = columns >= 0
+            columns[stored] = matrix_columns[columns[stored]]
+
+        model = self.copy()
+        splits = model.trees_nodes_feature >= 0
+        nodes_feature = np.full(self.n_nodes, -1, dtype=np.int16)
+        nodes_feature[splits] = columns[model.trees_nodes_feature[splits]]
+        nodes_feature.flags.writeable = False
+        model.trees_nodes_feature = nodes_feature
+        model._trees_index = None
+        return model, X
+
     def clear_cache(self):
         """
         This method is used to clear the internal cache of the model from the
@@ -297,7 +597,13 @@ class RTEnsemble(object):
     def copy(self, n_trees=None):
         """
         Create a copy of this model, with all the trees up to the given number.
-        By default n_trees is set to None, meaning to copy all the trees
+        By default n_trees is set to None, meaning to copy all the trees.
+
+        The copy does not duplicate the trees: its node arrays are read-only
+        views of the arrays of this model, and the scoring cache is not
+        copied. Creating several (truncated) copies of a big model is thus
+        almost free in terms of memory. Call make_writeable on the copy
+        before modifying its trees in place.
 
         Parameters
         ----------
@@ -310,11 +616,33 @@ class RTEnsemble(object):
             The copied model, pruned from all the trees exceeding the given
             number of trees chosen
         """
-        new_model = copy.deepcopy(self)
+        new_model = copy.copy(self)
+        new_model._cache_scorer = dict()
+        if self.trees_root is not None:
+            for attr in RTEnsemble._TREES_ARRAYS:
+                view = getattr(self, attr).view()
+                view.flags.writeable = False
+                setattr(new_model, attr, view)
         if n_trees is not None:
             new_model._prune_model(n_trees=n_trees)
         return new_model
 
+    def make_writeable(self):
+        """
+        Copy-on-write of the trees: the node arrays shared with other models
+        (i.e., read-only views created by the copy method) are replaced by
+        private copies, so that they can be modified in place without
+        affecting the model they have been copied from.
+        """
+        if self.trees_root is None:
+            return
+        for attr in RTEnsemble._TREES_ARRAYS:
+            array = getattr(self, attr)
+            if not array.flags.writeable:
+                setattr(self, attr, array.copy())
+        self._cache_scorer = dict()
+        self._trees_index = None
+
     def _prune_model(self, n_trees):
         """
         This method prunes the ensemble of trees up to the given number of trees
@@ -344,8 +672,159 @@ class RTEnsemble(object):
         self.n_trees = n_trees
         self.n_nodes = start_idx_prune
 
-        # Reset cache scorer
+        # Reset cache scorer and structural index
         self._cache_scorer = dict()
+        self._trees_index = None
 
     def __str__(self):
         return self.name
+
+
+class TreesIndex(object):
+    """
+    Class storing the structural index of the trees composing an ensemble
+    model. The index is computed once, in a vectorized fashion, so that the
+    analysis and scoring methods needing the boundaries or the shape of the
+    trees do not have to derive them again from the trees_root array.
+    """
+
+    def __init__(self, model):
+        """
+        Builds the structural index of the given model.
+
+        Parameters
+        ----------
+        model : RTEnsemble
+            The model to index
+
+        Attributes
+        ----------
+        trees_end : numpy 1d array (n_trees)
+            The index following the last node of each tree, i.e., each tree
+            spans the node range [trees_root[i], trees_end[i])
+        n_leaves : numpy 1d array (n_trees)
+            The number of leaves of each tree
+        nodes_depth : numpy 1d array (n_nodes)
+            The depth of each node, being 0 the depth of the roots
+        trees_depth : numpy 1d array (n_trees)
+            The depth of each tree, i.e., the maximum depth of its leaves
+        leaves_min : numpy 1d array (n_trees)
+            The minimum output value of the leaves of each tree (unweighted)
+        leaves_max : numpy 1d array (n_trees)
+            The maximum output value of the leaves of each tree (unweighted)
+        leaves_sum : numpy 1d array (n_trees)
+            The sum of the output values of the leaves of each tree (unweighted)
+        n_features : int
+            The number of features used by the model, i.e., the maximum feature
+            id used by a split node plus one
+        tree_features : scipy.sparse.csr_matrix (n_trees x n_features)
+            Tree to feature index. Row i stores the (sorted) ids of the
+            features used by tree i, with the number of split nodes using each
+            of them as values
+        feature_trees : scipy.sparse.csr_matrix (n_features x n_trees)
+            Feature to tree inverted index. Row f stores the (sorted) ids of
+            the trees using feature f, with the number of split nodes using it
+            as values
+        """
+        n_trees = model.n_trees
+        n_nodes = model.n_nodes
+        roots = model.trees_root
+
+        self.trees_end = np.empty(n_trees, dtype=np.int32)
+        self.trees_end[:-1] = roots[1:]
+        self.trees_end[-1:] = n_nodes
+
+        is_leaf = (model.trees_left_child == -1) & \
+                  (model.trees_right_child == -1)
+        values = model.trees_nodes_value
+
+        self.n_leaves = np.add.reduceat(is_leaf, roots).astype(np.int32)
+        self.leaves_min = np.minimum.reduceat(
+            np.where(is_leaf, values, np.inf), roots).astype(np.float32)
+        self.leaves_max = np.maximum.reduceat(
+            np.where(is_leaf, values, -np.inf), roots).astype(np.float32)
+        self.leaves_sum = np.add.reduceat(
+            np.where(is_leaf, values, 0), roots, dtype=np.float64)
+
+        # the depth is computed level by level, starting from the roots
+        self.nodes_depth = np.zeros(n_nodes, dtype=np.int32)
+        nodes = roots[~is_leaf[roots]]
+        depth = 0
+        while nodes.size:
+            depth += 1
+            nodes = np.concatenate((model.trees_left_child[nodes],
+                                    model.trees_right_child[nodes]))
+            self.nodes_depth[nodes] = depth
+            nodes = nodes[~is_leaf[nodes]]
+        self.trees_depth = np.maximum.reduceat(self.nodes_depth, roots)
+
+        # tree-id of each split node, for building the tree-feature index
+        trees_id = np.repeat(np.arange(n_trees, dtype=np.int32),
+                             self.trees_end - roots)
+        splits = ~is_leaf
+        features = model.trees_nodes_feature[splits].astype(np.int32)
+        self.n_features = int(features.max()) + 1 if features.size else 0
+
+        self.tree_features = scipy.sparse.csr_matrix(
+            (np.ones(features.size, dtype=np.int32),
+             (trees_id[splits], features)),
+            shape=(n_trees, self.n_features))
+        self.tree_features.sum_duplicates()
+        self.feature_trees = self.tree_features.T.tocsr()
+        self.feature_trees.sort_indices()
+
+    def features_of_tree(self, idx_tree):
+        """
+        Returns the ids of the features used by the given tree.
+
+        Parameters
+        ----------
+        idx_tree : int
+            The index of the tree
+
+        Returns
+        -------
+        features : numpy 1d array
+            The sorted ids of the features used by the tree
+        """
+        indptr = self.tree_features.indptr
+        return self.tree_features.indices[indptr[idx_tree]:indptr[idx_tree+1]]
+
+    def trees_of_feature(self, feature):
+        """
+        Returns the ids of the trees using the given feature.
+
+        Parameters
+        ----------
+        feature : int
+            The id of the feature
+
+        Returns
+        -------
+        trees : numpy 1d array
+            The sorted ids of the trees using the feature
+        """
+        if feature >= self.n_features:
+            return np.empty(0, dtype=self.feature_trees.indices.dtype)
+        indptr = self.feature_trees.indptr
+        return self.feature_trees.indices[indptr[feature]:indptr[feature+1]]
+
+
+@contextmanager
+def _model_file(f):
+    """
+    Context manager opening the model file identified by the given path. If f
+    is already a file object, it is rewound and used as is (e.g., a tree range
+    materialized by RTEnsemble.load_trees).
+
+    Parameters
+    ----------
+    f : str or file object
+        The path to the model file, or the file object itself
+    """
+    if hasattr(f, 'read'):
+        f.seek(0)
+        yield f
+    else:
+        with open(f, 'r') as f_in:
+            yield f_in
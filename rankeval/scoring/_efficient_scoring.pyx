@@ -32,16 +32,16 @@ def basic_scoring(model, X):
     cdef np.intp_t n_instances = X.shape[0]
     cdef np.intp_t n_trees = model.n_trees
 
-    cdef float[:, :] X_view = X
+    cdef const float[:, :] X_view = X
     y = np.zeros(n_instances, dtype=np.float32)
     cdef float[:] y_view = y
 
-    cdef int[:] trees_root = model.trees_root
-    cdef float[:] trees_weight = model.trees_weight
-    cdef short[:] trees_nodes_feature = model.trees_nodes_feature
-    cdef float[:] trees_nodes_value = model.trees_nodes_value
-    cdef int[:] trees_left_child = model.trees_left_child
-    cdef int[:] trees_right_child  = model.trees_right_child
+    cdef const int[:] trees_root = model.trees_root
+    cdef const float[:] trees_weight = model.trees_weight
+    cdef const short[:] trees_nodes_feature = model.trees_nodes_feature
+    cdef const float[:] trees_nodes_value = model.trees_nodes_value
+    cdef const int[:] trees_left_child = model.trees_left_child
+    cdef const int[:] trees_right_child  = model.trees_right_child
 
     cdef int leaf_node
     cdef np.intp_t idx_tree, idx_instance
@@ -71,19 +71,19 @@ def detailed_scoring(model, X):
     cdef np.intp_t n_instances = X.shape[0]
     cdef np.intp_t n_trees = model.n_trees
 
-    cdef float[:, :] X_view = X
+    cdef const float[:, :] X_view = X
     y_leaves = np.zeros((X.shape[0], model.n_trees), dtype=np.int32)
     cdef int[:, :] y_leaves_view = y_leaves
 
     partial_y = np.zeros((X.shape[0], model.n_trees), dtype=np.float32)
     cdef float[:, :] partial_y_view = partial_y
 
-    cdef int[:] trees_root = model.trees_root
-    cdef float[:] trees_weight = model.trees_weight
-    cdef short[:] trees_nodes_feature = model.trees_nodes_feature
-    cdef float[:] trees_nodes_value = model.trees_nodes_value
-    cdef int[:] trees_left_child = model.trees_left_child
-    cdef int[:] trees_right_child  = model.trees_right_child
+    cdef const int[:] trees_root = model.trees_root
+    cdef const float[:] trees_weight = model.trees_weight
+    cdef const short[:] trees_nodes_feature = model.trees_nodes_feature
+    cdef const float[:] trees_nodes_value = model.trees_nodes_value
+    cdef const int[:] trees_left_child = model.trees_left_child
+    cdef const int[:] trees_right_child  = model.trees_right_child
 
     cdef int leaf_node
     cdef np.intp_t idx_tree, idx_instance
@@ -110,15 +110,15 @@ def detailed_scoring(model, X):
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
-cdef int _score_single_instance_single_tree(float[:,:] X,
+cdef int _score_single_instance_single_tree(const float[:,:] X,
                                             np.intp_t idx_instance,
                                             np.intp_t idx_tree,
-                                            int[:] trees_root,
-                                            float[:] trees_weight,
-                                            short[:] trees_nodes_feature,
-                                            float[:] trees_nodes_value,
-                                            int[:] trees_left_child,
-                                            int[:] trees_right_child) nogil:
+                                            const int[:] trees_root,
+                                            const float[:] trees_weight,
+                                            const short[:] trees_nodes_feature,
+                                            const float[:] trees_nodes_value,
+                                            const int[:] trees_left_child,
+                                            const int[:] trees_right_child) nogil:
 
     # Check the usage of np.intp_t in plave of np.int16_t
     cdef int cur_node = trees_root[idx_tree]
@@ -9,7 +9,9 @@
 Class for efficient scoring of an ensemble-based model composed of binary regression trees on a given dataset.
 """
 
-from ..dataset import Dataset
+import numpy as np
+
+from ..dataset import Dataset, ChunkedMatrix, CompressedMatrix
 from _efficient_scoring import basic_scoring, detailed_scoring
 
 
@@ -28,6 +30,10 @@ class Scorer(object):
         The model to use for scoring
     dataset: Dataset
         The dataset to use for scoring
+    X: None or numpy 2d array of float
+        The feature matrix to score, if different from the one of the dataset
+        (e.g., the rows of the original matrix for a view of the dataset, with
+        the model referring to the columns selected by the view)
 
     Attributes
     ----------
@@ -35,6 +41,8 @@ class Scorer(object):
         The model to use for scoring
     dataset : Dataset
         The dataset to use for scoring
+    X : None or numpy 2d array of float
+        The feature matrix to score (None for scoring the one of the dataset)
     y_pred : numpy array of float
         The predicted scores produced by the given model for each sample of the given dataset X
     partial_y_pred : numpy 2d-array of float
@@ -42,9 +50,10 @@ class Scorer(object):
 
     """
 
-    def __init__(self, model, dataset):
+    def __init__(self, model, dataset, X=None):
         self.model = model
         self.dataset = dataset
+        self.X = X
 
         # Save the predicted scores for each dataset instance
         self.y_pred = None
@@ -81,15 +90,42 @@ class Scorer(object):
                         detailed and self.y_leaves is not None:
             return self.y_pred
 
-        if detailed:
+        X = self.dataset.X if self.X is None else self.X
+        if isinstance(X, (CompressedMatrix, ChunkedMatrix)):
+            self._score_blocks(X, detailed)
+        elif detailed:
             self.y_leaves, self.partial_y_pred = \
-                detailed_scoring(self.model, self.dataset.X)
+                detailed_scoring(self.model, X)
             self.y_pred = self.partial_y_pred.sum(axis=1)
         else:
-            self.y_pred = basic_scoring(self.model, self.dataset.X)
+            self.y_pred = basic_scoring(self.model, X)
 
         return self.y_pred
 
+    def _score_blocks(self, X, detailed):
+        """
+        Score a compressed or chunked feature matrix, by decoding (and scoring)
+        a block of rows at a time, so that the whole matrix is never
+        materialized.
+        """
+        if detailed:
+            self.y_leaves = np.empty((X.shape[0], self.model.n_trees),
+                                     dtype=np.int32)
+            self.partial_y_pred = np.empty((X.shape[0], self.model.n_trees),
+                                           dtype=np.float32)
+        else:
+            self.y_pred = np.empty(X.shape[0], dtype=np.float32)
+
+        for start, end, X_block in X.iter_blocks():
+            if detailed:
+                self.y_leaves[start:end], self.partial_y_pred[start:end] = \
+                    detailed_scoring(self.model, X_block)
+            else:
+                self.y_pred[start:end] = basic_scoring(self.model, X_block)
+
+        if detailed:
+            self.y_pred = self.partial_y_pred.sum(axis=1)
+
     def get_predicted_scores(self):
         """
         Provide an accessor to the predicted scores produced by the given model for each sample of the given dataset X
@@ -4,7 +4,7 @@ import unittest
 
 import numpy as np
 from numpy.testing import assert_array_almost_equal, assert_allclose, \
-    assert_array_equal
+    assert_array_equal, assert_equal
 
 from rankeval.analysis.feature import feature_importance, \
     _feature_importance_tree
@@ -44,6 +44,28 @@ class FeatureImportanceTestCase(unittest.TestCase):
         assert_array_equal(feature_cnt[features],
                            [1, 1, 1, 1])
 
+    def test_feature_importance_subset(self):
+        data_file = os.path.join(data_dir, "msn1.fold1.test.5k.txt")
+        dataset = Dataset.load(data_file, format="svmlight")
+        expected = feature_importance(self.model, dataset)
+        features = self.model.used_features()
+
+        # a dataset storing only the features used by the model
+        subset = Dataset.load(data_file, format="svmlight", features=features)
+        performance = feature_importance(self.model, subset)
+        assert_array_equal(performance.coords['feature'], features)
+        assert_allclose(performance.values,
+                        expected.sel(feature=features).values, atol=1e-6)
+        assert_equal(performance.sel(type='count').values, [1, 1, 1, 1])
+
+        # a view selecting (in reverse order) the columns of the subset
+        view = subset.subset_features([3, 2, 1, 0])
+        performance = feature_importance(self.model, view)
+        assert_array_equal(performance.coords['feature'], features[::-1])
+        assert_allclose(performance.values,
+                        expected.sel(feature=features[::-1]).values,
+                        atol=1e-6)
+
     def test_scoring_feature_importance(self):
 
         # default scores on the root node of the first tree
@@ -7,6 +7,7 @@ from numpy.testing import assert_almost_equal
 
 from rankeval.analysis.statistical import _randomization
 from rankeval.analysis.statistical import statistical_significance
+from rankeval.analysis.statistical import sampling_deviation
 from rankeval.dataset import Dataset
 from rankeval.metrics.ndcg import NDCG
 from rankeval.model import RTEnsemble
@@ -38,6 +39,18 @@ class StatisticalSignificanceTestCase(unittest.TestCase):
         statistical_significance([self.dataset], self.model_a, self.model_b,
                                  [self.metric], n_perm=100)
 
+    def test_sampling_deviation(self):
+        sample = self.dataset.sample_queries(frac=0.5, stratify_by="max_label",
+                                             seed=0)
+        deviation = sampling_deviation(self.dataset, sample, [self.model_a],
+                                       [self.metric], stratify_by="max_label")
+        full, sampled, delta, std_error = deviation.values[0, 0]
+        assert_almost_equal(full, self.metric.eval(
+            self.dataset, self.model_a.score(self.dataset))[0])
+        assert_almost_equal(delta, sampled - full)
+        assert std_error > 0
+        assert abs(delta) < 4 * std_error
+
     def test_randomization(self):
         A = np.array([1, 1, 1, 1, 1, 1, 1, 0, 0, 0])
         B = np.array([0, 0, 0, 0, 0, 0, 0, 1, 1, 1])
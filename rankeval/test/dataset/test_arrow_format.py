@@ -0,0 +1,91 @@
+import logging
+import os
+import unittest
+
+import numpy as np
+from numpy.testing import assert_equal, assert_array_equal
+
+try:
+    import pyarrow
+    pyarrow_missing = False
+except ImportError:
+    pyarrow_missing = True
+
+from rankeval.dataset import Dataset
+from rankeval.dataset.arrow_format import load_arrow_file, dump_arrow_file
+from ..base import data_dir
+
+datafile = os.path.join(data_dir, "msn1.fold1.test.5k.txt")
+
+
+@unittest.skipIf(pyarrow_missing, "pyarrow package missing")
+class ArrowFormatTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dataset = Dataset.load(datafile, format="svmlight")
+
+    @classmethod
+    def tearDownClass(cls):
+        del cls.dataset
+        cls.dataset = None
+
+    def setUp(self):
+        self.tmpfile = os.path.join(data_dir, "tmp.dataset.arrow")
+
+    def tearDown(self):
+        if os.path.exists(self.tmpfile):
+            os.remove(self.tmpfile)
+
+    def test_dump_load(self):
+        for format in ["parquet", "arrow"]:
+            self.dataset.dump(self.tmpfile, format)
+            loaded = Dataset.load(self.tmpfile, format=format)
+            assert_equal(loaded.X.flags['C_CONTIGUOUS'], True)
+            assert_equal(loaded.X.dtype, np.float32)
+            assert_equal(loaded.features, None)
+            assert_array_equal(loaded.X, self.dataset.X)
+            assert_array_equal(loaded.y, self.dataset.y)
+            assert_array_equal(loaded.query_ids, self.dataset.query_ids)
+            assert_array_equal(loaded.qids, self.dataset.qids)
+
+    def test_load_features(self):
+        for format in ["parquet", "arrow"]:
+            # several row groups (record batches) are written and read
+            dump_arrow_file(self.dataset.X, self.dataset.y,
+                            np.repeat(self.dataset.qids,
+                                      np.diff(self.dataset.query_ids)),
+                            self.tmpfile, format=format, row_group_rows=1000)
+            loaded = Dataset.load(self.tmpfile, format=format,
+                                  features=[5, 1])
+            assert_array_equal(loaded.features, [5, 1])
+            assert_array_equal(loaded.X, self.dataset.X[:, [5, 1]])
+            assert_array_equal(loaded.query_ids, self.dataset.query_ids)
+
+            self.assertRaises(ValueError, load_arrow_file, self.tmpfile,
+                              format=format, features=[1000])
+
+    def test_interleaved_queries(self):
+        X = np.arange(14, dtype=np.float32).reshape(7, 2)
+        y = np.arange(7, dtype=np.float32)
+        dump_arrow_file(X, y, np.array([5, 2, 5, 9, 2, 9, 5]), self.tmpfile,
+                        features=[3, 0])
+        loaded = Dataset.load(self.tmpfile, format="parquet")
+        assert_array_equal(loaded.features, [0, 3])
+        assert_array_equal(loaded.qids, [5, 2, 9])
+        assert_array_equal(loaded.y, [0, 2, 6, 1, 4, 3, 5])
+        assert_array_equal(loaded.X, X[loaded.y.astype(int)][:, [1, 0]])
+
+
+@unittest.skipIf(not pyarrow_missing, "pyarrow package installed")
+class ArrowFormatMissingTestCase(unittest.TestCase):
+
+    def test_pyarrow_required(self):
+        self.assertRaises(ImportError, Dataset.load, datafile,
+                          format="parquet")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s',
+                        level=logging.DEBUG)
+    unittest.main()
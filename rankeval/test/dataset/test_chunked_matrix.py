@@ -0,0 +1,80 @@
+import logging
+import os
+import unittest
+
+import numpy as np
+from numpy.testing import assert_equal, assert_array_equal, \
+    assert_array_almost_equal
+
+from rankeval.dataset import Dataset, ChunkedMatrix
+from rankeval.metrics import NDCG
+from rankeval.model import RTEnsemble
+from ..base import data_dir
+
+datafile = os.path.join(data_dir, "msn1.fold1.test.5k.txt")
+model_file = os.path.join(data_dir, "quickrank.model.xml")
+
+
+class ChunkedMatrixTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rs = np.random.RandomState(0)
+        self.X = rs.rand(100, 5).astype(np.float32)
+        self.blocks = [self.X[:30], self.X[30:31], self.X[31:]]
+
+    def test_indexing(self):
+        X = ChunkedMatrix(self.blocks)
+        assert_equal(X.shape, self.X.shape)
+        assert_array_equal(np.asarray(X), self.X)
+        assert_array_equal(X[25:40], self.X[25:40])
+        assert_array_equal(X[25:40, [1, 3]], self.X[25:40, [1, 3]])
+        assert_array_equal(X[[99, 0, 30, 31]], self.X[[99, 0, 30, 31]])
+        assert_array_equal(X[-1], self.X[-1])
+        assert_array_equal(X[:, 2], self.X[:, 2])
+        # a range of rows within a block is a slice of the block
+        assert_equal(X.rows(0, 20).base is self.X, True)
+        assert_array_equal(np.asarray(X.rows(20, 50)), self.X[20:50])
+
+    def test_iter_blocks(self):
+        X = ChunkedMatrix(self.blocks)
+        rows = np.concatenate([block for _, _, block in X.iter_blocks()])
+        assert_array_equal(rows, self.X)
+        assert_equal([(start, end) for start, end, _ in X.iter_blocks()],
+                     [(0, 30), (30, 31), (31, 100)])
+
+    def test_concatenate(self):
+        dataset = Dataset.load(datafile, format="svmlight")
+        split = dataset.n_queries // 3
+        first = dataset.subset_queries(slice(0, split)).materialize()
+        second = dataset.subset_queries(slice(split, None)).materialize()
+        second.compress()
+
+        weekly = Dataset.concatenate([first, second], name="weekly")
+        assert_equal(isinstance(weekly.X, ChunkedMatrix), True)
+        assert_equal(weekly.X.blocks[0] is first.X, True)
+        assert_array_equal(weekly.query_ids, dataset.query_ids)
+        assert_array_equal(weekly.qids, dataset.qids)
+        assert_array_equal(weekly.y, dataset.y)
+
+        model = RTEnsemble(model_file, format="QuickRank")
+        y_pred = model.score(weekly)
+        assert_array_almost_equal(y_pred, model.score(dataset))
+        ndcg = NDCG(cutoff=10)
+        assert_array_almost_equal(ndcg.eval(weekly, y_pred)[1],
+                                  ndcg.eval(dataset, model.score(dataset))[1])
+
+        # views over the blocks
+        view = weekly.subset_queries(slice(split - 2, split + 2))
+        start, end = dataset.query_ids[[split - 2, split + 2]]
+        assert_array_equal(view.X, dataset.X[start:end])
+        assert_array_almost_equal(model.score(view), y_pred[start:end])
+
+        assert_equal(weekly.compact() is weekly, True)
+        assert_equal(isinstance(weekly.X, np.ndarray), True)
+        assert_array_equal(weekly.X, dataset.X)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s',
+                        level=logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,77 @@
+import logging
+import os
+import unittest
+
+import numpy as np
+from numpy.testing import assert_equal, assert_array_equal
+
+from rankeval.dataset import Dataset, CompressedMatrix
+from rankeval.model import RTEnsemble
+from ..base import data_dir
+
+datafile = os.path.join(data_dir, "msn1.fold1.test.5k.txt")
+model_file = os.path.join(data_dir, "quickrank.model.xml")
+
+
+class CompressedMatrixTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rs = np.random.RandomState(0)
+        n_rows = 10000
+        self.X = np.column_stack([
+            rs.randint(0, 10, n_rows),              # few distinct values
+            rs.randint(0, 2000, n_rows) * 0.5,      # exact in float16
+            rs.randint(0, 5000, n_rows) * 0.1,      # 5000 distinct values
+            rs.rand(n_rows),                        # not compressible
+        ]).astype(np.float32)
+        self.X[0, 3] = np.nan
+
+    def test_encodings(self):
+        X = CompressedMatrix(self.X)
+        assert_array_equal(X.encodings,
+                           ["uint8", "float16", "uint16", "float32"])
+        assert_equal(X.shape, self.X.shape)
+        assert_equal(X.nbytes < self.X.nbytes, True)
+
+        X = CompressedMatrix(self.X, encodings=["float16"])
+        assert_array_equal(X.encodings,
+                           ["float16", "float16", "float32", "float32"])
+
+    def test_decoding(self):
+        X = CompressedMatrix(self.X)
+        assert_array_equal(np.asarray(X), self.X)
+        assert_array_equal(X.decode(100, 200), self.X[100:200])
+        assert_array_equal(X[5], self.X[5])
+        assert_array_equal(X[:, 2], self.X[:, 2])
+        assert_array_equal(X[[3, 1], 1:], self.X[[3, 1], 1:])
+        assert_array_equal(X[self.X[:, 0] > 5, 0], self.X[self.X[:, 0] > 5, 0])
+        assert_array_equal(np.asarray(X.rows(10, 20)), self.X[10:20])
+
+        blocks = [block.copy() for _, _, block in X.iter_blocks(3000)]
+        assert_array_equal(np.vstack(blocks), self.X)
+
+    def test_dataset_compress(self):
+        dataset = Dataset.load(datafile, format="svmlight")
+        model = RTEnsemble(model_file, format="QuickRank")
+        y_pred, partial_y_pred, y_leaves = model.score(dataset, detailed=True)
+        X = dataset.X
+
+        compressed = Dataset(X.copy(), dataset.y, dataset.query_ids)
+        compressed.compress()
+        assert_equal(isinstance(compressed.X, CompressedMatrix), True)
+        assert_array_equal(model.score(compressed), y_pred)
+        _, partial_y_pred2, y_leaves2 = model.score(compressed, detailed=True)
+        assert_array_equal(partial_y_pred2, partial_y_pred)
+        assert_array_equal(y_leaves2, y_leaves)
+
+        view = compressed.subset_queries(slice(3, 9))
+        start, end = dataset.query_ids[3], dataset.query_ids[9]
+        assert_array_equal(model.score(view), y_pred[start:end])
+
+        compressed.decompress()
+        assert_array_equal(compressed.X, X)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.DEBUG)
+    unittest.main()
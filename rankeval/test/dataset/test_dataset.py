@@ -1,11 +1,25 @@
 import logging
 import os
+import shutil
 import unittest
 
+import numpy as np
+from numpy.testing import assert_equal, assert_almost_equal, \
+    assert_array_equal, assert_array_almost_equal
+
 from rankeval.dataset import Dataset
+from rankeval.dataset.normalization import normalize_features
+from rankeval.dataset.shards import read_manifest, merge_query_scores
+from rankeval.dataset.svmlight_index import SvmlightIndex, \
+    group_svmlight_file
+from rankeval.metrics import NDCG, MAP, MSE, RMSE
+from rankeval.metrics.metric import eval_query_batches
+from rankeval.model import RTEnsemble
 from ..base import data_dir
 
 datafile = os.path.join(data_dir, "msn1.fold1.test.5k.txt")
+qid_datafile = os.path.join(data_dir, "svmlight_classification_qid.txt")
+model_file = os.path.join(data_dir, "quickrank.model.xml")
 
 
 class SVMLightLoaderTestCase(unittest.TestCase):
@@ -24,6 +38,464 @@ class SVMLightLoaderTestCase(unittest.TestCase):
         except TypeError:
             pass
 
+    def test_dump_svmlight(self):
+        dataset = Dataset.load(datafile, format="svmlight")
+        tmpfile = os.path.join(data_dir, "tmp.dataset.txt")
+        try:
+            dataset.dump(tmpfile, "svmlight")
+            loaded = Dataset.load(tmpfile, format="svmlight")
+            assert_array_equal(loaded.X, dataset.X)
+            assert_array_equal(loaded.y, dataset.y)
+            assert_array_equal(loaded.query_ids, dataset.query_ids)
+        finally:
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+
+    def test_subset_queries(self):
+        dataset = Dataset.load(datafile, format="svmlight")
+        model = RTEnsemble(model_file, format="QuickRank")
+        y_pred = model.score(dataset)
+
+        # contiguous queries: no copy of the data
+        view = dataset.subset_queries(slice(10, 50))
+        start, end = dataset.query_ids[10], dataset.query_ids[50]
+        assert_equal(view.n_queries, 40)
+        assert_equal(np.shares_memory(view.y, dataset.y), True)
+        assert_array_equal(view.query_ids,
+                           dataset.query_ids[10:51] - start)
+        assert_array_almost_equal(model.score(view), y_pred[start:end])
+        assert_equal(np.shares_memory(view.X, dataset.X), True)
+
+        # non contiguous queries
+        queries = [7, 1, 3]
+        rows = np.concatenate([np.arange(dataset.query_ids[q],
+                                         dataset.query_ids[q + 1])
+                               for q in queries])
+        view = dataset.subset_queries(queries)
+        assert_array_equal(view.X, dataset.X[rows])
+        assert_array_equal(view.y, dataset.y[rows])
+        assert_array_almost_equal(model.score(view), y_pred[rows])
+
+        ndcg = NDCG(cutoff=10)
+        assert_array_almost_equal(ndcg.eval(view, model.score(view))[1],
+                                  ndcg.eval(dataset, y_pred)[1][queries])
+
+        # clearing X drops the matrix of the view, not the original one
+        for view in [dataset.subset_queries(slice(0, 5)),
+                     dataset.subset_queries(queries)]:
+            view.X
+            view.clear_X()
+            assert_equal(view.X, None)
+            assert_equal(view.dataset, None)
+        assert_equal(dataset.X.shape, (dataset.n_instances,
+                                       dataset.n_features))
+
+    def test_subset_features(self):
+        dataset = Dataset.load(datafile, format="svmlight")
+        model = RTEnsemble(model_file, format="QuickRank")
+        features = np.random.RandomState(0).permutation(dataset.n_features)
+
+        view = dataset.subset_features(features).subset_queries(slice(5, 20))
+        start, end = dataset.query_ids[5], dataset.query_ids[20]
+        assert_equal(view.n_features, dataset.n_features)
+        # the view is scored without materializing the features
+        y_pred = model.score(view)
+        assert_equal(view.is_materialized(), False)
+
+        materialized = view.materialize()
+        assert_array_equal(materialized.X,
+                           dataset.X[start:end][:, features])
+        assert_array_almost_equal(y_pred, model.score(materialized))
+
+        # features referred by id are scored as the original dataset
+        dataset.features = np.arange(dataset.n_features, dtype=np.int32)
+        view = dataset.subset_features(features).subset_queries(slice(5, 20))
+        assert_array_equal(view.features, features)
+        assert_array_almost_equal(model.score(view),
+                                  model.score(dataset)[start:end])
+
+    def test_original_qids(self):
+        dataset = Dataset.load(qid_datafile, format="svmlight")
+        assert_array_equal(dataset.qids, [1, 37, 12])
+        assert_equal(dataset.query_offsets(37),
+                     (dataset.query_ids[1], dataset.query_ids[2]))
+        assert_array_equal(dataset.query_positions([12, 5, 1, 37]),
+                           [2, -1, 0, 1])
+        self.assertRaises(KeyError, dataset.query_offsets, 5)
+
+        tmpfile = os.path.join(data_dir, "tmp.dataset.txt")
+        try:
+            for format in ["svmlight", "rankeval"]:
+                dataset.save(tmpfile, format=format)
+                loaded = Dataset.load(tmpfile, format=format)
+                assert_array_equal(loaded.qids, dataset.qids)
+                del loaded
+        finally:
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+
+        # sparse qids are looked up with a binary search
+        dataset = Dataset(np.zeros((4, 1)), np.arange(4), [0, 2, 3, 4],
+                          qids=[10 ** 9, 7, 3 * 10 ** 9])
+        assert_array_equal(dataset.query_positions([7, 3 * 10 ** 9, 8]),
+                           [1, 2, -1])
+        assert_equal(dataset.query_offsets(10 ** 9), (0, 2))
+
+    def test_unsorted_qids(self):
+        X = np.arange(7, dtype=np.float32).reshape(-1, 1)
+        y = np.arange(7, dtype=np.float32)
+
+        # contiguous queries keep their order
+        dataset = Dataset(X, y, np.array([5, 5, 2, 2, 2, 9, 9]))
+        assert_array_equal(dataset.query_ids, [0, 2, 5, 7])
+        assert_array_equal(dataset.qids, [5, 2, 9])
+        assert_array_equal(dataset.y, y)
+
+        # interleaved queries are grouped by a stable sort
+        dataset = Dataset(X, y, np.array([5, 2, 5, 9, 2, 9, 5]))
+        assert_array_equal(dataset.query_ids, [0, 3, 5, 7])
+        assert_array_equal(dataset.qids, [5, 2, 9])
+        assert_array_equal(dataset.y, [0, 2, 6, 1, 4, 3, 5])
+        assert_array_equal(dataset.X[:, 0], dataset.y)
+
+        view = dataset.subset_queries([2, 0])
+        assert_array_equal(view.qids, [9, 5])
+        assert_equal(view.query_offsets(5), (2, 5))
+
+    def test_load_queries(self):
+        dataset = Dataset.load(datafile, format="svmlight")
+        queries = [7, 3, 4, 150]
+        expected = dataset.subset_queries(dataset.query_positions(queries))
+
+        index_file = datafile + ".qidx"
+        tmpfile = os.path.join(data_dir, "tmp.dataset.rankeval")
+        try:
+            loaded = Dataset.load(datafile, format="svmlight", queries=queries)
+            assert_equal(os.path.exists(index_file), True)
+            # the second load uses the sidecar index
+            loaded2 = Dataset.load(datafile, format="svmlight",
+                                   queries=queries, features=[5, 1])
+
+            dataset.save(tmpfile)
+            loaded3 = Dataset.load(tmpfile, format="rankeval", queries=queries)
+        finally:
+            for f in [index_file, tmpfile]:
+                if os.path.exists(f):
+                    os.remove(f)
+
+        for result in [loaded, loaded3]:
+            assert_array_equal(result.qids, queries)
+            assert_array_equal(result.query_ids, expected.query_ids)
+            assert_array_equal(result.X, expected.X)
+            assert_array_equal(result.y, expected.y)
+        assert_array_equal(loaded2.X, expected.X[:, [5, 1]])
+        del loaded3
+
+    def test_index_interleaved_queries(self):
+        tmpfile = os.path.join(data_dir, "tmp.dataset.txt")
+        index = SvmlightIndex.build(datafile)
+        assert_equal(index.n_features, 136)
+        assert_equal(index.n_rows.sum(), 5000)
+        try:
+            # write the first two queries interleaved
+            with open(datafile, "rb") as f_in, open(tmpfile, "wb") as f_out:
+                lines = f_in.readlines()
+                first = index.n_rows[0]
+                f_out.writelines(lines[:10] + lines[first:first + 10] +
+                                 lines[10:first])
+            loaded = Dataset.load(tmpfile, format="svmlight", queries=[1, 2])
+        finally:
+            for f in [tmpfile, tmpfile + ".qidx"]:
+                if os.path.exists(f):
+                    os.remove(f)
+
+        dataset = Dataset.load(datafile, format="svmlight")
+        first = dataset.query_ids[1]
+        assert_array_equal(loaded.query_ids, [0, first, first + 10])
+        assert_array_equal(loaded.X, dataset.X[:first + 10])
+
+    def test_group_interleaved_queries(self):
+        dataset = Dataset.load(datafile, format="svmlight")
+        tmpfile = os.path.join(data_dir, "tmp.dataset.txt")
+        grouped_file = os.path.join(data_dir, "tmp.grouped.txt")
+        try:
+            # split each query in two runs, the second ones in reverse order
+            with open(datafile, "rb") as f_in, open(tmpfile, "wb") as f_out:
+                lines = f_in.readlines()
+                halves = [(start + end) // 2 for start, end in
+                          zip(dataset.query_ids[:-1], dataset.query_ids[1:])]
+                for start, half in zip(dataset.query_ids[:-1], halves):
+                    f_out.writelines(lines[start:half])
+                for half, end in reversed(list(zip(halves,
+                                                   dataset.query_ids[1:]))):
+                    f_out.writelines(lines[half:end])
+            loaded = Dataset.load(tmpfile, format="svmlight")
+
+            index = SvmlightIndex.build(tmpfile)
+            assert_equal(index.is_grouped(), False)
+            group_svmlight_file(tmpfile, grouped_file, max_bytes=1 << 16,
+                                index=index)
+            assert_equal(SvmlightIndex.build(grouped_file).is_grouped(), True)
+            with open(datafile, "rb") as f_in, \
+                    open(grouped_file, "rb") as f_grouped:
+                assert_equal(f_grouped.read(), f_in.read())
+
+            batches = list(Dataset.load_batches(
+                tmpfile, max_bytes=1 << 18, n_features=dataset.n_features,
+                group_queries=True))
+        finally:
+            for f in [tmpfile, tmpfile + ".qidx", grouped_file]:
+                if os.path.exists(f):
+                    os.remove(f)
+
+        for result in [loaded, Dataset.concatenate(batches)]:
+            assert_array_equal(result.qids, dataset.qids)
+            assert_array_equal(result.query_ids, dataset.query_ids)
+            assert_array_equal(np.asarray(result.X), dataset.X)
+            assert_array_equal(result.y, dataset.y)
+
+    def test_load_many(self):
+        train, test = Dataset.load_many([qid_datafile, datafile],
+                                        names=["train", "test"], n_threads=2)
+        dataset = Dataset.load(datafile, format="svmlight")
+        assert_equal(train.name, "train")
+        assert_equal(train.n_features, dataset.n_features)
+        assert_equal(train.X.shape[1], dataset.n_features)
+        assert_array_equal(test.X, dataset.X)
+        assert_array_equal(test.query_ids, dataset.query_ids)
+
+    def test_iter_batches(self):
+        dataset = Dataset.load(datafile, format="svmlight")
+        max_bytes = 200 * dataset.n_features * 4
+        batches = list(dataset.iter_batches(max_bytes=max_bytes))
+        assert_equal(len(batches) > 1, True)
+        for batch in batches:
+            assert_equal(batch.X.nbytes <= max_bytes or batch.n_queries == 1,
+                         True)
+        assert_array_equal(np.concatenate([batch.y for batch in batches]),
+                           dataset.y)
+        assert_array_equal(np.concatenate([batch.qids for batch in batches]),
+                           dataset.qids)
+
+    def test_load_batches(self):
+        dataset = Dataset.load(datafile, format="svmlight")
+        max_bytes = 200 * dataset.n_features * 4
+        batches = list(Dataset.load_batches(datafile, max_bytes=max_bytes,
+                                            n_features=dataset.n_features))
+        assert_equal(len(batches) > 1, True)
+        assert_array_equal(np.concatenate([batch.X for batch in batches]),
+                           dataset.X)
+        assert_array_equal(np.concatenate([batch.qids for batch in batches]),
+                           dataset.qids)
+        sizes = np.concatenate([np.diff(batch.query_ids)
+                                for batch in batches])
+        assert_array_equal(sizes, np.diff(dataset.query_ids))
+
+    def test_eval_query_batches(self):
+        dataset = Dataset.load(datafile, format="svmlight")
+        model = RTEnsemble(model_file, format="QuickRank")
+        # MSE normalizes the per-query scores by the number of instances
+        metrics = [NDCG(cutoff=10), MAP(), MSE(), RMSE()]
+        y_pred = model.score(dataset)
+        expected = [metric.eval(dataset, y_pred) for metric in metrics]
+
+        batches = Dataset.load_batches(datafile, max_bytes=1 << 16,
+                                       n_features=dataset.n_features)
+        scores = eval_query_batches(batches, model, metrics)
+        for (score, detailed), (expected_score, expected_detailed) in \
+                zip(scores, expected):
+            assert_array_almost_equal(detailed, expected_detailed)
+            assert_almost_equal(score, expected_score, decimal=5)
+        assert_equal(len(metrics[0]._cache_idcg_score), 1)
+
+    def test_sample_queries(self):
+        dataset = Dataset.load(datafile, format="svmlight")
+        sample = dataset.sample_queries(frac=0.2, seed=1)
+        assert_equal(sample.n_queries, int(round(0.2 * dataset.n_queries)))
+        assert_equal(np.unique(sample.qids).size, sample.n_queries)
+        positions = dataset.query_positions(sample.qids)
+        assert_array_equal(positions, np.sort(positions))
+        start, end = dataset.query_offsets(sample.qids[0])
+        assert_array_equal(sample.X[:end - start], dataset.X[start:end])
+
+        same = dataset.sample_queries(n=sample.n_queries, seed=1)
+        assert_array_equal(same.qids, sample.qids)
+
+    def test_sample_queries_stratified(self):
+        dataset = Dataset.load(datafile, format="svmlight")
+        sample = dataset.sample_queries(frac=0.25, stratify_by="max_label",
+                                        seed=0)
+        strata = dataset.query_strata("max_label")
+        sizes = np.bincount(strata)
+        sampled = np.bincount(strata[dataset.query_positions(sample.qids)],
+                              minlength=sizes.size)
+        assert_equal(sampled.sum(), int(round(0.25 * dataset.n_queries)))
+        assert_equal((np.abs(sampled - sizes * 0.25) < 1).all(), True)
+
+    def test_normalize(self):
+        dataset = Dataset.load(datafile, format="svmlight")
+        X = dataset.X.copy()
+        expected = {"query_minmax": np.empty_like(X),
+                    "query_zscore": np.empty_like(X)}
+        for start, end in dataset.query_offset_iterator():
+            values = X[start:end].astype(np.float64)
+            low, high = values.min(axis=0), values.max(axis=0)
+            expected["query_minmax"][start:end] = \
+                (values - low) / np.where(high > low, high - low, 1)
+            std = values.std(axis=0)
+            expected["query_zscore"][start:end] = \
+                (values - values.mean(axis=0)) / np.where(std > 0, std, 1)
+        std = X.astype(np.float64).std(axis=0)
+        expected["global_zscore"] = \
+            (X - X.astype(np.float64).mean(axis=0)) / np.where(std > 0, std, 1)
+
+        for method in ["query_minmax", "query_zscore", "global_zscore"]:
+            normalized = dataset.normalize(method, inplace=False)
+            assert_array_equal(dataset.X, X)
+            assert_array_almost_equal(normalized.X, expected[method],
+                                      decimal=4)
+            # small blocks of queries
+            blocks = normalize_features(X.copy(), dataset.query_ids, method,
+                                        block_bytes=1 << 16)
+            assert_array_almost_equal(blocks, normalized.X, decimal=5)
+
+        matrix = dataset.X
+        assert_equal(dataset.normalize("query_minmax") is dataset, True)
+        assert_equal(dataset.X is matrix, True)
+        assert_array_almost_equal(dataset.X, expected["query_minmax"],
+                                  decimal=4)
+
+    def test_shard(self):
+        dataset = Dataset.load(datafile, format="svmlight")
+        shards = dataset.shard(4)
+        assert_equal(len(shards), 4)
+        assert_equal(sum(shard.n_instances for shard in shards),
+                     dataset.n_instances)
+        assert_array_equal(np.concatenate([shard.qids for shard in shards]),
+                           dataset.qids)
+        # balanced by instances: each shard is within a query of the ideal
+        max_query = np.diff(dataset.query_ids).max()
+        for shard in shards:
+            assert_equal(abs(shard.n_instances - dataset.n_instances / 4.)
+                         <= max_query, True)
+
+    def test_write_load_shards(self):
+        dataset = Dataset.load(datafile, format="svmlight")
+        model = RTEnsemble(model_file, format="QuickRank")
+        metrics = [NDCG(cutoff=10), MSE()]
+        y_pred = model.score(dataset)
+        expected = [metric.eval(dataset, y_pred) for metric in metrics]
+
+        prefix = os.path.join(data_dir, "tmp.dataset")
+        manifest = dataset.write_shards(prefix, 3)
+        info = read_manifest(manifest)
+        shard_files = [os.path.join(data_dir, shard["file"])
+                       for shard in info["shards"]]
+        try:
+            shard_scores = [{} for _ in metrics]
+            # the shards may be evaluated in any order
+            for i in [2, 0, 1]:
+                shard = Dataset.load_shard(manifest, i)
+                shard_pred = model.score(shard)
+                for metric, scores in zip(metrics, shard_scores):
+                    scores[i] = metric.eval(shard, shard_pred)[1].copy()
+                del shard
+        finally:
+            for f in shard_files + [manifest]:
+                if os.path.exists(f):
+                    os.remove(f)
+
+        assert_equal(info["n_queries"], dataset.n_queries)
+        ndcg_scores, mse_scores = shard_scores
+        merged = merge_query_scores(info, ndcg_scores)
+        assert_array_equal(merged, expected[0][1])
+        assert_equal(merged.mean(), expected[0][0])
+
+        # the MSE of each shard is normalized by the size of the shard
+        merged = merge_query_scores(info, mse_scores, metric=metrics[1])
+        assert_array_almost_equal(merged, expected[1][1])
+        assert_almost_equal(merged.sum(), expected[1][0], decimal=5)
+
+    def test_save_load_rankeval(self):
+        dataset = Dataset.load(datafile, format="svmlight")
+        tmpfile = os.path.join(data_dir, "tmp.dataset.rankeval")
+        try:
+            dataset.save(tmpfile)
+            loaded = Dataset.load(tmpfile, format="rankeval")
+            assert_equal(isinstance(loaded.X, np.memmap), True)
+            assert_equal(loaded.X.ctypes.data % 64, 0)
+            assert_array_equal(loaded.X, dataset.X)
+            assert_array_equal(loaded.y, dataset.y)
+            assert_array_equal(loaded.query_ids, dataset.query_ids)
+            assert_equal(loaded.n_queries, dataset.n_queries)
+            del loaded
+        finally:
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+
+    def test_sidecar_cache(self):
+        tmpfile = os.path.join(data_dir, "tmp.dataset.txt")
+        sidecar = tmpfile + ".rankeval"
+        shutil.copy(qid_datafile, tmpfile)
+        try:
+            dataset = Dataset.load(tmpfile, format="svmlight", cache=True)
+            assert_equal(os.path.exists(sidecar), True)
+
+            cached = Dataset.load(tmpfile, format="svmlight", cache=True)
+            assert_equal(isinstance(cached.X, np.memmap), True)
+            assert_equal(cached == dataset, True)
+            del cached
+
+            # touching the file does not invalidate the cache (same content)
+            os.utime(tmpfile, (0, 0))
+            cached = Dataset.load(tmpfile, format="svmlight", cache=True)
+            assert_equal(isinstance(cached.X, np.memmap), True)
+            del cached
+
+            with open(tmpfile, "a") as f:
+                f.write("4.0 qid:13 1:1\n")
+            changed = Dataset.load(tmpfile, format="svmlight", cache=True)
+            assert_equal(isinstance(changed.X, np.memmap), False)
+            assert_equal(changed.n_instances, dataset.n_instances + 1)
+            assert_array_equal(changed.y[-1], 4)
+        finally:
+            for f in [tmpfile, sidecar]:
+                if os.path.exists(f):
+                    os.remove(f)
+
+    def test_load_used_features(self):
+        model = RTEnsemble(model_file, format="QuickRank")
+        features = model.used_features()
+        full = Dataset.load(datafile, format="svmlight")
+
+        datasets = [Dataset.load(datafile, format="svmlight",
+                                 features=features)]
+        tmpfile = os.path.join(data_dir, "tmp.dataset.rankeval")
+        try:
+            for columnar in [False, True]:
+                full.save(tmpfile, columnar=columnar)
+                datasets.append(Dataset.load(tmpfile, format="rankeval",
+                                             features=features))
+            # a compact dataset keeps track of its features when saved
+            datasets[0].save(tmpfile)
+            datasets.append(Dataset.load(tmpfile, format="rankeval"))
+        finally:
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+
+        for dataset in datasets:
+            assert_array_equal(dataset.features, features)
+            assert_array_equal(dataset.X, full.X[:, features])
+            assert_array_equal(dataset.y, full.y)
+            assert_array_equal(dataset.query_ids, full.query_ids)
+            assert_array_equal(model.score(dataset), model.score(full))
+
+        # the model can not be scored if some of its features are missing
+        compact = Dataset.load(datafile, format="svmlight",
+                               features=features[1:])
+        with self.assertRaises(RuntimeError):
+            model.score(compact)
+
 if __name__ == '__main__':
     logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.DEBUG)
     unittest.main()
@@ -0,0 +1,205 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+from numpy.testing import assert_equal, assert_array_equal
+from six.moves import BaseHTTPServer
+
+from rankeval.dataset import Dataset
+from rankeval.dataset import datasets_fetcher
+from rankeval.dataset.datasets_fetcher import load_dataset
+from ..base import data_dir
+
+datafile = os.path.join(data_dir, "msn1.fold1.test.5k.txt")
+model_file = os.path.join(data_dir, "quickrank.model.xml")
+
+
+class _RangeRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Serve the files of the server root, supporting single byte range requests
+    ("bytes=<start>-") and recording the requests.
+    """
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get('Range')))
+        path = os.path.join(self.server.root, self.path.lstrip('/'))
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, 'rb') as f:
+            content = f.read()
+
+        start = 0
+        byte_range = self.headers.get('Range')
+        if byte_range is not None and self.server.ranges:
+            start = int(byte_range.split('=')[1].rstrip('-'))
+            if start >= len(content):
+                self.send_error(416)
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (
+                start, len(content) - 1, len(content)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(content) - start))
+        self.end_headers()
+        self.wfile.write(content[start:])
+
+    def log_message(self, *args):
+        pass
+
+
+class DatasetsFetcherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp_dir, "www")
+        self.data_home = os.path.join(self.tmp_dir, "rankeval_data")
+        os.makedirs(self.root)
+
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0),
+                                                _RangeRequestHandler)
+        self.server.root = self.root
+        self.server.requests = []
+        self.server.ranges = True
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = "http://127.0.0.1:%d/" % self.server.server_address[1]
+
+        dataset_archive = os.path.join(self.root, "msn.tar.gz")
+        with tarfile.open(dataset_archive, "w:gz",
+                          compresslevel=1) as archive:
+            archive.add(datafile, arcname="train.txt")
+            archive.add(datafile, arcname="test.txt")
+        with tarfile.open(os.path.join(self.root, "models.tar.gz"),
+                          "w:gz", compresslevel=1) as archive:
+            archive.add(model_file, arcname="quickrank.model.xml")
+
+        self.catalogue = {"msn": {
+            "DATASET_NAME": "msn",
+            "DATASET_FORMAT": "svmlight",
+            "DATASET_URL": self.url + "msn.tar.gz",
+            "DATASET_ARCHIVE_NAME": "msn.tar.gz",
+            "DATASET_CHECKSUM": "sha256:" + self._sha256(dataset_archive),
+            "MODELS_URL": self.url + "models.tar.gz",
+            "MODELS_ARCHIVE_NAME": "models.tar.gz",
+            "TRAIN_FILE": "train.txt",
+            "TEST_FILE": "test.txt",
+            "BLOG_POST_URL": self.url}}
+        self._write_catalogue()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_catalogue(self):
+        with open(os.path.join(self.root, "catalogue.json"), "w") as f:
+            json.dump(self.catalogue, f)
+
+    @staticmethod
+    def _sha256(f):
+        with open(f, 'rb') as f_in:
+            return hashlib.sha256(f_in.read()).hexdigest()
+
+    def _load(self, **kwargs):
+        return load_dataset("msn", data_home=self.data_home,
+                            catalogue_url=self.url + "catalogue.json",
+                            **kwargs)
+
+    def test_load_dataset(self):
+        container = self._load()
+        assert_equal(sorted(path for path, _ in self.server.requests),
+                     ["/catalogue.json", "/models.tar.gz", "/msn.tar.gz"])
+        expected = Dataset.load(datafile)
+        assert_array_equal(container.train_dataset.X, expected.X)
+        assert_array_equal(container.test_dataset.query_ids,
+                           expected.query_ids)
+        assert_equal([os.path.basename(f) for f in container.model_filenames],
+                     ["quickrank.model.xml"])
+        # the archives are removed, the binary caches are built
+        msn_home = os.path.join(self.data_home, "msn")
+        assert_equal(sorted(os.listdir(msn_home)), ["dataset", "models"])
+        assert_equal(os.path.exists(os.path.join(
+            msn_home, "dataset", "train.txt.rankeval")), True)
+
+        # the following loads neither access the network nor parse the files
+        del self.server.requests[:]
+        container = self._load()
+        assert_equal(self.server.requests, [])
+        assert_equal(isinstance(container.train_dataset.X, np.memmap), True)
+        container = self._load(offline=True)
+        assert_equal(self.server.requests, [])
+
+    def test_catalogue_ttl(self):
+        catalogue_url = self.url + "catalogue.json"
+        datasets_fetcher.__dataset_catalogue__(self.data_home,
+                                               url=catalogue_url)
+        self.catalogue["msn"]["TEST_FILE"] = "other.txt"
+        self._write_catalogue()
+
+        catalogue = datasets_fetcher.__dataset_catalogue__(
+            self.data_home, url=catalogue_url)
+        assert_equal(catalogue["msn"]["TEST_FILE"], "test.txt")
+        assert_equal(len(self.server.requests), 1)
+
+        catalogue = datasets_fetcher.__dataset_catalogue__(
+            self.data_home, url=catalogue_url, ttl=0)
+        assert_equal(catalogue["msn"]["TEST_FILE"], "other.txt")
+
+        # a stale catalogue is used if the server is not reachable
+        catalogue = datasets_fetcher.__dataset_catalogue__(
+            self.data_home, url=self.url + "missing.json", ttl=0)
+        assert_equal(catalogue["msn"]["TEST_FILE"], "other.txt")
+
+        shutil.rmtree(self.data_home)
+        self.assertRaises(IOError, datasets_fetcher.__dataset_catalogue__,
+                          self.data_home, url=catalogue_url, offline=True)
+
+    def test_resume_download(self):
+        source = os.path.join(self.root, "msn.tar.gz")
+        path = os.path.join(self.tmp_dir, "msn.tar.gz")
+        with open(source, 'rb') as f_in:
+            content = f_in.read()
+        checksum = self.catalogue["msn"]["DATASET_CHECKSUM"]
+
+        # an interrupted download is resumed from its last byte
+        with open(path + datasets_fetcher.PARTIAL_SUFFIX, 'wb') as f_out:
+            f_out.write(content[:1000])
+        datasets_fetcher.__download__(self.url + "msn.tar.gz", path,
+                                      checksum=checksum, chunk_bytes=4096)
+        assert_equal(self.server.requests[-1][1], "bytes=1000-")
+        assert_equal(self._sha256(path), self._sha256(source))
+        assert_equal(os.path.exists(path + datasets_fetcher.PARTIAL_SUFFIX),
+                     False)
+        os.remove(path)
+
+        # the download starts over if the server does not support ranges
+        self.server.ranges = False
+        with open(path + datasets_fetcher.PARTIAL_SUFFIX, 'wb') as f_out:
+            f_out.write(b"corrupted")
+        datasets_fetcher.__download__(self.url + "msn.tar.gz", path,
+                                      checksum=checksum)
+        assert_equal(self._sha256(path), self._sha256(source))
+        os.remove(path)
+
+        # a corrupted download is detected
+        self.assertRaises(IOError, datasets_fetcher.__download__,
+                          self.url + "msn.tar.gz", path,
+                          checksum="sha256:" + "0" * 64)
+        assert_equal(os.path.exists(path), False)
+        assert_equal(os.path.exists(path + datasets_fetcher.PARTIAL_SUFFIX),
+                     False)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main()
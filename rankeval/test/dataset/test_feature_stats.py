@@ -0,0 +1,78 @@
+import logging
+import os
+import unittest
+
+import numpy as np
+from numpy.testing import assert_equal, assert_array_equal, \
+    assert_array_almost_equal
+
+from rankeval.dataset import Dataset
+from rankeval.dataset.feature_stats import FeatureSketch
+from ..base import data_dir
+
+datafile = os.path.join(data_dir, "msn1.fold1.test.5k.txt")
+
+
+class FeatureSketchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rs = np.random.RandomState(0)
+        n_rows = 50000
+        self.X = np.column_stack([
+            rs.randint(0, 10, n_rows),              # few distinct values
+            rs.rand(n_rows),                        # uniform
+            rs.randn(n_rows) * 10,                  # gaussian
+        ]).astype(np.float32)
+
+    def assert_rank_error(self, X, quantiles, values, max_error=0.02):
+        for j in range(X.shape[1]):
+            for quantile, value in zip(quantiles, values[:, j]):
+                below = np.mean(X[:, j] < value)
+                below_equal = np.mean(X[:, j] <= value)
+                assert below - max_error <= quantile <= \
+                    below_equal + max_error
+
+    def test_quantiles(self):
+        sketch = FeatureSketch(3, capacity=256, seed=0)
+        for start in range(0, self.X.shape[0], 1000):
+            sketch.update(self.X[start:start + 1000])
+        quantiles = [0, 0.1, 0.25, 0.5, 0.75, 0.9, 1]
+        values = sketch.quantiles(quantiles)
+        self.assert_rank_error(self.X, quantiles, values)
+        assert_array_equal(values[0], self.X.min(axis=0))
+        assert_array_equal(values[-1], self.X.max(axis=0))
+
+    def test_merge(self):
+        half = self.X.shape[0] // 2
+        sketch = FeatureSketch(3, seed=0).update(self.X[:half])
+        sketch.merge(FeatureSketch(3, seed=1).update(self.X[half:]))
+        assert_equal(sketch.count, self.X.shape[0])
+        assert_array_almost_equal(sketch.sum / sketch.count,
+                                  self.X.mean(axis=0, dtype=np.float64))
+        quantiles = [0.25, 0.5, 0.75]
+        self.assert_rank_error(self.X, quantiles, sketch.quantiles(quantiles))
+
+    def test_describe_features(self):
+        dataset = Dataset.load(datafile, format="svmlight")
+        statistics = dataset.describe_features(n_threads=2)
+        assert_equal(statistics.shape, (dataset.n_features, 8))
+        assert_array_equal(statistics.loc[:, 'min'], dataset.X.min(axis=0))
+        assert_array_equal(statistics.loc[:, 'max'], dataset.X.max(axis=0))
+        assert_array_almost_equal(statistics.loc[:, 'mean'],
+                                  dataset.X.mean(axis=0, dtype=np.float64),
+                                  decimal=3)
+        assert_array_almost_equal(statistics.loc[:, 'zero_fraction'],
+                                  (dataset.X == 0).mean(axis=0))
+        self.assert_rank_error(dataset.X, [0.5],
+                               statistics.loc[:, ['q0.5']].values.T)
+
+        # the statistics of a view refer to its features
+        view = dataset.subset_features([3, 1])
+        assert_array_equal(view.describe_features().loc[:, 'max'],
+                           dataset.X[:, [3, 1]].max(axis=0))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s',
+                        level=logging.DEBUG)
+    unittest.main()
@@ -1,5 +1,8 @@
+import bz2
+import gzip
 import logging
 import os
+import tarfile
 import unittest
 
 import numpy as np
@@ -19,6 +22,7 @@ from rankeval.test.base import data_dir
 datafile = os.path.join(data_dir, "svmlight_classification.txt")
 invalidfile = os.path.join(data_dir, "svmlight_invalid.txt")
 qid_datafile = os.path.join(data_dir, "svmlight_classification_qid.txt")
+msn_datafile = os.path.join(data_dir, "msn1.fold1.test.5k.txt")
 
 
 class SVMLightLoaderTestCase(unittest.TestCase):
@@ -96,6 +100,112 @@ class SVMLightLoaderTestCase(unittest.TestCase):
         assert_equal(X2.dtype, X3.dtype)
         assert_equal(X3.dtype, np.float32)
 
+    def test_load_svmlight_files_n_features(self):
+        X, y, q = load_svmlight_file(msn_datafile, query_id=True)
+        X2, y2, q2 = load_svmlight_file(qid_datafile, query_id=True)
+
+        # the files are padded to the same number of features
+        result = load_svmlight_files([qid_datafile, msn_datafile],
+                                     query_id=True, n_threads=2)
+        assert_equal(len(result), 6)
+        assert_equal(result[0].shape, (X2.shape[0], X.shape[1]))
+        assert_array_equal(result[0][:, :X2.shape[1]], X2)
+        assert_array_equal(result[0][:, X2.shape[1]:], 0)
+        assert_array_equal(result[2], q2)
+        assert_array_equal(result[3], X)
+        assert_array_equal(result[5], q)
+
+        result = load_svmlight_files([qid_datafile] * 2, n_features=200)
+        assert_equal(result[0].shape[1], 200)
+        assert_equal(result[2].shape[1], 200)
+
+    def test_load_svmlight_file_threads(self):
+        tmpfile = "/tmp/tmp_threads.txt"
+        rng = np.random.RandomState(42)
+        X = rng.randn(5000, 10) * 10. ** rng.randint(-20, 20, size=(5000, 10))
+        X[rng.rand(*X.shape) < 0.3] = 0
+        y = rng.randint(5, size=5000)
+        q = np.repeat(np.arange(500), 10)
+        try:
+            with open(tmpfile, "w") as f:
+                for i in range(X.shape[0]):
+                    f.write("%d qid:%d " % (y[i], q[i]))
+                    f.write(" ".join("%d:%r" % (j + 1, X[i, j])
+                                     for j in np.nonzero(X[i])[0]))
+                    f.write("\n")
+            X1, y1, q1 = load_svmlight_file(tmpfile, query_id=True,
+                                            n_threads=1)
+            X4, y4, q4 = load_svmlight_file(tmpfile, query_id=True,
+                                            n_threads=4)
+        finally:
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+
+        n_features = np.nonzero(X.any(axis=0))[0].max() + 1
+        assert_array_equal(X1, X[:, :n_features].astype(np.float32))
+        assert_array_equal(y1, y)
+        assert_array_equal(q1, np.arange(0, 5001, 10))
+        assert_array_equal(X4, X1)
+        assert_array_equal(y4, y1)
+        assert_array_equal(q4, q1)
+
+    def test_load_svmlight_file_n_features(self):
+        X, y, q = load_svmlight_file(qid_datafile, query_id=True)
+        X_hint, y_hint, q_hint = load_svmlight_file(qid_datafile,
+                                                    query_id=True,
+                                                    n_features=40)
+        assert_array_equal(X_hint.shape, (4, 40))
+        assert_array_equal(X_hint[:, :33], X)
+        assert_array_equal(X_hint[:, 33:], 0)
+        assert_array_equal(y_hint, y)
+        assert_array_equal(q_hint, q)
+
+        try:
+            load_svmlight_file(qid_datafile, n_features=20)
+            assert False
+        except RuntimeError:
+            pass
+
+    def test_load_compressed_file(self):
+        X, y, q, qids = load_svmlight_file(msn_datafile, query_id=True,
+                                           original_qids=True)
+        with open(msn_datafile, "rb") as f:
+            content = f.read()
+
+        tmpfiles = ["/tmp/tmp_compressed.txt.gz", "/tmp/tmp_compressed.txt.bz2",
+                    "/tmp/tmp_compressed.tar.gz"]
+        try:
+            with gzip.open(tmpfiles[0], "wb") as f:
+                f.write(content)
+            # two concatenated streams
+            with open(tmpfiles[1], "wb") as f:
+                f.write(bz2.compress(content[:len(content) // 2]))
+                f.write(bz2.compress(content[len(content) // 2:]))
+            with tarfile.open(tmpfiles[2], "w:gz") as archive:
+                archive.add(msn_datafile, arcname="Fold1/test.txt")
+
+            loaded = [
+                load_svmlight_file(tmpfiles[0], query_id=True),
+                # small blocks: queries span over several blocks
+                load_svmlight_file(tmpfiles[0], query_id=True, buffer_mb=1,
+                                   original_qids=True),
+                load_svmlight_file(tmpfiles[1], query_id=True),
+                load_svmlight_file(tmpfiles[2], query_id=True,
+                                   member="Fold1/test.txt"),
+                load_svmlight_file(open(msn_datafile, "rb"), query_id=True)
+            ]
+        finally:
+            for tmpfile in tmpfiles:
+                if os.path.exists(tmpfile):
+                    os.remove(tmpfile)
+
+        for result in loaded:
+            assert_array_equal(result[0], X)
+            assert_array_equal(result[1], y)
+            assert_array_equal(result[2], q)
+        assert_array_equal(loaded[1][3], qids)
+        assert_equal(qids.size, q.size - 1)
+
     def test_load_invalid_file(self):
         try:
             load_svmlight_file(invalidfile)
@@ -166,6 +276,38 @@ class SVMLightLoaderTestCase(unittest.TestCase):
                 os.remove(tmpfile)
 
 
+    def test_dump_load_round_trip(self):
+        Xs, y, offsets = load_svmlight_file(msn_datafile, query_id=True)
+        # the qids of the file are numbered from 1
+        q = np.repeat(np.arange(1, len(offsets)), np.diff(offsets))
+        for suffix in ["", ".gz", ".bz2"]:
+            tmpfile = "/tmp/tmp_dump.txt" + suffix
+            try:
+                dump_svmlight_file(Xs, y, tmpfile, query_id=q, n_threads=2)
+                X2, y2, offsets2 = load_svmlight_file(tmpfile, query_id=True)
+
+                # the shortest representation is parsed as the same float
+                assert_array_equal(Xs, X2)
+                assert_array_equal(y, y2)
+                assert_array_equal(offsets, offsets2)
+            finally:
+                if os.path.exists(tmpfile):
+                    os.remove(tmpfile)
+
+        # the text written for a row is the one the row has been parsed from
+        with open(msn_datafile, "rb") as f:
+            first_line = f.readline()
+        tmpfile = "/tmp/tmp_dump.txt"
+        try:
+            with open(tmpfile, "wb") as f:
+                dump_svmlight_file(Xs[:1], y[:1], f, query_id=q[:1],
+                                   zero_based=False)
+            with open(tmpfile, "rb") as f:
+                assert_equal(f.read().split(), first_line.split())
+        finally:
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+
 if __name__ == '__main__':
     logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s', level=logging.DEBUG)
     unittest.main()
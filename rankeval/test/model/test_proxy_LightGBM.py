@@ -5,6 +5,14 @@ import unittest
 from numpy.testing import assert_equal, assert_array_equal, \
     assert_array_almost_equal
 
+import numpy as np
+
+try:
+    import lightgbm
+    lightgbm_missing = False
+except ImportError:
+    lightgbm_missing = True
+
 from rankeval.dataset import Dataset
 from rankeval.model import ProxyLightGBM
 from rankeval.model import RTEnsemble
@@ -82,6 +90,42 @@ class ProxyLightGBMTestCase(unittest.TestCase):
                                   [0.01775758, -0.00474655, -0.00474655,
                                    -0.00474655, -0.00474655])
 
+@unittest.skipIf(lightgbm_missing, "LightGBM package missing")
+class LightGBMInMemoryTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.RandomState(42)
+        cls.X = rng.rand(300, 8).astype(np.float32)
+        cls.y = rng.randint(0, 5, size=300).astype(np.float32)
+        cls.dataset = Dataset(cls.X, cls.y, np.repeat(np.arange(30), 10))
+        cls.booster = lightgbm.train(
+            {'objective': 'regression', 'num_leaves': 7, 'verbose': -1,
+             'min_data_in_leaf': 5, 'use_missing': False},
+            lightgbm.Dataset(cls.X, cls.y), num_boost_round=10)
+
+    def test_from_lightgbm(self):
+        model = RTEnsemble.from_lightgbm(self.booster)
+
+        assert_equal(model.n_trees, self.booster.num_trees())
+        assert_array_almost_equal(model.score(self.dataset),
+                                  self.booster.predict(self.X), decimal=5)
+
+    def test_leaf_correctness(self):
+        model = RTEnsemble.from_lightgbm(self.booster)
+        leaves = model.trees_nodes_feature == -1
+        assert_equal((model.trees_left_child[leaves] == -1).all(), True)
+        assert_equal((model.trees_right_child[leaves] == -1).all(), True)
+        assert_equal((model.trees_left_child[~leaves] > -1).all(), True)
+
+    def test_from_lightgbm_n_trees(self):
+        model = RTEnsemble.from_lightgbm(self.booster, n_trees=4)
+        assert_equal(model.n_trees, 4)
+        assert_array_almost_equal(
+            model.score(self.dataset),
+            self.booster.predict(self.X, num_iteration=4), decimal=5)
+
+
 if __name__ == '__main__':
     logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s',
                         level=logging.DEBUG)
@@ -2,14 +2,17 @@ import logging
 import os
 import unittest
 
+import numpy as np
 from numpy.testing import assert_equal, assert_array_equal, \
     assert_array_almost_equal
 
+from rankeval.dataset import Dataset
 from rankeval.model import ProxyQuickRank
 from rankeval.model import RTEnsemble
 from rankeval.test.base import data_dir
 
 model_file = os.path.join(data_dir, "quickrank.model.xml")
+data_file = os.path.join(data_dir, "msn1.fold1.test.5k.txt")
 
 
 class ProxyQuickRankTestCase(unittest.TestCase):
@@ -95,6 +98,25 @@ class ProxyQuickRankTestCase(unittest.TestCase):
         assert_array_almost_equal(self.model.trees_right_child, model_reloaded.trees_right_child,
                                   err_msg="Right children are incorrect")
 
+    def test_save_base_score_zero_weight(self):
+        dataset = Dataset.load(data_file, format="svmlight")
+        model = self.model
+        model.base_score = 0.5
+        model.trees_weight[0] = 0
+
+        saved_model_file = model_file + ".saved.xml"
+        try:
+            model.save(saved_model_file, format="QuickRank")
+            model_reloaded = RTEnsemble(saved_model_file, format="QuickRank")
+        finally:
+            os.remove(saved_model_file)
+
+        # the base score is stored as an additional single leaf tree
+        assert_equal(model_reloaded.n_trees, model.n_trees + 1)
+        assert_equal(np.isfinite(model_reloaded.trees_nodes_value).all(), True)
+        assert_array_almost_equal(model_reloaded.score(dataset),
+                                  model.score(dataset), decimal=5)
+
 
 
 
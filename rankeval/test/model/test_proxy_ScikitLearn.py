@@ -5,6 +5,15 @@ import unittest
 from numpy.testing import assert_equal, assert_array_equal, \
     assert_array_almost_equal
 
+import numpy as np
+
+try:
+    from sklearn.ensemble import GradientBoostingRegressor, \
+        RandomForestRegressor
+    scikit_missing = False
+except ImportError:
+    scikit_missing = True
+
 from rankeval.dataset import Dataset
 from rankeval.model import ProxyXGBoost
 from rankeval.model import RTEnsemble
@@ -83,6 +92,53 @@ class ProxyXGBoostTestCase(unittest.TestCase):
                                   [0.563043,  0.563043,  0.563043,
                                    0.563043,  0.563043])
 
+@unittest.skipIf(scikit_missing, "Scikit-Learn package missing")
+class ScikitLearnInMemoryTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.RandomState(42)
+        cls.X = rng.rand(300, 8).astype(np.float32)
+        cls.y = rng.randint(0, 5, size=300).astype(np.float32)
+        cls.dataset = Dataset(cls.X, cls.y, np.repeat(np.arange(30), 10))
+
+    def test_from_sklearn_gbrt(self):
+        estimator = GradientBoostingRegressor(
+            n_estimators=10, max_depth=3, learning_rate=0.2, random_state=0)
+        estimator.fit(self.X, self.y)
+        model = RTEnsemble.from_sklearn(estimator)
+
+        assert_equal(model.n_trees, 10)
+        assert_equal(model.learning_rate, 0.2)
+        assert_array_almost_equal(model.score(self.dataset),
+                                  estimator.predict(self.X), decimal=5)
+
+    def test_from_sklearn_forest(self):
+        estimator = RandomForestRegressor(
+            n_estimators=5, max_depth=4, random_state=0)
+        estimator.fit(self.X, self.y)
+        model = RTEnsemble.from_sklearn(estimator)
+
+        assert_array_almost_equal(model.score(self.dataset),
+                                  estimator.predict(self.X), decimal=5)
+
+    def test_from_sklearn_n_trees(self):
+        estimator = GradientBoostingRegressor(n_estimators=10, max_depth=2)
+        estimator.fit(self.X, self.y)
+        model = RTEnsemble.from_sklearn(estimator, n_trees=3)
+        assert_equal(model.n_trees, 3)
+        assert_equal(model.trees_nodes_value.size,
+                     sum(t.tree_.node_count
+                         for t in estimator.estimators_[:3, 0]))
+
+    def test_not_ensemble(self):
+        try:
+            RTEnsemble.from_sklearn(object())
+            assert False
+        except TypeError:
+            pass
+
+
 if __name__ == '__main__':
     logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s',
                         level=logging.DEBUG)
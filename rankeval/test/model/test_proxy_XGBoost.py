@@ -5,6 +5,14 @@ import unittest
 from numpy.testing import assert_equal, assert_array_equal, \
     assert_array_almost_equal
 
+import numpy as np
+
+try:
+    import xgboost
+    xgboost_missing = False
+except ImportError:
+    xgboost_missing = True
+
 from rankeval.dataset import Dataset
 from rankeval.model import ProxyXGBoost
 from rankeval.model import RTEnsemble
@@ -87,6 +95,36 @@ class ProxyXGBoostTestCase(unittest.TestCase):
                                   [0.43002582, 0.43002582, 0.43002582,
                                    0.47071534, 0.43002582])
 
+@unittest.skipIf(xgboost_missing, "XGBoost package missing")
+class XGBoostInMemoryTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        rng = np.random.RandomState(42)
+        cls.X = rng.rand(300, 8).astype(np.float32)
+        cls.y = rng.randint(0, 5, size=300).astype(np.float32)
+        cls.dataset = Dataset(cls.X, cls.y, np.repeat(np.arange(30), 10))
+        cls.booster = xgboost.train({'max_depth': 3, 'eta': 0.3},
+                                    xgboost.DMatrix(cls.X, cls.y),
+                                    num_boost_round=10)
+
+    def test_from_xgboost(self):
+        model = RTEnsemble.from_xgboost(self.booster)
+
+        assert_equal(model.n_trees, 10)
+        assert_array_almost_equal(
+            model.score(self.dataset),
+            self.booster.predict(xgboost.DMatrix(self.X)), decimal=5)
+
+    def test_from_xgboost_n_trees(self):
+        model = RTEnsemble.from_xgboost(self.booster, n_trees=4)
+        assert_equal(model.n_trees, 4)
+        assert_array_almost_equal(
+            model.score(self.dataset),
+            self.booster.predict(xgboost.DMatrix(self.X), ntree_limit=4),
+            decimal=5)
+
+
 if __name__ == '__main__':
     logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s',
                         level=logging.DEBUG)
@@ -2,11 +2,23 @@ import logging
 import os
 import unittest
 
+import numpy as np
+
+from numpy.testing import assert_equal, assert_array_equal, \
+    assert_array_almost_equal
+
+from rankeval.dataset import Dataset
 from rankeval.model import RTEnsemble
 from rankeval.test.base import data_dir
 
 model_file = os.path.join(data_dir, "quickrank.model.xml")
 
+model_files = [(model_file, "QuickRank"),
+               (os.path.join(data_dir, "LightGBM.model.txt"), "LightGBM"),
+               (os.path.join(data_dir, "XGBoost.model.txt"), "XGBoost"),
+               (os.path.join(data_dir, "ScikitLearn.model.txt"),
+                "ScikitLearn")]
+
 
 class ProxyModelTestCase(unittest.TestCase):
 
@@ -19,6 +31,176 @@ class ProxyModelTestCase(unittest.TestCase):
         except TypeError:
             pass
 
+    def test_truncated_loading(self):
+        for f, format in model_files:
+            proxy = RTEnsemble._get_proxy(format)
+            full_model = RTEnsemble(f, format=format)
+            n_nodes = full_model.trees_root[1]
+
+            assert_equal(proxy._count_nodes(f, n_trees=1), (1, n_nodes))
+
+            model = RTEnsemble(f, format=format, n_trees=1)
+            assert_equal(model.n_trees, 1)
+            assert_equal(model.n_nodes, n_nodes)
+            assert_array_equal(model.trees_nodes_value,
+                               full_model.trees_nodes_value[:n_nodes])
+            assert_array_equal(model.trees_left_child,
+                               full_model.trees_left_child[:n_nodes])
+
+    def test_lazy_loading(self):
+        for f, format in model_files:
+            full_model = RTEnsemble(f, format=format)
+            lazy_model = RTEnsemble(f, format=format, lazy=True)
+
+            assert_equal(lazy_model.is_lazy(), True)
+            assert_equal(lazy_model.n_trees, full_model.n_trees)
+            assert_equal(lazy_model.trees_root, None)
+
+            model = lazy_model.load_trees(1, 2)
+            root = full_model.trees_root[1]
+            assert_equal(model.is_lazy(), False)
+            assert_equal(model.n_trees, 1)
+            assert_equal(model.base_score, full_model.base_score)
+            assert_equal(model.learning_rate, full_model.learning_rate)
+            assert_array_equal(model.trees_nodes_value,
+                               full_model.trees_nodes_value[root:])
+            assert_array_equal(model.trees_nodes_feature,
+                               full_model.trees_nodes_feature[root:])
+            children = full_model.trees_left_child[root:]
+            assert_array_equal(model.trees_left_child,
+                               np.where(children > -1, children - root, -1))
+
+            model = lazy_model.load_trees()
+            assert_array_equal(model.trees_nodes_value,
+                               full_model.trees_nodes_value)
+            assert_array_equal(model.trees_right_child,
+                               full_model.trees_right_child)
+
+    def test_save_load_all_formats(self):
+        rng = np.random.RandomState(42)
+        X = rng.rand(100, 140).astype(np.float32) * 30
+        dataset = Dataset(X, rng.rand(100), np.repeat(np.arange(10), 10))
+
+        saved_model_file = os.path.join(data_dir, "tmp.saved.model")
+        for f, format in model_files:
+            model = RTEnsemble(f, format=format)
+            for save_format in ["QuickRank", "LightGBM", "XGBoost",
+                                "ScikitLearn"]:
+                try:
+                    assert_equal(model.save(saved_model_file, save_format),
+                                 True)
+                    model_reloaded = RTEnsemble(saved_model_file,
+                                                format=save_format)
+                finally:
+                    if os.path.exists(saved_model_file):
+                        os.remove(saved_model_file)
+
+                assert_equal(model_reloaded.n_trees, model.n_trees)
+                assert_equal(model_reloaded.n_nodes, model.n_nodes)
+                assert_array_almost_equal(model_reloaded.score(dataset),
+                                          model.score(dataset), decimal=5)
+
+    def test_save_deep_tree(self):
+        # a degenerate tree, deeper than the python recursion limit
+        depth = 3000
+        model = RTEnsemble(None, name="deep")
+        model.initialize(1, 2 * depth + 1)
+        model.trees_root[0] = 0
+        model.trees_weight[0] = 1
+        splits = np.arange(0, 2 * depth, 2)
+        model.trees_left_child[splits] = splits + 1
+        model.trees_right_child[splits] = splits + 2
+        model.trees_nodes_feature[splits] = 0
+        model.trees_nodes_value[splits] = -np.arange(depth)
+        model.trees_nodes_value[splits + 1] = np.arange(depth)
+        model.trees_nodes_value[-1] = depth
+
+        saved_model_file = os.path.join(data_dir, "tmp.deep.model.xml")
+        try:
+            model.save(saved_model_file, format="QuickRank")
+            model_reloaded = RTEnsemble(saved_model_file, format="QuickRank")
+        finally:
+            if os.path.exists(saved_model_file):
+                os.remove(saved_model_file)
+
+        assert_array_equal(model_reloaded.trees_nodes_value,
+                           model.trees_nodes_value)
+        assert_array_equal(model_reloaded.trees_left_child,
+                           model.trees_left_child)
+        assert_array_equal(model_reloaded.trees_right_child,
+                           model.trees_right_child)
+
+    def test_trees_index(self):
+        for f, format in model_files:
+            model = RTEnsemble(f, format=format)
+            index = model.trees_index
+            assert_equal(index is model.trees_index, True)
+
+            for idx_tree in range(model.n_trees):
+                visit = list(model._preorder_visit(idx_tree))
+                nodes = np.array([node for node, _, _ in visit])
+                leaves = np.array([node for node in nodes
+                                   if model.is_leaf_node(node)])
+                features = model.trees_nodes_feature[nodes]
+
+                assert_equal(model.trees_root[idx_tree], nodes.min())
+                assert_equal(index.trees_end[idx_tree], nodes.max() + 1)
+                assert_equal(index.n_leaves[idx_tree], leaves.size)
+                assert_equal(index.trees_depth[idx_tree],
+                             max(depth for _, depth, _ in visit))
+                assert_array_equal(index.nodes_depth[nodes],
+                                   [depth for _, depth, _ in visit])
+                assert_equal(index.leaves_min[idx_tree],
+                             model.trees_nodes_value[leaves].min())
+                assert_equal(index.leaves_max[idx_tree],
+                             model.trees_nodes_value[leaves].max())
+                assert_array_almost_equal(
+                    index.leaves_sum[idx_tree],
+                    model.trees_nodes_value[leaves].sum(), decimal=5)
+                assert_array_equal(index.features_of_tree(idx_tree),
+                                   np.unique(features[features >= 0]))
+
+            assert_equal(index.n_features,
+                         model.trees_nodes_feature.max() + 1)
+            for feature in range(index.n_features + 1):
+                trees = [idx_tree for idx_tree in range(model.n_trees)
+                         if feature in index.features_of_tree(idx_tree)]
+                assert_array_equal(index.trees_of_feature(feature), trees)
+
+            features = model.trees_nodes_feature
+            assert_array_equal(model.used_features(),
+                               np.unique(features[features >= 0]))
+
+            model._prune_model(1)
+            assert_equal(model.trees_index.trees_end, [model.n_nodes])
+
+    def test_copy_shares_trees(self):
+        rng = np.random.RandomState(42)
+        X = rng.rand(100, 140).astype(np.float32) * 30
+        dataset = Dataset(X, rng.rand(100), np.repeat(np.arange(10), 10))
+
+        model = RTEnsemble(model_file, format="QuickRank")
+        model.score(dataset, detailed=True)
+
+        model_copy = model.copy(n_trees=1)
+        assert_equal(model_copy.n_trees, 1)
+        assert_equal(len(model_copy._cache_scorer), 0)
+        assert_equal(np.may_share_memory(model_copy.trees_nodes_value,
+                                         model.trees_nodes_value), True)
+        assert_equal(model_copy.trees_nodes_value.flags.writeable, False)
+        assert_array_almost_equal(
+            model_copy.score(dataset),
+            model.score(dataset, detailed=True)[1][:, 0])
+
+        with self.assertRaises(ValueError):
+            model_copy.trees_nodes_value[0] = 0
+
+        model_copy.make_writeable()
+        value = model.trees_nodes_value[0]
+        model_copy.trees_nodes_value[0] = value + 1
+        assert_equal(model.trees_nodes_value[0], value)
+        assert_equal(model.trees_nodes_value.flags.writeable, True)
+
 if __name__ == '__main__':
     logging.basicConfig(format='%(asctime)s : %(levelname)s : %(message)s',
                         level=logging.DEBUG)
@@ -118,7 +118,8 @@ setup(
                   sources=[dataset_dir + '/_svmlight_format.cpp'],
                   include_dirs=[dataset_dir],
                   language='c++',
-                  extra_compile_args=['-O3']),
+                  extra_compile_args=['-fopenmp', '-O3'],
+                  extra_link_args=['-fopenmp'], ),
         Extension('rankeval.scoring._efficient_scoring',
                   sources=[scoring_dir + '/_efficient_scoring.pyx'],
                   include_dirs=[scoring_dir],
@@ -198,6 +199,9 @@ setup(
             'sphinx_rtd_theme >= 0.2.0',
             'numpydoc > 0.5.0',
         ],
+        'arrow': [
+            'pyarrow >= 0.15',
+        ],
     },
 
     include_package_data=True,